@@ -0,0 +1,213 @@
+"""
+In-process latency benchmark of the API endpoints, per role.
+
+    python benchmarks/bench_api.py [--transfers 100000] [--requests 30] [--output results.json]
+    python benchmarks/bench_api.py --existing --output results.json
+    python benchmarks/bench_api.py --compare baseline.json --output results.json
+
+By default a fresh test database is filled with generate_synthetic_data; with
+--existing the configured database is used as it is. The list and detail
+endpoint of every router entry, plus the function endpoints, are then called
+through the test client as an admin, a client, an operator and an end user.
+For each one the p50/p95/p99 latency, the number of queries and the peak
+memory allocated while serving it are reported. Responses are measured cold:
+the cache is cleared before every request unless --warm is given.
+
+The JSON output can be passed back with --compare to show the changes against
+a previous run; the exit status is 1 if an endpoint got slower than
+--threshold times its baseline p95 or runs more queries.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'transfer_manager.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.core.cache import cache  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test.utils import CaptureQueriesContext, setup_test_environment  # noqa: E402
+from rest_framework.test import APIClient  # noqa: E402
+
+from transfers.models import User  # noqa: E402
+from transfers.urls import router  # noqa: E402
+
+ROLES = ('Amministratore', 'Cliente', 'Operatore', 'Utilizzatore')
+FUNCTION_ENDPOINTS = ('/api/current-user/', '/api/bootstrap/', '/api/transfers/search/?q=aeroporto+fium')
+
+
+def endpoints(client):
+    """
+    Yield the URLs to measure for the user `client` is logged in as: every
+    list endpoint, then the detail of the first row it returns.
+    """
+    for prefix, viewset, _ in router.registry:
+        url = f'/api/{prefix}/'
+        yield url
+        response = client.get(url)
+        if response.status_code != 200:
+            continue
+        rows = response.data['results'] if isinstance(response.data, dict) else response.data
+        lookup_field = getattr(viewset, 'lookup_field', 'pk')
+        lookup_field = 'id' if lookup_field == 'pk' else lookup_field
+        if rows and lookup_field in rows[0]:
+            yield f'{url}{rows[0][lookup_field]}/'
+    yield from FUNCTION_ENDPOINTS
+
+
+def percentile(samples, percent):
+    return statistics.quantiles(samples, n=100, method='inclusive')[percent - 1] if len(samples) > 1 else samples[0]
+
+
+def measure(client, url, repeat, warm):
+    """
+    Time `repeat` GETs of `url`, then count the queries and the memory of one more.
+    """
+    client.get(url)
+    timings = []
+    for _ in range(repeat):
+        if not warm:
+            cache.clear()
+        started = time.perf_counter()
+        response = client.get(url)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    if not warm:
+        cache.clear()
+    tracemalloc.start()
+    with CaptureQueriesContext(connection) as queries:
+        client.get(url)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'status': response.status_code,
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+        'mean_ms': round(statistics.fmean(timings), 3),
+        'queries': len(queries),
+        'peak_kib': round(peak / 1024, 1),
+    }
+
+
+def run(repeat, warm):
+    client = APIClient()
+    results = []
+    for role in ROLES:
+        user = User.objects.filter(role=role, is_active=True).order_by('id').first()
+        if user is None:
+            print(f'No active {role} user, skipping the role.', file=sys.stderr)
+            continue
+        client.force_authenticate(user=user)
+        for url in endpoints(client):
+            result = {'role': role, 'endpoint': url, **measure(client, url, repeat, warm)}
+            results.append(result)
+            print(
+                f"{role:15} {url:40} p50={result['p50_ms']:8.2f}ms p95={result['p95_ms']:8.2f}ms "
+                f"p99={result['p99_ms']:8.2f}ms queries={result['queries']:3} peak={result['peak_kib']:9.1f}KiB",
+                file=sys.stderr,
+            )
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Print the changes against `baseline` and return True if anything regressed.
+    """
+    before = {(row['role'], row['endpoint']): row for row in baseline['results']}
+    regressed = False
+    for row in results:
+        old = before.get((row['role'], row['endpoint']))
+        if old is None:
+            continue
+        slower = row['p95_ms'] > old['p95_ms'] * threshold
+        more_queries = row['queries'] > old['queries']
+        regressed = regressed or slower or more_queries
+        flag = 'REGRESSION' if slower or more_queries else ''
+        print(
+            f"{row['role']:15} {row['endpoint']:40} p95 {old['p95_ms']:8.2f} -> {row['p95_ms']:8.2f}ms "
+            f"queries {old['queries']:3} -> {row['queries']:3} {flag}",
+            file=sys.stderr,
+        )
+    return regressed
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--existing', action='store_true', help='Use the configured database instead of a generated one.')
+    parser.add_argument('--clients', type=int, default=100)
+    parser.add_argument('--transfers', type=int, default=100000)
+    parser.add_argument('--service-requests', type=int, default=20000)
+    parser.add_argument('--requests', type=int, default=30, help='Timed requests per endpoint and role.')
+    parser.add_argument('--warm', action='store_true', help='Keep the caches between requests.')
+    parser.add_argument('--output', help='Write the results as JSON to this file instead of stdout.')
+    parser.add_argument('--compare', help='JSON results of a previous run to compare against.')
+    parser.add_argument('--threshold', type=float, default=1.2, help='Allowed p95 slowdown factor with --compare.')
+    args = parser.parse_args()
+
+    setup_test_environment()
+    # 403s of endpoints a role can't use are expected, don't log each one
+    logging.getLogger('django.request').setLevel(logging.ERROR)
+    old_name = None
+    if not args.existing:
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        call_command(
+            'generate_synthetic_data', clients=args.clients, transfers=args.transfers,
+            requests=args.service_requests, prefix='bench', verbosity=0,
+        )
+    try:
+        results = run(args.requests, args.warm)
+    finally:
+        if old_name is not None:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'dataset': 'existing' if args.existing else {
+                'clients': args.clients, 'transfers': args.transfers, 'service_requests': args.service_requests,
+            },
+            'requests': args.requests,
+            'warm': args.warm,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as stream:
+            json.dump(report, stream, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+    if args.compare:
+        with open(args.compare) as stream:
+            if compare(results, json.load(stream), args.threshold):
+                sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""
+Concurrent write throughput of the database modes.
+
+    python benchmarks/bench_db_concurrency.py [--workers 8] [--writes 200] [--postgres]
+
+Each mode runs in its own interpreter, with the DB_* environment variables
+read by the settings, against a fresh database (a temporary SQLite file, or a
+test database next to the configured PostgreSQL one). Worker processes then
+act like operators closing services at the same time: every write creates a
+transfer and completes it, so all of them also update the same daily rollup
+row. Writes that fail, e.g. with "database is locked", are counted, not
+retried.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from decimal import Decimal
+from pathlib import Path
+
+MODES = {
+    'sqlite-default': {'DB_ENGINE': 'sqlite', 'DB_SQLITE_TUNED': '0'},
+    'sqlite-tuned': {'DB_ENGINE': 'sqlite', 'DB_SQLITE_TUNED': '1'},
+    'postgresql': {'DB_ENGINE': 'postgresql', 'DB_POOL': '0'},
+    'postgresql-pool': {'DB_ENGINE': 'postgresql', 'DB_POOL': '1'},
+}
+
+
+def setup_django():
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'transfer_manager.settings')
+    import django
+
+    django.setup()
+
+
+def write_many(args):
+    """
+    Run `writes` create-and-complete cycles; returns (ok, failed, latencies).
+    """
+    worker, writes, client_id, vehicle_id = args
+    from django.db import DatabaseError, connection
+    from django.utils import timezone
+    from transfers.models import Transfer
+
+    ok = failed = 0
+    latencies = []
+    for i in range(writes):
+        started = time.perf_counter()
+        try:
+            transfer = Transfer.objects.create(
+                client_id=client_id,
+                vehicle_id=vehicle_id,
+                service_type='Disposizione Oraria',
+                scheduled_duration_hours=Decimal('1.0'),
+                start_location=f'W{worker}',
+                end_location=f'N{i}',
+                scheduled_start_time=timezone.now(),
+            )
+            transfer.status = 'Completato'
+            transfer.actual_end_time = timezone.now()
+            transfer.save()
+            ok += 1
+        except DatabaseError:
+            failed += 1
+        latencies.append(time.perf_counter() - started)
+    connection.close()
+    return ok, failed, latencies
+
+
+def run_child(workers, writes):
+    setup_django()
+    from django.core.management import call_command
+    from django.db import connection, connections
+    from transfers.models import PriceList, User, Vehicle
+
+    test_name = None
+    if connection.vendor == 'postgresql':
+        old_name = connection.settings_dict['NAME']
+        test_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    else:
+        call_command('migrate', verbosity=0)
+
+    try:
+        client = User.objects.create_user(username='bench-client', password='x', role='Cliente')
+        vehicle = Vehicle.objects.create(service_class='Auto', license_plate='BENCH-1', capacity=4)
+        PriceList.objects.create(service_class='Auto', service_type='Disposizione Oraria', price_per_hour=Decimal('50.00'), operator_rate=Decimal('20.00'))
+        # Every worker opens its own connection after the fork
+        connections.close_all()
+
+        context = multiprocessing.get_context('fork')
+        started = time.perf_counter()
+        with context.Pool(workers) as pool:
+            results = pool.map(write_many, [(worker, writes, client.pk, vehicle.pk) for worker in range(workers)])
+        elapsed = time.perf_counter() - started
+    finally:
+        if test_name is not None:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    latencies = sorted(latency for _, _, worker_latencies in results for latency in worker_latencies)
+    ok = sum(result[0] for result in results)
+    print(json.dumps({
+        'ok': ok,
+        'failed': sum(result[1] for result in results),
+        'seconds': elapsed,
+        'writes_per_second': ok / elapsed,
+        'p95_ms': latencies[int(len(latencies) * 0.95) - 1] * 1000 if latencies else None,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--writes', type=int, default=200, help='Writes per worker')
+    parser.add_argument('--postgres', action='store_true', help='Also run the PostgreSQL modes, using the DB_* connection variables')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.workers, args.writes)
+        return
+
+    modes = [mode for mode in MODES if args.postgres or not mode.startswith('postgresql')]
+    print(f'workers={args.workers} writes/worker={args.writes}')
+    for mode in modes:
+        with tempfile.TemporaryDirectory() as directory:
+            env = dict(os.environ, DB_SQLITE_PATH=os.path.join(directory, 'bench.sqlite3'), **MODES[mode])
+            completed = subprocess.run(
+                [sys.executable, __file__, '--child', '--workers', str(args.workers), '--writes', str(args.writes)],
+                env=env, capture_output=True, text=True,
+            )
+        if completed.returncode:
+            print(f'{mode:16} error: {completed.stderr.strip().splitlines()[-1]}')
+            continue
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        print(
+            f"{mode:16} {result['writes_per_second']:8.1f} writes/s  "
+            f"p95={result['p95_ms']:.1f}ms  failed={result['failed']}  ({result['seconds']:.2f}s)"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Benchmark of the dispatch solver on synthetic data.
+
+    python benchmarks/bench_dispatch.py [--transfers 10000] [--seed 1]
+
+Generates a day of transfers with random start times, durations, classes and
+group sizes, a mixed fleet and a pool of operators with some bookings made
+before the run, then times transfers.dispatch.solve().
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'transfer_manager.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from transfers.dispatch import Job, VehicleSpec, solve  # noqa: E402
+
+HOUR = 3600
+FLEET = (('Auto', 4, 0.5), ('Van', 8, 0.3), ('Minibus', 19, 0.15), ('Bus', 50, 0.05))
+
+
+def generate(transfers, rng):
+    jobs = []
+    for job_id in range(transfers):
+        start = rng.uniform(5, 23) * HOUR
+        end = start + rng.choice((0.75, 1, 1.5, 2, 4, 8)) * HOUR
+        service_class = rng.choice(('', '', '', 'Auto', 'Van', 'Minibus'))
+        passengers = rng.choice((1, 1, 2, 3, 4, 6, 8, 15))
+        jobs.append(Job(job_id, start, end, service_class, passengers, None, None))
+
+    # Roughly one vehicle and one operator every 6 transfers
+    vehicles = []
+    for vehicle_id in range(transfers // 6):
+        service_class, capacity, _ = rng.choices(FLEET, weights=[share for _, _, share in FLEET])[0]
+        vehicles.append(VehicleSpec(vehicle_id, service_class, capacity))
+    operator_ids = list(range(transfers // 6))
+
+    bookings = {}
+    for booking_id in range(transfers, transfers + transfers // 10):
+        start = rng.uniform(0, 24) * HOUR
+        resource = ('vehicle', rng.randrange(len(vehicles))) if rng.random() < 0.5 else ('operator', rng.choice(operator_ids))
+        bookings.setdefault(resource, []).append((start, start + HOUR, booking_id))
+    return jobs, vehicles, operator_ids, bookings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--transfers', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    jobs, vehicles, operator_ids, bookings = generate(args.transfers, random.Random(args.seed))
+    timings = []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        result = solve(jobs, vehicles, operator_ids, bookings)
+        timings.append(time.perf_counter() - started)
+
+    with_vehicle = sum(1 for vehicle_id, _ in result.values() if vehicle_id is not None)
+    complete = sum(1 for vehicle_id, operator_id in result.values() if vehicle_id is not None and operator_id is not None)
+    print(f'transfers={len(jobs)} vehicles={len(vehicles)} operators={len(operator_ids)}')
+    print(f'with_vehicle={with_vehicle} fully_assigned={complete}')
+    print(f'best={min(timings):.3f}s worst={max(timings):.3f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,29 @@
 import React, { useState, useEffect } from 'react';
 import api from '../services/api';
 
-const AssignedTransfersList = () => {
+const AssignedTransfersList = ({ initialData }) => {
   const [transfers, setTransfers] = useState([]);
+  // Link to the next page of the cursor-paginated list, null on the last one
+  const [next, setNext] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
 
   useEffect(() => {
+    if (initialData) {
+      // Already loaded by the bootstrap request
+      setTransfers(initialData.results);
+      setNext(initialData.next);
+      setLoading(false);
+      return;
+    }
+
     const fetchTransfers = async () => {
       try {
         const response = await api.get('/transfers/');
-        setTransfers(response.data);
+        // The transfers endpoint is cursor-paginated
+        setTransfers(response.data.results);
+        setNext(response.data.next);
       } catch (err) {
         setError('Failed to fetch assigned transfers.');
         console.error(err);
@@ -20,8 +33,65 @@ const AssignedTransfersList = () => {
     };
 
     fetchTransfers();
+  }, [initialData]);
+
+  // Keep the statuses up to date with the server's change events instead of polling
+  useEffect(() => {
+    let source = null;
+    let retry = null;
+    let closed = false;
+
+    // The stream is opened with a single-use ticket, so the API token never ends up in a URL.
+    // A ticket can't be reused on reconnect: every connection asks for a new one.
+    const connect = async () => {
+      try {
+        const response = await api.post('/transfers/events/ticket/');
+        if (closed) return;
+        source = new EventSource(`${api.defaults.baseURL}transfers/events/?ticket=${response.data.ticket}`);
+      } catch (err) {
+        if (!closed) retry = setTimeout(connect, 5000);
+        return;
+      }
+      source.onmessage = async (message) => {
+        const event = JSON.parse(message.data);
+        if (event.event === 'transfer.updated') {
+          setTransfers((current) => current.map((transfer) => (
+            transfer.id === event.id ? { ...transfer, status: event.status } : transfer
+          )));
+        } else if (event.event === 'transfer.created' || event.event === 'transfer.deleted' || event.event === 'resync') {
+          const response = await api.get('/transfers/');
+          setTransfers(response.data.results);
+          setNext(response.data.next);
+        }
+      };
+      source.onerror = () => {
+        source.close();
+        if (!closed) retry = setTimeout(connect, 5000);
+      };
+    };
+
+    connect();
+    return () => {
+      closed = true;
+      clearTimeout(retry);
+      if (source) source.close();
+    };
   }, []);
 
+  const loadMore = async () => {
+    setLoadingMore(true);
+    try {
+      const response = await api.get(next);
+      setTransfers((current) => [...current, ...response.data.results]);
+      setNext(response.data.next);
+    } catch (err) {
+      setError('Failed to fetch assigned transfers.');
+      console.error(err);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   if (loading) {
     return <p>Loading your assigned transfers...</p>;
   }
@@ -66,6 +136,11 @@ const AssignedTransfersList = () => {
           </tbody>
         </table>
       )}
+      {next && (
+        <button onClick={loadMore} disabled={loadingMore}>
+          {loadingMore ? 'Loading...' : 'Load more'}
+        </button>
+      )}
     </div>
   );
 };
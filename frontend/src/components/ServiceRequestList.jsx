@@ -1,16 +1,28 @@
 import React, { useState, useEffect } from 'react';
 import api from '../services/api';
 
-const ServiceRequestList = () => {
+const ServiceRequestList = ({ initialData }) => {
   const [requests, setRequests] = useState([]);
+  // Link to the next page of the cursor-paginated list, null on the last one
+  const [next, setNext] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
 
   useEffect(() => {
+    if (initialData) {
+      // Already loaded by the bootstrap request
+      setRequests(initialData.results);
+      setNext(initialData.next);
+      setLoading(false);
+      return;
+    }
+
     const fetchRequests = async () => {
       try {
         const response = await api.get('/requests/');
-        setRequests(response.data);
+        setRequests(response.data.results);
+        setNext(response.data.next);
       } catch (err) {
         setError('Failed to fetch service requests.');
         console.error(err);
@@ -20,7 +32,21 @@ const ServiceRequestList = () => {
     };
 
     fetchRequests();
-  }, []);
+  }, [initialData]);
+
+  const loadMore = async () => {
+    setLoadingMore(true);
+    try {
+      const response = await api.get(next);
+      setRequests((current) => [...current, ...response.data.results]);
+      setNext(response.data.next);
+    } catch (err) {
+      setError('Failed to fetch service requests.');
+      console.error(err);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
 
   if (loading) {
     return <p>Loading your requests...</p>;
@@ -59,6 +85,11 @@ const ServiceRequestList = () => {
           </tbody>
         </table>
       )}
+      {next && (
+        <button onClick={loadMore} disabled={loadingMore}>
+          {loadingMore ? 'Loading...' : 'Load more'}
+        </button>
+      )}
     </div>
   );
 };
@@ -1,16 +1,28 @@
 import React, { useState, useEffect } from 'react';
 import api from '../services/api';
 
-const VehicleList = () => {
+const VehicleList = ({ initialData }) => {
   const [vehicles, setVehicles] = useState([]);
+  // Link to the next page of the cursor-paginated list, null on the last one
+  const [next, setNext] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
 
   useEffect(() => {
+    if (initialData) {
+      // Already loaded by the bootstrap request
+      setVehicles(initialData.results);
+      setNext(initialData.next);
+      setLoading(false);
+      return;
+    }
+
     const fetchVehicles = async () => {
       try {
         const response = await api.get('/vehicles/');
-        setVehicles(response.data);
+        setVehicles(response.data.results);
+        setNext(response.data.next);
       } catch (err) {
         setError('Failed to fetch vehicles. You may not have permission.');
         console.error(err);
@@ -20,7 +32,21 @@ const VehicleList = () => {
     };
 
     fetchVehicles();
-  }, []);
+  }, [initialData]);
+
+  const loadMore = async () => {
+    setLoadingMore(true);
+    try {
+      const response = await api.get(next);
+      setVehicles((current) => [...current, ...response.data.results]);
+      setNext(response.data.next);
+    } catch (err) {
+      setError('Failed to fetch vehicles. You may not have permission.');
+      console.error(err);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
 
   if (loading) {
     return <p>Loading vehicles...</p>;
@@ -57,6 +83,11 @@ const VehicleList = () => {
           </tbody>
         </table>
       )}
+      {next && (
+        <button onClick={loadMore} disabled={loadingMore}>
+          {loadingMore ? 'Loading...' : 'Load more'}
+        </button>
+      )}
     </div>
   );
 };
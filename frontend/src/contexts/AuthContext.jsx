@@ -6,13 +6,17 @@ const AuthContext = createContext(null);
 
 export const AuthProvider = ({ children }) => {
   const [user, setUser] = useState(null);
+  // First pages of the dashboard lists, loaded together with the user
+  const [bootstrap, setBootstrap] = useState({});
   const [token, setToken] = useState(localStorage.getItem('authToken'));
   const [loading, setLoading] = useState(true);
 
   const fetchUser = async () => {
     try {
-      const response = await api.get('/current-user/');
-      setUser(response.data);
+      const { data } = await api.get('/bootstrap/');
+      const { user: currentUser, ...lists } = data;
+      setBootstrap(lists);
+      setUser(currentUser);
     } catch (error) {
       console.error('Failed to fetch user', error);
       // If fetching user fails, the token is likely invalid, so log out
@@ -55,9 +59,14 @@ export const AuthProvider = ({ children }) => {
   };
 
   const logout = () => {
+    if (api.defaults.headers.common['Authorization']) {
+      // Revoke the token on the server too; the local cleanup doesn't wait for it
+      api.post('/logout/').catch(() => {});
+    }
     localStorage.removeItem('authToken');
     setToken(null);
     setUser(null);
+    setBootstrap({});
     delete api.defaults.headers.common['Authorization'];
     // No need for navigate here, the protected route will handle it.
   };
@@ -66,6 +75,7 @@ export const AuthProvider = ({ children }) => {
     user,
     login,
     logout,
+    bootstrap,
     isAuthenticated: !!user,
     loading,
   };
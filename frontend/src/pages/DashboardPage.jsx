@@ -7,7 +7,7 @@ import ServiceRequestForm from '../components/ServiceRequestForm';
 import AssignedTransfersList from '../components/AssignedTransfersList'; // Import operator's list
 
 const DashboardPage = () => {
-  const { user, logout } = useAuth();
+  const { user, logout, bootstrap } = useAuth();
   const [vehicleListKey, setVehicleListKey] = useState(0);
   const [requestListKey, setRequestListKey] = useState(0);
 
@@ -19,6 +19,10 @@ const DashboardPage = () => {
     setRequestListKey(prevKey => prevKey + 1);
   };
 
+  // Bootstrapped lists are only used until the list is reloaded after a change
+  const initialVehicles = vehicleListKey === 0 ? bootstrap.vehicles : undefined;
+  const initialRequests = requestListKey === 0 ? bootstrap.requests : undefined;
+
   const renderRoleSpecificDashboard = () => {
     if (!user) return <p>Loading...</p>;
 
@@ -29,7 +33,7 @@ const DashboardPage = () => {
             <h2>Admin Dashboard</h2>
             <p>You have full access to the system.</p>
             <CreateVehicleForm onVehicleCreated={handleVehicleCreated} />
-            <VehicleList key={vehicleListKey} />
+            <VehicleList key={vehicleListKey} initialData={initialVehicles} />
           </div>
         );
       case 'Cliente':
@@ -38,7 +42,7 @@ const DashboardPage = () => {
             <h2>Client Dashboard</h2>
             <p>Here you can manage your transfers and requests.</p>
             <ServiceRequestForm onServiceRequestCreated={handleServiceRequestCreated} />
-            <ServiceRequestList key={requestListKey} />
+            <ServiceRequestList key={requestListKey} initialData={initialRequests} />
           </div>
         );
       case 'Operatore':
@@ -46,7 +50,7 @@ const DashboardPage = () => {
           <div>
             <h2>Operator Dashboard</h2>
             <p>Here you can view and manage your assigned services.</p>
-            <AssignedTransfersList />
+            <AssignedTransfersList initialData={bootstrap.transfers} />
           </div>
         );
       case 'Utilizzatore':
@@ -55,7 +59,7 @@ const DashboardPage = () => {
             <h2>User Dashboard</h2>
             <p>Here you can request new services.</p>
             <ServiceRequestForm onServiceRequestCreated={handleServiceRequestCreated} />
-            <ServiceRequestList key={requestListKey} />
+            <ServiceRequestList key={requestListKey} initialData={initialRequests} />
           </div>
         );
       default:
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -43,10 +44,12 @@ INSTALLED_APPS = [
 
     # 3rd party
     'rest_framework',
+    'rest_framework.authtoken',
     'corsheaders',
 ]
 
 MIDDLEWARE = [
+    "transfers.middleware.RequestTimingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     'corsheaders.middleware.CorsMiddleware',
@@ -80,13 +83,111 @@ WSGI_APPLICATION = "transfer_manager.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
+# Chosen with DB_ENGINE: "sqlite" (default, single-node installs) or "postgresql".
+
+DB_ENGINE = os.environ.get("DB_ENGINE", "sqlite")
+
+if DB_ENGINE == "postgresql":
+    # Needs psycopg (`pip install "psycopg[binary,pool]"`). Connections are
+    # kept open for DB_CONN_MAX_AGE seconds and checked before reuse; with
+    # DB_POOL=1 a psycopg connection pool is used instead, which Django
+    # requires to run without persistent connections.
+    DB_POOL = os.environ.get("DB_POOL", "0") == "1"
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.environ.get("DB_NAME", "transfer_manager"),
+            "USER": os.environ.get("DB_USER", ""),
+            "PASSWORD": os.environ.get("DB_PASSWORD", ""),
+            "HOST": os.environ.get("DB_HOST", ""),
+            "PORT": os.environ.get("DB_PORT", ""),
+            "CONN_MAX_AGE": 0 if DB_POOL else int(os.environ.get("DB_CONN_MAX_AGE", "60")),
+            "CONN_HEALTH_CHECKS": True,
+            "OPTIONS": {
+                "pool": {
+                    "min_size": int(os.environ.get("DB_POOL_MIN_SIZE", "2")),
+                    "max_size": int(os.environ.get("DB_POOL_MAX_SIZE", "10")),
+                },
+            } if DB_POOL else {},
+        }
+    }
+elif DB_ENGINE == "sqlite":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.environ.get("DB_SQLITE_PATH", BASE_DIR / "db.sqlite3"),
+        }
+    }
+    if os.environ.get("DB_SQLITE_TUNED", "1") == "1":
+        # WAL lets readers run alongside the writer, synchronous=NORMAL is
+        # safe with WAL and avoids an fsync per commit, and IMMEDIATE
+        # transactions take the write lock up front so concurrent writers
+        # wait for the busy timeout instead of failing with "database is locked".
+        DATABASES["default"]["OPTIONS"] = {
+            "timeout": int(os.environ.get("DB_SQLITE_BUSY_TIMEOUT", "20")),
+            "transaction_mode": "IMMEDIATE",
+            "init_command": (
+                "PRAGMA journal_mode=WAL;"
+                "PRAGMA synchronous=NORMAL;"
+                f"PRAGMA mmap_size={int(os.environ.get('DB_SQLITE_MMAP_SIZE', 256 * 1024 * 1024))};"
+            ),
+        }
+else:
+    raise ValueError(f"Unsupported DB_ENGINE {DB_ENGINE!r}, use sqlite or postgresql")
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Holds the version stamps and cached responses. The local-memory cache is
+# per process: with several workers, use a shared backend (Redis, Memcached)
+# so a change made through one worker is seen by all of them.
+
+CACHES = {
     "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
     }
 }
 
+# Seconds a cached Vehicle/PriceList response is kept; writes invalidate it earlier
+RESPONSE_CACHE_TIMEOUT = 3600
+
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'transfers.authentication.CachedTokenAuthentication',
+        'rest_framework.authentication.SessionAuthentication',
+    ],
+}
+
+# Seconds a resolved API token is kept in the cache; logout and password changes drop it at once
+AUTH_TOKEN_CACHE_TIMEOUT = 300
+# Transfer change events pushed by /api/transfers/events/. The in-process broker
+# reaches the subscribers of one process; with several, use
+# "transfers.events.RedisBroker" and set EVENTS_REDIS_URL.
+EVENTS_BROKER = os.environ.get("EVENTS_BROKER", "transfers.events.InProcessBroker")
+EVENTS_REDIS_URL = os.environ.get("EVENTS_REDIS_URL", "redis://localhost:6379/0")
+# Events queued per subscriber before it is told to resync instead
+EVENTS_QUEUE_SIZE = 100
+EVENTS_KEEPALIVE_SECONDS = 15
+# Seconds a single-use stream ticket stays valid, so API tokens never go in a URL
+EVENTS_TICKET_SECONDS = 60
+
+# Days deleted rows are remembered for delta sync; older watermarks must resync from scratch
+SYNC_TOMBSTONE_RETENTION_DAYS = 30
+# Delta sync only serves changes at least this old (seconds): updated_at is stamped
+# before commit, so a newer change may still be invisible in an open transaction
+SYNC_SAFETY_LAG_SECONDS = 5
+
+# Statements at least this slow (ms) are kept in the slow-query log with their EXPLAIN plan; None turns it off
+SLOW_QUERY_THRESHOLD_MS = 200
+# Entries kept by the slow-query log, oldest overwritten first
+SLOW_QUERY_LOG_SIZE = 200
+
+# Bearer token Prometheus sends to scrape /metrics; without it only staff sessions may read it
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
+# Age after which an API token is refused and a new login is needed (None: never)
+AUTH_TOKEN_EXPIRE_SECONDS = 60 * 60 * 24 * 30
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
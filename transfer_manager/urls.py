@@ -17,11 +17,14 @@ Including another URLconf
 
 from django.contrib import admin
 from django.urls import path, include
-from rest_framework.authtoken import views
+from transfers.admin import slow_queries_view
+from transfers.views import ObtainExpiringAuthToken, metrics_view
 
 urlpatterns = [
+    path("admin/slow-queries/", slow_queries_view, name='slow-queries'),
     path("admin/", admin.site.urls),
     path('api/', include('transfers.urls')),
     path('api-auth/', include('rest_framework.urls', namespace='rest_framework')),
-    path('api/api-token-auth/', views.obtain_auth_token)
+    path('api/api-token-auth/', ObtainExpiringAuthToken.as_view()),
+    path('metrics', metrics_view),
 ]
@@ -1,6 +1,10 @@
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.admin import UserAdmin
-from .models import User, Vehicle, PriceList, Transfer, ServiceRequest, DailyReport
+from django.template.response import TemplateResponse
+from . import slowlog
+from .models import User, Vehicle, PriceList, Transfer, ServiceRequest, DailyReport, EmailOutbox, GeocodeCache, Tombstone
 
 # We need to use a custom admin class for our custom user model
 class CustomUserAdmin(UserAdmin):
@@ -21,3 +25,20 @@ admin.site.register(PriceList)
 admin.site.register(Transfer)
 admin.site.register(ServiceRequest)
 admin.site.register(DailyReport)
+admin.site.register(EmailOutbox)
+admin.site.register(GeocodeCache)
+admin.site.register(Tombstone)
+
+
+@staff_member_required
+def slow_queries_view(request):
+    """
+    Admin page listing the statements of the slow-query log by total time.
+    """
+    context = {
+        **admin.site.each_context(request),
+        'title': 'Query lente',
+        'offenders': slowlog.top_offenders(50),
+        'threshold': settings.SLOW_QUERY_THRESHOLD_MS,
+    }
+    return TemplateResponse(request, 'admin/transfers/slow_queries.html', context)
@@ -0,0 +1,74 @@
+"""
+Dual approval of service requests, as conditional UPDATEs.
+
+A request needs the approval of an admin and of the client its requester is
+associated with. Each party flips its own flag with a single UPDATE that also
+derives status='Approvato' from the other flag as the database sees it, so
+concurrent approvals can't overwrite each other and no other column is
+written. The same statements serve one request or thousands.
+
+UPDATEs skip the model signals, so the request version scopes are bumped here.
+"""
+from django.db import transaction
+from django.db.models import Case, Value, When
+from django.utils import timezone
+
+from . import versions
+from .models import ServiceRequest
+
+# Requests per bulk call
+MAX_BATCH = 1000
+
+
+def decidable(user):
+    """
+    The service requests `user` may approve or reject, or None if the role can't.
+    """
+    if user.role == 'Amministratore':
+        return ServiceRequest.objects.all()
+    elif user.role == 'Cliente':
+        return ServiceRequest.objects.filter(requester__associated_client=user)
+    return None
+
+
+def _apply(requests, changes):
+    """
+    Run `changes` on `requests` and return the ids of the rows updated.
+    """
+    with transaction.atomic():
+        # Locked, so the UPDATE below changes exactly these rows
+        rows = dict(requests.select_for_update(of=('self',)).values_list('pk', 'requester_id'))
+        if rows:
+            # The UPDATE carries the conditions too, it doesn't rely on the lock to be correct
+            requests.filter(pk__in=rows).update(updated_at=timezone.now(), **changes)
+            versions.bump(versions.request_scopes(rows.values()))
+    return sorted(rows)
+
+
+def approve(user, ids):
+    """
+    Record the approval of `user` on the pending requests `ids` it may decide.
+    Returns the ids updated, or None if the role can't approve.
+    """
+    requests = decidable(user)
+    if requests is None:
+        return None
+    if user.role == 'Amministratore':
+        flag, other = 'admin_approved', 'client_approved'
+    else:
+        flag, other = 'client_approved', 'admin_approved'
+    return _apply(requests.filter(pk__in=ids, status='In Attesa'), {
+        flag: True,
+        'status': Case(When(**{other: True}, then=Value('Approvato')), default=Value('In Attesa')),
+    })
+
+
+def reject(user, ids):
+    """
+    Reject the pending requests `ids` that `user` may decide.
+    Returns the ids updated, or None if the role can't reject.
+    """
+    requests = decidable(user)
+    if requests is None:
+        return None
+    return _apply(requests.filter(pk__in=ids, status='In Attesa'), {'status': 'Rifiutato'})
@@ -0,0 +1,83 @@
+"""
+Token authentication with a cached token -> user lookup.
+
+DRF's TokenAuthentication reads the token and its user from the database on
+every request. Here the resolved user is kept in Django's cache for
+AUTH_TOKEN_CACHE_TIMEOUT seconds. Deleting a token (logout) or saving its
+user (password or role change, deactivation) drops the cached entry right
+away, and tokens older than AUTH_TOKEN_EXPIRE_SECONDS are refused and
+deleted.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+CACHE_TIMEOUT = getattr(settings, 'AUTH_TOKEN_CACHE_TIMEOUT', 300)
+EXPIRE_SECONDS = getattr(settings, 'AUTH_TOKEN_EXPIRE_SECONDS', None)
+
+
+def _token_cache_key(key):
+    return f'transfers:auth:token:{key}'
+
+
+def _user_cache_key(user_id):
+    return f'transfers:auth:user:{user_id}'
+
+
+def token_expires_at(token):
+    if EXPIRE_SECONDS is None:
+        return None
+    return token.created + timedelta(seconds=EXPIRE_SECONDS)
+
+
+def is_expired(token):
+    expires_at = token_expires_at(token)
+    return expires_at is not None and expires_at <= timezone.now()
+
+
+def forget_token(key):
+    cache.delete(_token_cache_key(key))
+
+
+def forget_user(user_id):
+    """
+    Drop the cached token entry of a user, so their next request re-reads
+    the token and user from the database.
+    """
+    key = cache.get(_user_cache_key(user_id))
+    if key is not None:
+        cache.delete_many([_token_cache_key(key), _user_cache_key(user_id)])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        cached = cache.get(_token_cache_key(key))
+        if cached is not None:
+            token, expires_at = cached
+            if expires_at is None or expires_at > timezone.now():
+                return token.user, token
+
+        try:
+            token = Token.objects.select_related('user').get(key=key)
+        except Token.DoesNotExist:
+            raise exceptions.AuthenticationFailed('Invalid token.')
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+        if is_expired(token):
+            token.delete()
+            raise exceptions.AuthenticationFailed('Token has expired.')
+
+        expires_at = token_expires_at(token)
+        timeout = CACHE_TIMEOUT
+        if expires_at is not None:
+            timeout = min(timeout, max(int((expires_at - timezone.now()).total_seconds()), 1))
+        cache.set_many({
+            _token_cache_key(key): (token, expires_at),
+            _user_cache_key(token.user_id): key,
+        }, timeout)
+        return token.user, token
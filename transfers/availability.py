@@ -0,0 +1,259 @@
+"""
+Double-booking detection for vehicles and operators.
+
+Each worker keeps an interval index per vehicle and per operator, built from
+the scheduled start time and duration of their active transfers. Bookings
+are kept in a treap (a randomly balanced search tree) ordered by start, each
+node also holding the latest end of its subtree: adding or removing a
+booking costs O(log n), and "is this resource free in [start, end)?" only
+descends into subtrees that can hold a conflict, O(log n + k) for k conflicts.
+
+Like the pricing rate table, each index carries a version stamp shared
+through Django's cache: when a transfer's assignment or schedule changes the
+stamps of the affected resources are bumped, and every worker rebuilds those
+indexes with one query on their next lookup.
+"""
+import random
+import threading
+import uuid
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+# Duration assumed for transfers without a scheduled duration (A-B transfers)
+DEFAULT_DURATION = timedelta(hours=getattr(settings, 'AVAILABILITY_DEFAULT_DURATION_HOURS', 1))
+
+# Transfers in these states don't occupy their vehicle or operator
+INACTIVE_STATUSES = ('Annullato', 'Completato')
+
+RESOURCE_FIELDS = {
+    'vehicle': 'vehicle_id',
+    'operator': 'operator_id',
+}
+
+# Transfer fields that decide which intervals a transfer occupies
+TRACKED_FIELDS = ('vehicle_id', 'operator_id', 'scheduled_start_time', 'scheduled_duration_hours', 'status')
+
+
+def interval(start, duration_hours):
+    """
+    Return the [start, end) interval of a transfer.
+    """
+    duration = timedelta(hours=float(duration_hours)) if duration_hours else DEFAULT_DURATION
+    return start, start + duration
+
+
+class _Node:
+    __slots__ = ('key', 'priority', 'left', 'right', 'max_end')
+
+    def __init__(self, key):
+        self.key = key  # (start, end, transfer id)
+        self.priority = random.random()
+        self.left = self.right = None
+        self.max_end = key[1]  # Latest end in this subtree
+
+    def update(self):
+        self.max_end = self.key[1]
+        for child in (self.left, self.right):
+            if child is not None and child.max_end > self.max_end:
+                self.max_end = child.max_end
+
+
+def _split(node, key, inclusive=False):
+    """
+    Split a subtree into the nodes before `key` (up to it if `inclusive`) and the rest.
+    """
+    if node is None:
+        return None, None
+    if node.key < key or (inclusive and node.key == key):
+        node.right, rest = _split(node.right, key, inclusive)
+        node.update()
+        return node, rest
+    before, node.left = _split(node.left, key, inclusive)
+    node.update()
+    return before, node
+
+
+def _merge(before, after):
+    """
+    Join two subtrees, every key of `before` sorting before those of `after`.
+    """
+    if before is None or after is None:
+        return before or after
+    if before.priority > after.priority:
+        before.right = _merge(before.right, after)
+        before.update()
+        return before
+    after.left = _merge(before, after.left)
+    after.update()
+    return after
+
+
+class IntervalIndex:
+    """
+    Bookings of one resource, ordered by start.
+    """
+    def __init__(self, bookings=()):
+        # Build the treap of the sorted bookings in linear time: each node
+        # adopts as left child the right spine nodes of lower priority
+        spine = []
+        self._size = 0
+        for key in sorted(bookings):
+            node = _Node(key)
+            while spine and spine[-1].priority < node.priority:
+                node.left = spine.pop()
+                node.left.update()
+            if spine:
+                spine[-1].right = node
+            spine.append(node)
+            self._size += 1
+        self._root = spine[0] if spine else None
+        while spine:
+            spine.pop().update()
+
+    def add(self, start, end, transfer_id):
+        key = (start, end, transfer_id)
+        before, after = _split(self._root, key)
+        self._root = _merge(_merge(before, _Node(key)), after)
+        self._size += 1
+
+    def remove(self, start, end, transfer_id):
+        key = (start, end, transfer_id)
+        before, rest = _split(self._root, key)
+        found, after = _split(rest, key, inclusive=True)
+        if found is not None:
+            # Drop one copy of the booking
+            found = _merge(found.left, found.right)
+            self._size -= 1
+        self._root = _merge(_merge(before, found), after)
+
+    def conflicts(self, start, end, exclude=None):
+        """
+        Return the ids of the transfers overlapping [start, end), by start.
+        """
+        found = []
+        stack = []
+        node = self._root
+        # In-order walk skipping the subtrees that all end by `start`
+        while True:
+            while node is not None and node.max_end > start:
+                stack.append(node)
+                node = node.left
+            if not stack:
+                return found
+            node = stack.pop()
+            booking_start, booking_end, transfer_id = node.key
+            if booking_start >= end:
+                # Every later booking starts after [start, end) too
+                return found
+            if booking_end > start and transfer_id != exclude:
+                found.append(transfer_id)
+            node = node.right
+
+    def __len__(self):
+        return self._size
+
+
+class AvailabilityIndex:
+    """
+    Lazily built interval indexes of every vehicle and operator.
+    """
+    def __init__(self):
+        self._indexes = {}  # (resource, id) -> (version, IntervalIndex)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _cache_key(resource, resource_id):
+        return f'transfers:availability:{resource}:{resource_id}'
+
+    def _shared_version(self, resource, resource_id):
+        key = self._cache_key(resource, resource_id)
+        version = cache.get(key)
+        if version is None:
+            cache.add(key, uuid.uuid4().hex, None)
+            version = cache.get(key)
+        return version
+
+    def get(self, resource, resource_id):
+        version = self._shared_version(resource, resource_id)
+        with self._lock:
+            cached = self._indexes.get((resource, resource_id))
+        if cached is not None and version is not None and cached[0] == version:
+            return cached[1]
+
+        Transfer = apps.get_model('transfers', 'Transfer')
+        bookings = (
+            interval(start, hours) + (transfer_id,)
+            for transfer_id, start, hours in Transfer.objects
+            .filter(**{RESOURCE_FIELDS[resource]: resource_id})
+            .exclude(status__in=INACTIVE_STATUSES)
+            .values_list('id', 'scheduled_start_time', 'scheduled_duration_hours')
+        )
+        index = IntervalIndex(bookings)
+        with self._lock:
+            self._indexes[(resource, resource_id)] = (version, index)
+        return index
+
+    def invalidate(self, resource, resource_id):
+        with self._lock:
+            self._indexes.pop((resource, resource_id), None)
+        cache.set(self._cache_key(resource, resource_id), uuid.uuid4().hex, None)
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+
+
+index = AvailabilityIndex()
+
+
+def conflicts(resource, resource_id, start, end, exclude=None):
+    """
+    Return the ids of the active transfers of a 'vehicle' or 'operator'
+    overlapping [start, end), ignoring the transfer `exclude`.
+    """
+    return index.get(resource, resource_id).conflicts(start, end, exclude)
+
+
+def is_free(resource, resource_id, start, end, exclude=None):
+    return not conflicts(resource, resource_id, start, end, exclude)
+
+
+def transfer_conflicts(transfer, vehicle_id=None, operator_id=None):
+    """
+    Return {'vehicle': [...], 'operator': [...]} with the transfers that
+    would overlap `transfer` if it were assigned to the given vehicle and
+    operator (its current ones by default). Only non-empty lists are included.
+    """
+    if transfer.status in INACTIVE_STATUSES:
+        return {}
+    start, end = interval(transfer.scheduled_start_time, transfer.scheduled_duration_hours)
+    found = {}
+    for resource, resource_id in (
+        ('vehicle', vehicle_id or transfer.vehicle_id),
+        ('operator', operator_id or transfer.operator_id),
+    ):
+        if resource_id:
+            overlapping = conflicts(resource, resource_id, start, end, exclude=transfer.pk)
+            if overlapping:
+                found[resource] = overlapping
+    return found
+
+
+def invalidate(resources):
+    """
+    Mark the indexes of the given (resource, id) pairs as stale in every
+    worker, now and again once the current transaction commits.
+    """
+    resources = {(resource, resource_id) for resource, resource_id in resources if resource_id}
+
+    def bump():
+        for resource, resource_id in resources:
+            index.invalidate(resource, resource_id)
+
+    if resources:
+        bump()
+        transaction.on_commit(bump)
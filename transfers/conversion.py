@@ -0,0 +1,93 @@
+"""
+Conversion of approved service requests into transfers.
+
+`convert_approved()` walks the approved requests that have no transfer yet in
+id order, batch by batch. Each batch resolves the client of every request
+(the requester if it is a client, else its associated client) from the
+joined requester row, computes every A-B distance in one pass, prices the
+transfers in memory with Transfer.calculate_pricing() and inserts them with
+bulk_create.
+
+The transfer's one-to-one link to its request makes the conversion
+idempotent: converted requests are no longer selected, the batch rows are
+locked while they are converted, and the unique column refuses a second
+transfer for the same request.
+"""
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import distance, events, versions
+from .models import ServiceRequest, Transfer
+
+# Approved requests without a transfer whose client can be resolved
+CONVERTIBLE = Q(status='Approvato', transfer__isnull=True) & (
+    Q(requester__role='Cliente')
+    | Q(requester__role='Utilizzatore', requester__associated_client__isnull=False)
+)
+
+
+def client_id_of(requester):
+    return requester.pk if requester.role == 'Cliente' else requester.associated_client_id
+
+
+def build_transfer(service_request):
+    requester = service_request.requester
+    return Transfer(
+        service_request=service_request,
+        client_id=client_id_of(requester),
+        end_user_id=requester.pk if requester.role == 'Utilizzatore' else None,
+        service_type=service_request.service_type,
+        requested_service_class=service_request.requested_service_class,
+        passengers=service_request.passengers,
+        start_location=service_request.start_location,
+        end_location=service_request.end_location,
+        scheduled_start_time=service_request.requested_datetime,
+    )
+
+
+def convert_approved(batch_size=500):
+    """
+    Create a transfer for every approved, unconverted service request.
+    Returns the ids of the new transfers and the number of approved requests
+    still without one.
+    """
+    created = []
+    last_pk = 0
+    while True:
+        with transaction.atomic():
+            service_requests = list(
+                ServiceRequest.objects.filter(CONVERTIBLE, pk__gt=last_pk)
+                .select_related('requester')
+                .select_for_update(of=('self',), skip_locked=True)
+                .order_by('pk')[:batch_size]
+            )
+            if not service_requests:
+                break
+            last_pk = service_requests[-1].pk
+            transfers = [build_transfer(service_request) for service_request in service_requests]
+
+            # Compute every A-B distance of the batch in one pass, then price in memory
+            routed = [transfer for transfer in transfers if transfer.service_type == 'Transfer A-B']
+            distances = dict(zip(
+                map(id, routed),
+                distance.route_distances_km([(transfer.start_location, transfer.end_location) for transfer in routed]),
+            ))
+            for transfer in transfers:
+                transfer.calculate_pricing(distance_km=distances.get(id(transfer)))
+            Transfer.objects.bulk_create(transfers)
+
+            # bulk_create bypasses the model signals: new transfers are unassigned
+            # and 'Richiesto', so only the readers and delta sync need telling
+            ServiceRequest.objects.filter(pk__in=[service_request.pk for service_request in service_requests]).update(updated_at=timezone.now())
+            versions.bump(
+                versions.transfer_scopes(client_ids=[transfer.client_id for transfer in transfers])
+                + versions.request_scopes([service_request.requester_id for service_request in service_requests])
+            )
+            for transfer in transfers:
+                events.publish_transfer('created', transfer)
+        created.extend(transfer.pk for transfer in transfers)
+
+    # Requests without a client, or being converted by a concurrent run
+    unconverted = ServiceRequest.objects.filter(status='Approvato', transfer__isnull=True).count()
+    return {'created': created, 'unconverted': unconverted}
@@ -0,0 +1,221 @@
+"""
+Batch dispatch of unassigned transfers to vehicles and operators.
+
+`solve()` works on plain values and doesn't touch the database: transfers are
+taken in start order and each one gets the smallest vehicle that fits it
+(requested service class, enough capacity) and is free for its whole
+interval, then the operator that has been free the longest. Free resources
+are found through a heap per vehicle group ordered by the time they are
+released, with the interval indexes of availability.py guarding against the
+bookings that existed before the run. A relocation pass then tries to place
+the leftover transfers by moving a single blocking transfer to another
+vehicle.
+
+`dispatch()` loads every unassigned 'Richiesto' transfer of a time window,
+solves it and writes the assignments in one transaction.
+"""
+import heapq
+from collections import namedtuple
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from . import availability, events, versions
+from .availability import IntervalIndex
+from .models import Transfer, User, Vehicle
+
+# A transfer to dispatch; start and end are POSIX timestamps
+Job = namedtuple('Job', 'id start end service_class passengers vehicle_id operator_id')
+VehicleSpec = namedtuple('VehicleSpec', 'id service_class capacity')
+
+# Upper bound on the interval checks spent by the relocation pass
+RELOCATION_BUDGET = 200000
+
+
+def _take_free(heap, index_of, job):
+    """
+    Pop the first resource of `heap` that is free for `job`, or None.
+    """
+    skipped = []
+    chosen = None
+    while heap and heap[0][0] <= job.start:
+        released_at, resource_id = heapq.heappop(heap)
+        if index_of[resource_id].conflicts(job.start, job.end, exclude=job.id):
+            # Busy because of a booking made before this run
+            skipped.append((released_at, resource_id))
+            continue
+        chosen = resource_id
+        break
+    for item in skipped:
+        heapq.heappush(heap, item)
+    if chosen is not None:
+        heapq.heappush(heap, (job.end, chosen))
+        index_of[chosen].add(job.start, job.end, job.id)
+    return chosen
+
+
+def solve(jobs, vehicles, operator_ids, bookings=None):
+    """
+    Assign vehicles and operators to `jobs`.
+
+    `bookings` maps ('vehicle', id) or ('operator', id) to the (start, end,
+    transfer id) intervals the resource already has. Returns a dict mapping
+    each job id to its (vehicle id, operator id), where either may be None if
+    nothing fitting was free.
+    """
+    bookings = bookings or {}
+    vehicle_index = {vehicle.id: IntervalIndex(bookings.get(('vehicle', vehicle.id), ())) for vehicle in vehicles}
+    operator_index = {operator_id: IntervalIndex(bookings.get(('operator', operator_id), ())) for operator_id in operator_ids}
+
+    # One heap of (released at, vehicle id) per (service class, capacity), smallest vehicles first
+    groups = {}
+    for vehicle in vehicles:
+        groups.setdefault((vehicle.capacity, vehicle.service_class), []).append((float('-inf'), vehicle.id))
+    group_keys = sorted(groups)
+    operator_heap = [(float('-inf'), operator_id) for operator_id in operator_ids]
+
+    candidates = {}
+
+    def candidate_groups(job):
+        key = (job.service_class, job.passengers)
+        if key not in candidates:
+            candidates[key] = [
+                group for group in group_keys
+                if group[0] >= job.passengers and (not job.service_class or group[1] == job.service_class)
+            ]
+        return candidates[key]
+
+    assignments = {}
+    for job in sorted(jobs, key=lambda job: (job.start, job.id)):
+        vehicle_id = job.vehicle_id
+        if vehicle_id is None:
+            for group in candidate_groups(job):
+                vehicle_id = _take_free(groups[group], vehicle_index, job)
+                if vehicle_id is not None:
+                    break
+        operator_id = job.operator_id or _take_free(operator_heap, operator_index, job)
+        assignments[job.id] = (vehicle_id, operator_id)
+
+    _relocate(jobs, assignments, vehicles, vehicle_index, candidate_groups, groups)
+    return assignments
+
+
+def _relocate(jobs, assignments, vehicles, vehicle_index, candidate_groups, groups):
+    """
+    Place jobs left without a vehicle by moving the only job blocking one of
+    their candidate vehicles to another free vehicle.
+    """
+    budget = RELOCATION_BUDGET
+    jobs_by_id = {job.id: job for job in jobs}
+    moved_in_run = {job.id for job in jobs if job.vehicle_id is None}
+
+    def fitting(job):
+        return [vehicle_id for group in candidate_groups(job) for _, vehicle_id in groups[group]]
+
+    for job in jobs:
+        if job.vehicle_id is not None or assignments[job.id][0] is not None:
+            continue
+        for vehicle_id in fitting(job):
+            if budget <= 0:
+                return
+            budget -= 1
+            blocking = vehicle_index[vehicle_id].conflicts(job.start, job.end, exclude=job.id)
+            if len(blocking) != 1 or blocking[0] not in moved_in_run:
+                continue
+            other = jobs_by_id[blocking[0]]
+            for other_vehicle_id in fitting(other):
+                budget -= 1
+                if other_vehicle_id != vehicle_id and not vehicle_index[other_vehicle_id].conflicts(other.start, other.end, exclude=other.id):
+                    vehicle_index[vehicle_id].remove(other.start, other.end, other.id)
+                    vehicle_index[other_vehicle_id].add(other.start, other.end, other.id)
+                    vehicle_index[vehicle_id].add(job.start, job.end, job.id)
+                    assignments[other.id] = (other_vehicle_id, assignments[other.id][1])
+                    assignments[job.id] = (vehicle_id, assignments[job.id][1])
+                    break
+            if assignments[job.id][0] is not None:
+                break
+
+
+def _job_end(start, duration_hours):
+    return availability.interval(start, duration_hours)[1].timestamp()
+
+
+def dispatch(start, end, dry_run=False):
+    """
+    Assign every unassigned 'Richiesto' transfer scheduled in [start, end).
+    Returns a summary with the assigned and still unassigned transfer ids.
+    """
+    with transaction.atomic():
+        pending = list(
+            Transfer.objects.select_for_update()
+            .filter(status='Richiesto', scheduled_start_time__gte=start, scheduled_start_time__lt=end)
+            .filter(Q(vehicle__isnull=True) | Q(operator__isnull=True))
+            .values_list(
+                'id', 'scheduled_start_time', 'scheduled_duration_hours',
+                'requested_service_class', 'passengers', 'vehicle_id', 'operator_id', 'client_id',
+            )
+        )
+        jobs = [
+            Job(transfer_id, scheduled.timestamp(), _job_end(scheduled, hours), service_class, passengers or 1, vehicle_id, operator_id)
+            for transfer_id, scheduled, hours, service_class, passengers, vehicle_id, operator_id, _ in pending
+        ]
+        client_ids = {row[0]: row[-1] for row in pending}
+
+        # Bookings that may overlap the window, including the partially assigned jobs
+        longest = Transfer.objects.aggregate(longest=Max('scheduled_duration_hours'))['longest']
+        margin = max(availability.DEFAULT_DURATION, timedelta(hours=float(longest or 0)))
+        bookings = {}
+        for transfer_id, scheduled, hours, vehicle_id, operator_id in (
+            Transfer.objects
+            .filter(scheduled_start_time__gte=start - margin, scheduled_start_time__lt=end + margin)
+            .filter(Q(vehicle__isnull=False) | Q(operator__isnull=False))
+            .exclude(status__in=availability.INACTIVE_STATUSES)
+            .values_list('id', 'scheduled_start_time', 'scheduled_duration_hours', 'vehicle_id', 'operator_id')
+        ):
+            booking = (scheduled.timestamp(), _job_end(scheduled, hours), transfer_id)
+            if vehicle_id:
+                bookings.setdefault(('vehicle', vehicle_id), []).append(booking)
+            if operator_id:
+                bookings.setdefault(('operator', operator_id), []).append(booking)
+
+        vehicles = [VehicleSpec(*row) for row in Vehicle.objects.values_list('id', 'service_class', 'capacity')]
+        operator_ids = list(User.objects.filter(role='Operatore', is_active=True).values_list('id', flat=True))
+
+        assignments = solve(jobs, vehicles, operator_ids, bookings)
+
+        scheduled = {row[0]: row[1] for row in pending}
+        now = timezone.now()
+        changed = []
+        for job in jobs:
+            vehicle_id, operator_id = assignments[job.id]
+            if (vehicle_id, operator_id) != (job.vehicle_id, job.operator_id):
+                changed.append(Transfer(
+                    id=job.id, vehicle_id=vehicle_id, operator_id=operator_id,
+                    client_id=client_ids[job.id], status='Richiesto', scheduled_start_time=scheduled[job.id],
+                    updated_at=now,
+                ))
+        if not dry_run:
+            # bulk_update doesn't apply auto_now, so updated_at is set above
+            Transfer.objects.bulk_update(changed, ['vehicle', 'operator', 'updated_at'], batch_size=500)
+            # bulk_update bypasses the model signals
+            availability.invalidate(
+                [('vehicle', transfer.vehicle_id) for transfer in changed]
+                + [('operator', transfer.operator_id) for transfer in changed]
+            )
+            versions.bump(versions.transfer_scopes(
+                client_ids=[client_ids[transfer.id] for transfer in changed],
+                operator_ids=[transfer.operator_id for transfer in changed],
+            ))
+            for transfer in changed:
+                events.publish_transfer('updated', transfer, changed=['operator', 'vehicle'])
+
+    return {
+        'assigned': sorted(transfer.id for transfer in changed),
+        'unassigned': sorted(
+            job_id for job_id, (vehicle_id, operator_id) in assignments.items()
+            if vehicle_id is None or operator_id is None
+        ),
+        'dry_run': dry_run,
+    }
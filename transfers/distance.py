@@ -0,0 +1,182 @@
+"""
+Offline distance engine for A-B pricing.
+
+Addresses are turned into coordinates by a pluggable geocoder (the
+DISTANCE_GEOCODER setting, a dotted path to a callable taking an address and
+returning (latitude, longitude) or None). Results are stored in the
+GeocodeCache table so each address is geocoded only once, and route distances
+are memoized in a bounded LRU matrix. Distances are great-circle (haversine)
+distances, computed for a whole batch of routes in one vectorized pass when
+NumPy is installed.
+
+A geocoder failure never fails the save: the address is treated as not
+found and the route priced at DEFAULT_DISTANCE_KM. Routes that couldn't be
+geocoded are only remembered for DISTANCE_MISS_TTL_SECONDS, so they are
+retried once the provider is back.
+"""
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.apps import apps
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, fall back to plain Python
+    np = None
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Used when a route can't be geocoded, matching the historical flat distance
+DEFAULT_DISTANCE_KM = Decimal(str(getattr(settings, 'DISTANCE_DEFAULT_KM', '15.0')))
+
+# Seconds a route that couldn't be geocoded is answered from the matrix
+MISS_TTL_SECONDS = getattr(settings, 'DISTANCE_MISS_TTL_SECONDS', 300)
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_address(address):
+    return ' '.join((address or '').split()).casefold()
+
+
+def get_geocoder():
+    """
+    Return the configured geocoder callable, or None to work fully offline.
+    """
+    path = getattr(settings, 'DISTANCE_GEOCODER', None)
+    return import_string(path) if path else None
+
+
+def geocode_many(addresses):
+    """
+    Return {normalized address: (latitude, longitude)} for the addresses that
+    can be geocoded, reading the cache table with a single query and asking
+    the geocoder only for the missing ones.
+    """
+    GeocodeCache = apps.get_model('transfers', 'GeocodeCache')
+    wanted = {normalize_address(address) for address in addresses} - {''}
+    if not wanted:
+        return {}
+    found = {
+        entry.address: (entry.latitude, entry.longitude)
+        for entry in GeocodeCache.objects.filter(address__in=wanted)
+    }
+
+    geocoder = get_geocoder()
+    if geocoder is not None:
+        new_entries = []
+        for address in wanted - found.keys():
+            try:
+                coordinates = geocoder(address)
+            except Exception:
+                # Network errors, quotas, addresses the provider chokes on
+                logger.warning('Could not geocode %r', address, exc_info=True)
+                continue
+            if coordinates is not None:
+                found[address] = tuple(coordinates)
+                new_entries.append(GeocodeCache(address=address, latitude=coordinates[0], longitude=coordinates[1]))
+        GeocodeCache.objects.bulk_create(new_entries, ignore_conflicts=True)
+    return found
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """
+    Great-circle distances in km between two sequences of points, in degrees.
+    """
+    if np is not None:
+        lat1, lon1, lat2, lon2 = (np.radians(np.asarray(values, dtype=float)) for values in (lat1, lon1, lat2, lon2))
+        a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+        return (2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))).tolist()
+
+    distances = []
+    for points in zip(lat1, lon1, lat2, lon2):
+        phi1, lambda1, phi2, lambda2 = map(math.radians, points)
+        a = math.sin((phi2 - phi1) / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin((lambda2 - lambda1) / 2) ** 2
+        distances.append(2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a)))
+    return distances
+
+
+class DistanceMatrix:
+    """
+    Memoized origin/destination distances with LRU eviction.
+    A None entry means the route couldn't be geocoded; it expires after
+    `miss_ttl` seconds.
+    """
+    def __init__(self, maxsize=10000, miss_ttl=MISS_TTL_SECONDS):
+        self.maxsize = maxsize
+        self.miss_ttl = miss_ttl
+        self._distances = OrderedDict()  # key -> (distance, expiry or None)
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._distances.clear()
+
+    def _get(self, key):
+        with self._lock:
+            distance, expires = self._distances[key]
+            if expires is not None and expires <= time.monotonic():
+                del self._distances[key]
+                raise KeyError(key)
+            self._distances.move_to_end(key)
+            return distance
+
+    def _set(self, key, distance):
+        expires = time.monotonic() + self.miss_ttl if distance is None else None
+        with self._lock:
+            self._distances[key] = (distance, expires)
+            self._distances.move_to_end(key)
+            while len(self._distances) > self.maxsize:
+                self._distances.popitem(last=False)
+
+    def distances(self, routes):
+        """
+        Return the distance in km of each (start, end) route, or None.
+        """
+        keys = [(normalize_address(start), normalize_address(end)) for start, end in routes]
+        results = {}
+        missing = []
+        for key in set(keys):
+            try:
+                results[key] = self._get(key)
+            except KeyError:
+                missing.append(key)
+
+        if missing:
+            coordinates = geocode_many(address for key in missing for address in key)
+            computable = [key for key in missing if key[0] in coordinates and key[1] in coordinates]
+            computed = haversine_km(
+                [coordinates[start][0] for start, _ in computable],
+                [coordinates[start][1] for start, _ in computable],
+                [coordinates[end][0] for _, end in computable],
+                [coordinates[end][1] for _, end in computable],
+            )
+            results.update(zip(computable, computed))
+            for key in missing:
+                results.setdefault(key, None)
+                self._set(key, results[key])
+        return [results[key] for key in keys]
+
+
+matrix = DistanceMatrix(getattr(settings, 'DISTANCE_MATRIX_SIZE', 10000))
+
+
+def route_distances_km(routes):
+    """
+    Return the pricing distance of each (start, end) route as a Decimal,
+    falling back to DEFAULT_DISTANCE_KM for routes that can't be geocoded.
+    """
+    return [
+        DEFAULT_DISTANCE_KM if distance is None else Decimal(str(round(distance, 2)))
+        for distance in matrix.distances(routes)
+    ]
+
+
+def route_distance_km(start, end):
+    return route_distances_km([(start, end)])[0]
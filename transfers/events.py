@@ -0,0 +1,189 @@
+"""
+Publish/subscribe of transfer change events, pushed to the browsers over SSE.
+
+Every committed save or delete of a transfer publishes a small event on the
+channels of the readers it concerns, named like the version scopes:
+'transfers' (admins), 'transfers:client:<id>' and 'transfers:operator:<id>'.
+The SSE endpoint subscribes to the channels of the logged in user.
+
+Each subscriber has a bounded queue. A subscriber that can't keep up doesn't
+make the publisher wait or the memory grow: its queued events are dropped and
+replaced by a single 'resync' event, telling it to reload the list once.
+
+The broker is chosen with EVENTS_BROKER. InProcessBroker only reaches the
+subscribers of the same process, which fits a single ASGI process serving
+both the API and the stream. With several processes or nodes use
+RedisBroker (EVENTS_REDIS_URL): events go through Redis pub/sub and every
+process fans them out to its own subscribers.
+"""
+import asyncio
+import json
+import logging
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+from django.utils.module_loading import import_string
+
+from . import versions
+
+RESYNC = {'event': 'resync'}
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    def __init__(self, channels, queue_size):
+        self.channels = set(channels)
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=queue_size)
+
+    def deliver(self, event):
+        """
+        Queue `event`; runs in the subscriber's event loop.
+        """
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Too slow: drop the backlog, the client reloads instead
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class InProcessBroker:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = {}
+
+    def subscribe(self, channels):
+        """
+        Start queueing the events of `channels`; call from the event loop
+        that will read them, and unsubscribe() when done.
+        """
+        subscription = Subscription(channels, getattr(settings, 'EVENTS_QUEUE_SIZE', 100))
+        with self.lock:
+            for channel in subscription.channels:
+                self.subscriptions.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            for channel in subscription.channels:
+                subscribers = self.subscriptions.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self.subscriptions[channel]
+
+    def publish(self, channels, event):
+        self.fan_out(channels, event)
+
+    def fan_out(self, channels, event):
+        """
+        Hand `event` to the local subscribers of `channels`, each one once.
+        Safe to call from any thread.
+        """
+        with self.lock:
+            targets = set().union(*(self.subscriptions.get(channel, ()) for channel in channels))
+        for subscription in targets:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+            except RuntimeError:
+                # Its event loop is gone without unsubscribing
+                self.unsubscribe(subscription)
+
+
+class RedisBroker(InProcessBroker):
+    """
+    Broker for several processes: events are published to Redis, and one
+    listener per process passes them on to the local subscribers.
+    """
+    prefix = 'transfers:events:'
+
+    def __init__(self):
+        super().__init__()
+        import redis
+
+        self.url = settings.EVENTS_REDIS_URL
+        self.client = redis.Redis.from_url(self.url)
+        self.listener = None
+
+    def publish(self, channels, event):
+        message = json.dumps({'channels': list(channels), 'event': event})
+        self.client.publish(f'{self.prefix}all', message)
+
+    def subscribe(self, channels):
+        if self.listener is None or self.listener.done():
+            self.listener = asyncio.get_running_loop().create_task(self.listen())
+        return super().subscribe(channels)
+
+    async def listen(self):
+        import redis.asyncio
+
+        pubsub = redis.asyncio.Redis.from_url(self.url).pubsub(ignore_subscribe_messages=True)
+        await pubsub.subscribe(f'{self.prefix}all')
+        async for message in pubsub.listen():
+            data = json.loads(message['data'])
+            self.fan_out(data['channels'], data['event'])
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(getattr(settings, 'EVENTS_BROKER', 'transfers.events.InProcessBroker'))()
+        return _broker
+
+
+def isoformat(value):
+    """
+    `value` as ISO 8601; a string assigned to the field isn't parsed by save().
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        parsed = parse_datetime(value)
+        return parsed.isoformat() if parsed else value
+    return value.isoformat()
+
+
+def transfer_event(kind, transfer, changed=None):
+    return {
+        'event': f'transfer.{kind}',
+        'id': transfer.pk,
+        'status': transfer.status,
+        'client_id': transfer.client_id,
+        'operator_id': transfer.operator_id,
+        'vehicle_id': transfer.vehicle_id,
+        'scheduled_start_time': isoformat(transfer.scheduled_start_time),
+        'changed': sorted(changed) if changed is not None else None,
+    }
+
+
+def publish_transfer(kind, transfer, changed=None, previous_client_id=None, previous_operator_id=None):
+    """
+    Publish a change of `transfer` once the current transaction commits.
+    The previous client and operator hear about it too, e.g. on reassignment.
+    Never raises.
+    """
+    try:
+        event = transfer_event(kind, transfer, changed)
+        channels = versions.transfer_scopes(
+            client_ids=[transfer.client_id, previous_client_id],
+            operator_ids=[transfer.operator_id, previous_operator_id],
+        )
+    except Exception:
+        # Events are a courtesy to the browsers, never a reason to fail a save
+        logger.exception('Could not build the %s event of transfer %s', kind, transfer.pk)
+        return
+    # A broker failure is logged but doesn't fail the committed save
+    transaction.on_commit(lambda: get_broker().publish(channels, event), robust=True)
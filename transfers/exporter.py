@@ -0,0 +1,87 @@
+"""
+Streaming export of transfers as CSV or NDJSON.
+
+Rows are read with values_list() over a server-side iterator and encoded one
+at a time, so memory use doesn't depend on the number of exported transfers.
+"""
+import csv
+import json
+from datetime import datetime
+from decimal import Decimal
+
+CHUNK_SIZE = 2000
+
+# Exported column -> queryset lookup, in the order of TransferSerializer
+COLUMNS = {
+    'id': 'id',
+    'client': 'client__username',
+    'operator': 'operator__username',
+    'end_user': 'end_user__username',
+    'vehicle_service_class': 'vehicle__service_class',
+    'vehicle_license_plate': 'vehicle__license_plate',
+    'service_type': 'service_type',
+    'status': 'status',
+    'start_location': 'start_location',
+    'end_location': 'end_location',
+    'scheduled_start_time': 'scheduled_start_time',
+    'scheduled_duration_hours': 'scheduled_duration_hours',
+    'requested_service_class': 'requested_service_class',
+    'passengers': 'passengers',
+    'actual_start_time': 'actual_start_time',
+    'actual_end_time': 'actual_end_time',
+    'notes': 'notes',
+    'deviations': 'deviations',
+    'service_value': 'service_value',
+    'service_cost': 'service_cost',
+}
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def _encode(value):
+    # Same representation as the JSON API
+    if isinstance(value, datetime):
+        value = value.isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def iter_rows(queryset):
+    """
+    Yield one dict per transfer of `queryset`, with the exported columns.
+    """
+    names = list(COLUMNS)
+    rows = queryset.order_by('scheduled_start_time', 'id').values_list(*COLUMNS.values())
+    for row in rows.iterator(chunk_size=CHUNK_SIZE):
+        yield {name: _encode(value) for name, value in zip(names, row)}
+
+
+class _Echo:
+    """
+    File-like object that hands back what csv.writer writes to it.
+    """
+    def write(self, value):
+        return value
+
+
+def stream_csv(queryset):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(COLUMNS)
+    for row in iter_rows(queryset):
+        yield writer.writerow(['' if value is None else value for value in row.values()])
+
+
+def stream_ndjson(queryset):
+    for row in iter_rows(queryset):
+        yield json.dumps(row, ensure_ascii=False) + '\n'
+
+
+STREAMERS = {
+    'csv': stream_csv,
+    'ndjson': stream_ndjson,
+}
@@ -0,0 +1,221 @@
+"""
+Bulk import of transfers from CSV or NDJSON.
+
+Rows are parsed lazily from the input stream and handled in batches: each
+batch is validated with TransferSerializer, its related users and vehicles
+are fetched with one query each, it is priced in memory from the rate table
+and inserted with bulk_create. Invalid rows are reported and skipped without
+aborting the rest of the batch. Only admins may assign vehicles and
+operators, and rows that would double-book one are rejected.
+"""
+import csv
+import io
+import json
+from collections import defaultdict
+from decimal import Decimal
+from itertools import islice
+
+from django.db import transaction
+
+from . import availability, distance, events, versions
+from .availability import IntervalIndex
+from .models import User, Vehicle, Transfer, EmailOutbox, DailyRollup
+from .serializers import TransferSerializer
+
+# Columns only admins may fill in
+ASSIGNMENT_COLUMNS = ('operator', 'vehicle')
+
+# Columns holding a username, and the role the referenced user must have
+USER_COLUMNS = {
+    'client': 'Cliente',
+    'operator': 'Operatore',
+    'end_user': None,
+}
+
+
+def iter_rows(stream, fmt):
+    """
+    Yield one dict per row of a binary `stream` in 'csv' or 'ndjson' format.
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        for row in csv.DictReader(text):
+            # Empty cells mean "not provided", not an empty value
+            yield {key: value for key, value in row.items() if key and value not in ('', None)}
+    elif fmt == 'ndjson':
+        for line in text:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                yield e
+    else:
+        raise ValueError(f"Unsupported import format: {fmt}")
+
+
+def guess_format(filename):
+    if filename.lower().endswith('.csv'):
+        return 'csv'
+    if filename.lower().endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    return None
+
+
+def import_transfers(rows, client=None, batch_size=500):
+    """
+    Create transfers from an iterable of row dicts.
+
+    If `client` is given every transfer is created for it and the `client`
+    column is ignored. Returns a dict with the number of created transfers and
+    the errors of the rejected rows, numbered from 1.
+    """
+    created = 0
+    errors = []
+    rows = enumerate(rows, start=1)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        transfers, batch_errors = _build_batch(batch, client)
+        errors.extend(batch_errors)
+        with transaction.atomic():
+            Transfer.objects.bulk_create(transfers)
+            # bulk_create bypasses the model signals, so refresh the availability indexes here
+            availability.invalidate(
+                [('vehicle', transfer.vehicle_id) for transfer in transfers]
+                + [('operator', transfer.operator_id) for transfer in transfers]
+            )
+            versions.bump(versions.transfer_scopes(
+                client_ids=[transfer.client_id for transfer in transfers],
+                operator_ids=[transfer.operator_id for transfer in transfers],
+            ))
+            for transfer in transfers:
+                events.publish_transfer('created', transfer)
+            # Likewise update the rollups of completed transfers
+            rollups = defaultdict(lambda: [0, Decimal('0.00'), Decimal('0.00')])
+            for transfer in transfers:
+                entry = Transfer.rollup_entry(transfer.__dict__)
+                if entry:
+                    totals = rollups[entry[0]]
+                    totals[0] += 1
+                    totals[1] += entry[1]
+                    totals[2] += entry[2]
+            for day, (count, value, cost) in rollups.items():
+                DailyRollup.add(day, count, value, cost)
+            # Likewise queue the confirmation emails here
+            EmailOutbox.objects.bulk_create([
+                EmailOutbox(
+                    subject=f'Transfer {transfer.id} Confermato',
+                    body=f'Ciao {transfer.client.first_name},\n\nIl tuo transfer da {transfer.start_location} a {transfer.end_location} è stato confermato.\n\nGrazie.',
+                    from_email='noreply@transferapp.com',
+                    recipients=transfer.client.email,
+                )
+                for transfer in transfers
+                if transfer.status == 'Confermato' and transfer.client.email
+            ])
+        created += len(transfers)
+    return {'created': created, 'errors': errors}
+
+
+def _booking_errors(transfer, number, booked):
+    """
+    Errors for a row whose vehicle or operator is already busy at that time,
+    in the database or in an earlier row of the batch; otherwise the row's
+    bookings are added to `booked`.
+    """
+    if transfer.status in availability.INACTIVE_STATUSES:
+        return {}
+    errors = {}
+    start, end = availability.interval(transfer.scheduled_start_time, transfer.scheduled_duration_hours)
+    for resource, ids in availability.transfer_conflicts(transfer).items():
+        errors[resource] = [f'Già impegnato nello stesso orario dai transfer {", ".join(map(str, ids))}.']
+    for resource, field in availability.RESOURCE_FIELDS.items():
+        resource_id = getattr(transfer, field)
+        if resource_id and resource not in errors:
+            rows = booked[resource, resource_id].conflicts(start, end)
+            if rows:
+                errors[resource] = [f'Già impegnato nello stesso orario dalla riga {rows[0]}.']
+    if not errors:
+        for resource, field in availability.RESOURCE_FIELDS.items():
+            if getattr(transfer, field):
+                booked[resource, getattr(transfer, field)].add(start, end, number)
+    return errors
+
+
+def _build_batch(batch, client):
+    """
+    Validate and price a batch of (row number, row) pairs.
+    """
+    rows = [(number, row) for number, row in batch if isinstance(row, dict)]
+    errors = [
+        {'row': number, 'errors': {'non_field_errors': [f'Riga non valida: {row}']}}
+        for number, row in batch if not isinstance(row, dict)
+    ]
+
+    # Resolve every referenced user and vehicle with one query each
+    usernames = {row[column] for _, row in rows for column in USER_COLUMNS if row.get(column)}
+    users = {user.username: user for user in User.objects.filter(username__in=usernames)}
+    plates = {row['vehicle'] for _, row in rows if row.get('vehicle')}
+    vehicles = {vehicle.license_plate: vehicle for vehicle in Vehicle.objects.filter(license_plate__in=plates)}
+
+    transfers = []
+    # Bookings of the rows accepted so far, to catch overlaps within the file
+    booked = defaultdict(IntervalIndex)
+    for number, row in rows:
+        serializer = TransferSerializer(data=row)
+        row_errors = {} if serializer.is_valid() else dict(serializer.errors)
+
+        related = {}
+        if client is not None:
+            # Like the API, only admins assign vehicles and operators (see TransferViewSet.assign)
+            for column in ASSIGNMENT_COLUMNS:
+                if row.get(column):
+                    row_errors[column] = ['Solo un amministratore può assegnare questo campo.']
+        for column, role in USER_COLUMNS.items():
+            if column == 'client' and client is not None:
+                related['client'] = client
+                continue
+            if column in row_errors:
+                continue
+            username = row.get(column)
+            if not username:
+                if column == 'client':
+                    row_errors['client'] = ['Questo campo è obbligatorio.']
+                continue
+            user = users.get(username)
+            if user is None:
+                row_errors[column] = [f'Utente "{username}" non trovato.']
+            elif role and user.role != role:
+                row_errors[column] = [f'L\'utente "{username}" non è un {role}.']
+            else:
+                related[column] = user
+        if row.get('vehicle') and 'vehicle' not in row_errors:
+            related['vehicle'] = vehicles.get(row['vehicle'])
+            if related['vehicle'] is None:
+                row_errors['vehicle'] = [f'Veicolo "{row["vehicle"]}" non trovato.']
+
+        if not row_errors:
+            transfer = Transfer(**serializer.validated_data, **related)
+            row_errors = _booking_errors(transfer, number, booked)
+        if row_errors:
+            errors.append({'row': number, 'errors': row_errors})
+            continue
+
+        transfers.append(transfer)
+
+    # Compute every A-B distance of the batch in one pass, then price in memory
+    # Transfers without a vehicle are priced by their requested class, like conversion.py
+    routed = [
+        transfer for transfer in transfers
+        if (transfer.vehicle or transfer.requested_service_class) and transfer.service_type == 'Transfer A-B'
+    ]
+    distances = dict(zip(
+        map(id, routed),
+        distance.route_distances_km([(transfer.start_location, transfer.end_location) for transfer in routed]),
+    ))
+    for transfer in transfers:
+        transfer.calculate_pricing(distance_km=distances.get(id(transfer)))
+    errors.sort(key=lambda error: error['row'])
+    return transfers, errors
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from transfers.conversion import convert_approved
+
+class Command(BaseCommand):
+    help = 'Creates a priced transfer for every approved service request that has none yet.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Requests converted per transaction.')
+
+    def handle(self, *args, **options):
+        result = convert_approved(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Created {len(result['created'])} transfers."))
+        if result['unconverted']:
+            self.stdout.write(self.style.WARNING(f"{result['unconverted']} approved requests have no transfer (no associated client)."))
@@ -0,0 +1,29 @@
+from datetime import datetime, time, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from transfers.dispatch import dispatch
+
+class Command(BaseCommand):
+    help = "Assigns vehicles and operators to the unassigned transfers of a time window (tomorrow by default)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='start', type=datetime.fromisoformat, help='Start of the window (ISO datetime).')
+        parser.add_argument('--to', dest='end', type=datetime.fromisoformat, help='End of the window, exclusive (ISO datetime).')
+        parser.add_argument('--dry-run', action='store_true', help='Only report the assignments, without saving them.')
+
+    def handle(self, *args, **options):
+        tomorrow = datetime.combine(timezone.localdate() + timedelta(days=1), time.min)
+        start = options['start'] or tomorrow
+        end = options['end'] or start + timedelta(days=1)
+        start, end = (timezone.make_aware(value) if timezone.is_naive(value) else value for value in (start, end))
+        if start >= end:
+            raise CommandError('--from must be before --to.')
+
+        result = dispatch(start, end, dry_run=options['dry_run'])
+
+        verb = 'Would assign' if options['dry_run'] else 'Assigned'
+        self.stdout.write(self.style.SUCCESS(f"{verb} {len(result['assigned'])} transfers between {start} and {end}."))
+        if result['unassigned']:
+            self.stdout.write(self.style.WARNING(
+                f"{len(result['unassigned'])} transfers still lack a vehicle or operator: {result['unassigned']}"
+            ))
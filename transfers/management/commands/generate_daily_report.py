@@ -1,43 +1,92 @@
-from django.core.management.base import BaseCommand
+from collections import Counter, defaultdict
+from datetime import date, datetime, time, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models.functions import TruncDate
 from django.utils import timezone
 from decimal import Decimal
-from transfers.models import Transfer, DailyReport
+from transfers import versions
+from transfers.models import Transfer, DailyReport, DailyRollup
 
 class Command(BaseCommand):
-    help = 'Generates a daily report for completed transfers from the previous day.'
+    help = 'Generates a daily report for completed transfers from the previous day, or for a range of days.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='date_from', type=date.fromisoformat, help='First day to report (YYYY-MM-DD).')
+        parser.add_argument('--to', dest='date_to', type=date.fromisoformat, help='Last day to report, inclusive (YYYY-MM-DD).')
 
     def handle(self, *args, **options):
-        # Report is for the day that just ended.
-        target_date = timezone.now().date() - timezone.timedelta(days=1)
+        # Report is for the day that just ended, unless a range is given.
+        yesterday = timezone.now().date() - timezone.timedelta(days=1)
+        date_from = options['date_from'] or options['date_to'] or yesterday
+        date_to = options['date_to'] or options['date_from'] or yesterday
+        if date_from > date_to:
+            raise CommandError('--from must not be after --to.')
 
-        # Check if a report for this date already exists
-        if DailyReport.objects.filter(date=target_date).exists():
-            self.stdout.write(self.style.WARNING(f'Report for {target_date} already exists. Skipping.'))
+        # Check which reports for these dates already exist
+        existing = set(DailyReport.objects.filter(date__range=(date_from, date_to)).values_list('date', flat=True))
+        dates = [
+            day for day in (date_from + timedelta(days=n) for n in range((date_to - date_from).days + 1))
+            if day not in existing
+        ]
+        for day in sorted(existing):
+            self.stdout.write(self.style.WARNING(f'Report for {day} already exists. Skipping.'))
+        if not dates:
             return
 
+        # Filter on the raw timestamp so the (status, actual_end_time) index is used
         completed_transfers = Transfer.objects.filter(
             status='Completato',
-            actual_end_time__date=target_date
-        )
-
-        if not completed_transfers.exists():
-            self.stdout.write(self.style.SUCCESS(f'No completed transfers for {target_date}. No report generated.'))
-            # Optional: create an empty report
-            DailyReport.objects.create(
-                date=target_date,
-                total_value=Decimal('0.00'),
-                total_cost=Decimal('0.00')
-            )
-            return
+            actual_end_time__gte=timezone.make_aware(datetime.combine(dates[0], time.min)),
+            actual_end_time__lt=timezone.make_aware(datetime.combine(dates[-1] + timedelta(days=1), time.min)),
+        ).annotate(day=TruncDate('actual_end_time'))
+        missing = set(dates)
+        links = []
+        counts = Counter()
+        values = defaultdict(lambda: Decimal('0.00'))
+        costs = defaultdict(lambda: Decimal('0.00'))
+        for transfer_id, day, value, cost in completed_transfers.values_list('id', 'day', 'service_value', 'service_cost').iterator():
+            if day in missing:
+                links.append((transfer_id, day))
+                counts[day] += 1
+                values[day] += value or 0
+                costs[day] += cost or 0
+
+        # The totals are kept up to date by the rollups, but queryset updates
+        # bypass them: the scan above gives the real count and totals of every
+        # day, and any rollup that differs in one of them is repaired.
+        rollups = DailyRollup.objects.in_bulk(dates, field_name='date')
+        for day in dates:
+            expected = {'count': counts[day], 'total_value': values[day], 'total_cost': costs[day]}
+            rollup = rollups.get(day)
+            if rollup is None and not expected['count']:
+                continue
+            if rollup is None or any(getattr(rollup, field) != value for field, value in expected.items()):
+                self.stdout.write(self.style.WARNING(f'Rollup for {day} was out of date. Repaired.'))
+                rollups[day], _ = DailyRollup.objects.update_or_create(date=day, defaults=expected)
 
-        total_value = sum(t.service_value for t in completed_transfers if t.service_value) or Decimal('0.00')
-        total_cost = sum(t.service_cost for t in completed_transfers if t.service_cost) or Decimal('0.00')
+        with transaction.atomic():
+            DailyReport.objects.bulk_create([
+                DailyReport(
+                    date=day,
+                    total_value=rollups[day].total_value if day in rollups else Decimal('0.00'),
+                    total_cost=rollups[day].total_cost if day in rollups else Decimal('0.00'),
+                )
+                for day in dates
+            ])
+            report_ids = dict(DailyReport.objects.filter(date__in=dates).values_list('date', 'id'))
 
-        report = DailyReport.objects.create(
-            date=target_date,
-            total_value=total_value,
-            total_cost=total_cost
-        )
-        report.completed_transfers.set(completed_transfers)
+            # Link the transfers to their report with one bulk insert into the through table
+            Through = DailyReport.completed_transfers.through
+            Through.objects.bulk_create([
+                Through(dailyreport_id=report_ids[day], transfer_id=transfer_id)
+                for transfer_id, day in links
+            ])
+            # The bulk inserts bypass the model signals
+            versions.bump(['reports'])
 
-        self.stdout.write(self.style.SUCCESS(f'Successfully generated report for {target_date}.'))
+        for day in dates:
+            if counts[day]:
+                self.stdout.write(self.style.SUCCESS(f'Successfully generated report for {day}.'))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'No completed transfers for {day}. Empty report generated.'))
@@ -0,0 +1,200 @@
+import random
+from collections import defaultdict
+from datetime import timedelta
+from itertools import islice
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from decimal import Decimal
+from transfers import availability, pricing, versions
+from transfers.models import User, Vehicle, PriceList, Transfer, ServiceRequest, DailyRollup
+
+FLEET = (('Auto', 4, 50), ('Van', 8, 30), ('Minibus', 19, 15), ('Bus', 50, 5))
+RATES = {
+    # service class -> (price per km, price per hour, operator rate)
+    'Auto': (Decimal('1.20'), Decimal('45.00'), Decimal('20.00')),
+    'Van': (Decimal('1.60'), Decimal('60.00'), Decimal('25.00')),
+    'Minibus': (Decimal('2.40'), Decimal('90.00'), Decimal('35.00')),
+    'Bus': (Decimal('3.50'), Decimal('140.00'), Decimal('50.00')),
+}
+PLACES = (
+    'Aeroporto Fiumicino', 'Aeroporto Ciampino', 'Roma Termini', 'Colosseo', 'Vaticano',
+    'Aeroporto Malpensa', 'Milano Centrale', 'Duomo di Milano', 'Napoli Centrale', 'Porto di Civitavecchia',
+)
+
+
+class Command(BaseCommand):
+    help = 'Generates a synthetic dataset of users, vehicles, price lists, transfers and service requests for load testing.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=100)
+        parser.add_argument('--end-users', type=int, default=5, help='End users per client.')
+        parser.add_argument('--operators', type=int, default=50)
+        parser.add_argument('--vehicles', type=int, default=80)
+        parser.add_argument('--transfers', type=int, default=100000)
+        parser.add_argument('--requests', type=int, default=20000)
+        parser.add_argument('--days', type=int, default=365, help='Transfers are spread over this many days before and after today.')
+        parser.add_argument('--prefix', default='synth', help='Prefix of the generated usernames and license plates.')
+        parser.add_argument('--password', default='password123', help='Password of every generated user.')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows inserted per query.')
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if options['clients'] < 1:
+            raise CommandError('At least one client is needed.')
+        if User.objects.filter(username__startswith=f'{prefix}-').exists():
+            raise CommandError(f"Users prefixed '{prefix}-' already exist, use another --prefix.")
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+
+        users = self.create_users(options)
+        vehicles = self.create_vehicles(prefix, options['vehicles'])
+        self.ensure_price_lists()
+
+        rollups = defaultdict(lambda: [0, Decimal('0.00'), Decimal('0.00')])
+        transfers = self.iter_transfers(options['transfers'], options['days'], users, vehicles)
+        created = self.insert(Transfer, transfers, on_batch=lambda batch: self.add_rollups(rollups, batch))
+        self.stdout.write(f'Created {created} transfers.')
+        requesters = users['Cliente'] + users['Utilizzatore']
+        created = self.insert(ServiceRequest, self.iter_requests(options['requests'], options['days'], requesters))
+        self.stdout.write(f'Created {created} service requests.')
+
+        # bulk_create bypasses the model signals
+        with transaction.atomic():
+            for day, (count, value, cost) in rollups.items():
+                DailyRollup.add(day, count, value, cost)
+            availability.index.clear()
+            pricing.invalidate()
+            versions.bump(
+                ['users', 'vehicles', 'prices']
+                + versions.transfer_scopes(client_ids=users['Cliente'], operator_ids=users['Operatore'])
+                + versions.request_scopes(requester_ids=requesters)
+            )
+        self.stdout.write(self.style.SUCCESS(f"Synthetic dataset '{prefix}' generated."))
+
+    def insert(self, model, objects, on_batch=None):
+        """
+        Bulk insert `objects` batch by batch, so only one batch is in memory.
+        """
+        created = 0
+        while True:
+            batch = list(islice(objects, self.batch_size))
+            if not batch:
+                return created
+            with transaction.atomic():
+                model.objects.bulk_create(batch)
+            if on_batch:
+                on_batch(batch)
+            created += len(batch)
+
+    def create_users(self, options):
+        prefix = options['prefix']
+        # Hashing is slow on purpose: hash once and share it
+        password = make_password(options['password'])
+        User.objects.create_superuser(f'{prefix}-admin', f'{prefix}-admin@example.com', options['password'], role='Amministratore')
+
+        def build(role, slug, count):
+            return (
+                User(username=f'{prefix}-{slug}-{n}', email=f'{prefix}-{slug}-{n}@example.com', first_name=slug.title(), last_name=str(n), role=role, password=password)
+                for n in range(count)
+            )
+
+        self.insert(User, build('Cliente', 'client', options['clients']))
+        self.insert(User, build('Operatore', 'operator', options['operators']))
+        clients = list(User.objects.filter(username__startswith=f'{prefix}-client-').values_list('id', flat=True))
+        self.insert(User, (
+            User(username=f'{prefix}-user-{client_id}-{n}', role='Utilizzatore', password=password, associated_client_id=client_id)
+            for client_id in clients
+            for n in range(options['end_users'])
+        ))
+
+        users = defaultdict(list)
+        for user_id, role in User.objects.filter(username__startswith=f'{prefix}-').values_list('id', 'role'):
+            users[role].append(user_id)
+        self.end_users = defaultdict(list)
+        for user_id, client_id in User.objects.filter(username__startswith=f'{prefix}-user-').values_list('id', 'associated_client_id'):
+            self.end_users[client_id].append(user_id)
+        return users
+
+    def create_vehicles(self, prefix, count):
+        weights = [share for _, _, share in FLEET]
+        self.insert(Vehicle, (
+            Vehicle(service_class=service_class, capacity=capacity, license_plate=f'{prefix.upper()[:6]}-{n:06d}')
+            for n, (service_class, capacity, _) in enumerate(self.rng.choices(FLEET, weights=weights, k=count))
+        ))
+        return list(Vehicle.objects.filter(license_plate__startswith=f'{prefix.upper()[:6]}-').values_list('id', 'service_class', 'capacity'))
+
+    def ensure_price_lists(self):
+        existing = set(PriceList.objects.values_list('service_class', 'service_type'))
+        PriceList.objects.bulk_create([
+            PriceList(service_class=service_class, service_type=service_type, price_per_km=per_km, price_per_hour=per_hour, operator_rate=rate)
+            for service_class, (per_km, per_hour, rate) in RATES.items()
+            for service_type, _ in PriceList.SERVICE_TYPE_CHOICES
+            if (service_class, service_type) not in existing
+        ])
+
+    def iter_transfers(self, count, days, users, vehicles):
+        rng = self.rng
+        now = timezone.now()
+        for _ in range(count):
+            client_id = rng.choice(users['Cliente'])
+            start = now + timedelta(minutes=rng.randint(-days * 1440, days * 1440))
+            hours = Decimal(rng.choice(('1.00', '1.50', '2.00', '4.00', '8.00')))
+            if start < now:
+                status = rng.choices(('Completato', 'Annullato'), weights=(9, 1))[0]
+            else:
+                status = rng.choices(('Richiesto', 'Confermato'), weights=(1, 3))[0]
+            assigned = status != 'Richiesto' or rng.random() < 0.3
+            vehicle_id, service_class, capacity = rng.choice(vehicles) if assigned and vehicles else (None, 'Auto', 4)
+            service_type = rng.choice(('Transfer A-B', 'Transfer A-B', 'Disposizione Oraria'))
+            per_km, per_hour, rate = RATES[service_class]
+            if service_type == 'Disposizione Oraria':
+                value = hours * per_hour
+            else:
+                value = Decimal('25.00') + per_km * rng.randint(5, 300)
+            end_users = self.end_users.get(client_id)
+            yield Transfer(
+                client_id=client_id,
+                end_user_id=rng.choice(end_users) if end_users else None,
+                operator_id=rng.choice(users['Operatore']) if assigned and users['Operatore'] else None,
+                vehicle_id=vehicle_id,
+                service_type=service_type,
+                status=status,
+                start_location=rng.choice(PLACES),
+                end_location=rng.choice(PLACES),
+                scheduled_start_time=start,
+                scheduled_duration_hours=hours,
+                passengers=rng.randint(1, capacity),
+                actual_start_time=start if status == 'Completato' else None,
+                actual_end_time=start + timedelta(hours=float(hours)) if status == 'Completato' else None,
+                service_value=value,
+                service_cost=rate,
+            )
+
+    def iter_requests(self, count, days, requesters):
+        rng = self.rng
+        now = timezone.now()
+        for _ in range(count):
+            requested = now + timedelta(minutes=rng.randint(-days * 1440, days * 1440))
+            status = rng.choices(('In Attesa', 'Approvato', 'Rifiutato'), weights=(5, 4, 1))[0] if requested < now else 'In Attesa'
+            yield ServiceRequest(
+                requester_id=rng.choice(requesters),
+                start_location=rng.choice(PLACES),
+                end_location=rng.choice(PLACES),
+                requested_datetime=requested,
+                status=status,
+                client_approved=status == 'Approvato',
+                admin_approved=status == 'Approvato',
+            )
+
+    @staticmethod
+    def add_rollups(rollups, transfers):
+        for transfer in transfers:
+            entry = Transfer.rollup_entry(transfer.__dict__)
+            if entry:
+                totals = rollups[entry[0]]
+                totals[0] += 1
+                totals[1] += entry[1]
+                totals[2] += entry[2]
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from transfers.importer import guess_format, import_transfers, iter_rows
+from transfers.models import User
+
+class Command(BaseCommand):
+    help = 'Imports transfers in bulk from a CSV or NDJSON file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import (.csv, .ndjson or .jsonl).')
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help='Input format, guessed from the file extension by default.')
+        parser.add_argument('--client', help='Username of the client all transfers belong to, instead of a client column.')
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows validated and inserted together.')
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or guess_format(options['path'])
+        if fmt is None:
+            raise CommandError('Cannot guess the file format, use --format.')
+
+        client = None
+        if options['client']:
+            try:
+                client = User.objects.get(username=options['client'], role='Cliente')
+            except User.DoesNotExist:
+                raise CommandError(f"Client '{options['client']}' does not exist.")
+
+        with open(options['path'], 'rb') as stream:
+            result = import_transfers(iter_rows(stream, fmt), client=client, batch_size=options['batch_size'])
+
+        for error in result['errors']:
+            self.stdout.write(self.style.WARNING(f"Row {error['row']}: {error['errors']}"))
+        self.stdout.write(self.style.SUCCESS(f"Imported {result['created']} transfers, {len(result['errors'])} rows rejected."))
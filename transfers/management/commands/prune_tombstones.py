@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from transfers.models import Tombstone
+
+class Command(BaseCommand):
+    help = 'Deletes the delta sync tombstones older than SYNC_TOMBSTONE_RETENTION_DAYS.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.SYNC_TOMBSTONE_RETENTION_DAYS, help='Days of tombstones to keep.')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timezone.timedelta(days=options['days'])
+        deleted, _ = Tombstone.objects.filter(deleted_at__lt=cutoff).delete()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} tombstones older than {cutoff:%Y-%m-%d %H:%M}.'))
@@ -0,0 +1,12 @@
+from django.db import connection
+from django.core.management.base import BaseCommand
+from transfers import search
+
+class Command(BaseCommand):
+    help = 'Recreates the full-text search index of the transfers and reindexes every row.'
+
+    def handle(self, *args, **options):
+        with connection.schema_editor() as schema_editor:
+            search.drop_index(schema_editor)
+            search.create_index(schema_editor)
+        self.stdout.write(self.style.SUCCESS(f'Search index rebuilt on {connection.vendor}.'))
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+from transfers.outbox import MAX_ATTEMPTS, deliver_batch
+
+class Command(BaseCommand):
+    help = 'Delivers the queued emails in the outbox, retrying failures with backoff.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Emails delivered per SMTP connection.')
+        parser.add_argument('--max-attempts', type=int, default=MAX_ATTEMPTS, help='Attempts before an email is dead-lettered.')
+        parser.add_argument('--loop', action='store_true', help='Keep polling the outbox instead of exiting once it is drained.')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds between polls with --loop.')
+
+    def handle(self, *args, **options):
+        total_sent = total_failed = 0
+        while True:
+            sent, failed = deliver_batch(options['batch_size'], options['max_attempts'])
+            total_sent += sent
+            total_failed += failed
+            if sent + failed == options['batch_size']:
+                # The batch was full, there may be more due emails
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f'Sent {total_sent} emails, {total_failed} failed.'))
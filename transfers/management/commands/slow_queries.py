@@ -0,0 +1,35 @@
+import json
+from django.core.management.base import BaseCommand
+from transfers import slowlog
+
+class Command(BaseCommand):
+    help = 'Shows the statements of the slow-query log that took the most total time.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=10, help='Number of fingerprints to show.')
+        parser.add_argument('--json', action='store_true', help='Print the offenders as JSON.')
+        parser.add_argument('--clear', action='store_true', help='Empty the log after printing it.')
+
+    def handle(self, *args, **options):
+        offenders = slowlog.top_offenders(options['limit'])
+        if options['json']:
+            self.stdout.write(json.dumps(offenders, indent=2))
+        else:
+            self.print_offenders(offenders)
+        if options['clear']:
+            slowlog.clear()
+
+    def print_offenders(self, offenders):
+        if not offenders:
+            self.stdout.write('The slow-query log is empty.')
+        for n, offender in enumerate(offenders, start=1):
+            self.stdout.write(self.style.WARNING(
+                f"{n}. {offender['fingerprint']}  total={offender['total_ms']:.1f}ms  calls={offender['calls']}  "
+                f"mean={offender['mean_ms']:.1f}ms  max={offender['max_ms']:.1f}ms"
+            ))
+            self.stdout.write(f"   {offender['sql']}")
+            for site in offender['call_sites']:
+                self.stdout.write(f'   at {site}')
+            if offender['plan']:
+                for line in offender['plan'].splitlines():
+                    self.stdout.write(f'   | {line}')
@@ -0,0 +1,152 @@
+"""
+Per-request performance figures and their per-route aggregates.
+
+RequestTimingMiddleware opens a RequestStats for every request. SQL queries
+are counted and timed through a database execute wrapper, serializers add the
+time spent in to_representation(), and the middleware adds the total time
+and response size. The figures are sent back in a Server-Timing header and
+folded into histograms per route (the URL name, e.g. 'transfer-list'), which
+/metrics serves in the Prometheus text format.
+
+The histograms live in the process: with several workers each one exposes
+its own, and Prometheus should scrape every worker (or sum them by instance).
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+_current = ContextVar('transfers_request_stats', default=None)
+
+
+class RequestStats:
+    __slots__ = ('queries', 'db_seconds', 'serialize_seconds', 'serialize_depth')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.serialize_seconds = 0.0
+        self.serialize_depth = 0
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_seconds += time.perf_counter() - started
+            self.queries += 1
+
+
+def current():
+    """
+    The RequestStats of the request being served, or None.
+    """
+    return _current.get()
+
+
+@contextmanager
+def collect():
+    stats = RequestStats()
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def serializing():
+    """
+    Add the time spent inside the block to the serializer time of the
+    request. Nested serializers are only counted once, by the outermost one.
+    """
+    stats = _current.get()
+    if stats is None:
+        yield
+        return
+    stats.serialize_depth += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.serialize_depth -= 1
+        if not stats.serialize_depth:
+            stats.serialize_seconds += time.perf_counter() - started
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        # labels -> [count per bucket (+Inf last), sum]
+        self.series = {}
+
+    def observe(self, labels, value):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series.setdefault(labels, [[0] * (len(self.buckets) + 1), 0.0])
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for labels, (counts, total) in sorted(self.series.items()):
+            label_text = ','.join(f'{key}="{value}"' for key, value in labels)
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{label_text}}} {total}')
+            lines.append(f'{self.name}_count{{{label_text}}} {cumulative}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.duration = Histogram('transfers_request_duration_seconds', 'Time spent serving the request.', DURATION_BUCKETS)
+            self.db = Histogram('transfers_request_db_seconds', 'Time spent in SQL queries.', DURATION_BUCKETS)
+            self.serialize = Histogram('transfers_request_serialize_seconds', 'Time spent in serializers.', DURATION_BUCKETS)
+            self.queries = Histogram('transfers_request_queries', 'SQL queries run by the request.', QUERY_BUCKETS)
+            self.size = Histogram('transfers_response_size_bytes', 'Size of the response body.', SIZE_BUCKETS)
+
+    def observe(self, route, method, status_code, stats, seconds, size):
+        labels = (('route', route), ('method', method))
+        with self.lock:
+            self.duration.observe(labels + (('status', str(status_code)),), seconds)
+            self.db.observe(labels, stats.db_seconds)
+            self.serialize.observe(labels, stats.serialize_seconds)
+            self.queries.observe(labels, stats.queries)
+            if size is not None:
+                self.size.observe(labels, size)
+
+    def render(self):
+        with self.lock:
+            lines = []
+            for histogram in (self.duration, self.db, self.serialize, self.queries, self.size):
+                lines.extend(histogram.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def server_timing(stats, seconds):
+    """
+    Server-Timing header value for a finished request, durations in ms.
+    """
+    return ', '.join([
+        f'db;dur={stats.db_seconds * 1000:.2f};desc="{stats.queries} queries"',
+        f'serialize;dur={stats.serialize_seconds * 1000:.2f}',
+        f'total;dur={seconds * 1000:.2f}',
+    ])
@@ -0,0 +1,31 @@
+import time
+from contextlib import ExitStack
+
+from django.db import connections
+
+from . import metrics
+
+
+class RequestTimingMiddleware:
+    """
+    Measure every request (queries, serializer time, total time, response
+    size), report it in a Server-Timing header and add it to the /metrics
+    histograms. Place it first so the total covers the other middleware.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        with metrics.collect() as stats, ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(stats.record_query))
+            response = self.get_response(request)
+        seconds = time.perf_counter() - started
+
+        match = request.resolver_match
+        route = match.view_name if match else 'unmatched'
+        size = None if response.streaming else len(response.content)
+        metrics.registry.observe(route, request.method, response.status_code, stats, seconds, size)
+        response['Server-Timing'] = metrics.server_timing(stats, seconds)
+        return response
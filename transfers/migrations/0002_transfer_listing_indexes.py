@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transfers', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transfer',
+            index=models.Index(fields=['scheduled_start_time', 'id'], name='transfer_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transfer',
+            index=models.Index(fields=['client', 'scheduled_start_time'], name='transfer_client_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transfer',
+            index=models.Index(fields=['operator', 'scheduled_start_time'], name='transfer_operator_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transfer',
+            index=models.Index(fields=['status', 'actual_end_time'], name='transfer_status_end_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:46
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def fill_rollups(apps, schema_editor):
+    Transfer = apps.get_model('transfers', 'Transfer')
+    DailyRollup = apps.get_model('transfers', 'DailyRollup')
+    totals = (
+        Transfer.objects.filter(status='Completato', actual_end_time__isnull=False)
+        .annotate(day=TruncDate('actual_end_time'))
+        .order_by()
+        .values('day')
+        .annotate(count=Count('id'), total_value=Sum('service_value'), total_cost=Sum('service_cost'))
+    )
+    DailyRollup.objects.bulk_create([
+        DailyRollup(
+            date=row['day'],
+            count=row['count'],
+            total_value=row['total_value'] or Decimal('0.00'),
+            total_cost=row['total_cost'] or Decimal('0.00'),
+        )
+        for row in totals
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transfers', '0003_email_outbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('count', models.IntegerField(default=0)),
+                ('total_value', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('total_cost', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+            ],
+        ),
+        migrations.RunPython(fill_rollups, migrations.RunPython.noop),
+    ]
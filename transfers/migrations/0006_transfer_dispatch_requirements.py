@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transfers', '0005_geocode_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transfer',
+            name='passengers',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='transfer',
+            name='requested_service_class',
+            field=models.CharField(blank=True, choices=[('Auto', 'Auto'), ('Van', 'Van'), ('Minibus', 'Minibus'), ('Bus', 'Bus')], help_text='Classe di veicolo richiesta, vuoto per qualsiasi', max_length=10),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:22
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transfers', '0006_transfer_dispatch_requirements'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model_name', models.CharField(max_length=30)),
+                ('object_id', models.BigIntegerField()),
+                ('reason', models.CharField(choices=[('Eliminato', 'Eliminato'), ('Spostato', 'Spostato')], default='Eliminato', max_length=10)),
+                ('client_id', models.BigIntegerField(blank=True, null=True)),
+                ('operator_id', models.BigIntegerField(blank=True, null=True)),
+                ('requester_id', models.BigIntegerField(blank=True, null=True)),
+                ('deleted_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='servicerequest',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='transfer',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='servicerequest',
+            index=models.Index(fields=['updated_at', 'id'], name='request_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='servicerequest',
+            index=models.Index(fields=['requester', 'updated_at', 'id'], name='request_requester_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transfer',
+            index=models.Index(fields=['updated_at', 'id'], name='transfer_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transfer',
+            index=models.Index(fields=['client', 'updated_at', 'id'], name='transfer_client_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transfer',
+            index=models.Index(fields=['operator', 'updated_at', 'id'], name='transfer_operator_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['model_name', 'deleted_at'], name='tombstone_model_deleted_idx'),
+        ),
+    ]
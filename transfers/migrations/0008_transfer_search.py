@@ -0,0 +1,74 @@
+from django.db import migrations
+
+# The index as it was at this migration; later changes to transfers.search
+# must come with their own migration instead of rewriting this one
+SQLITE_INDEX = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS transfers_transfer_fts USING fts5(
+        start_location, end_location, notes, deviations,
+        content='transfers_transfer', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS transfers_transfer_fts_insert AFTER INSERT ON transfers_transfer BEGIN
+        INSERT INTO transfers_transfer_fts(rowid, start_location, end_location, notes, deviations)
+        VALUES (new.id, new.start_location, new.end_location, new.notes, new.deviations);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS transfers_transfer_fts_delete AFTER DELETE ON transfers_transfer BEGIN
+        INSERT INTO transfers_transfer_fts(transfers_transfer_fts, rowid, start_location, end_location, notes, deviations)
+        VALUES ('delete', old.id, old.start_location, old.end_location, old.notes, old.deviations);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS transfers_transfer_fts_update
+        AFTER UPDATE OF start_location, end_location, notes, deviations ON transfers_transfer BEGIN
+        INSERT INTO transfers_transfer_fts(transfers_transfer_fts, rowid, start_location, end_location, notes, deviations)
+        VALUES ('delete', old.id, old.start_location, old.end_location, old.notes, old.deviations);
+        INSERT INTO transfers_transfer_fts(rowid, start_location, end_location, notes, deviations)
+        VALUES (new.id, new.start_location, new.end_location, new.notes, new.deviations);
+    END""",
+    "INSERT INTO transfers_transfer_fts(transfers_transfer_fts) VALUES ('rebuild')",
+]
+SQLITE_DROP = [
+    'DROP TRIGGER IF EXISTS transfers_transfer_fts_insert',
+    'DROP TRIGGER IF EXISTS transfers_transfer_fts_delete',
+    'DROP TRIGGER IF EXISTS transfers_transfer_fts_update',
+    'DROP TABLE IF EXISTS transfers_transfer_fts',
+]
+
+PG_VECTOR = (
+    "setweight(to_tsvector('simple', coalesce(start_location, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(end_location, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(notes, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(deviations, '')), 'B')"
+)
+POSTGRES_INDEX = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    f'CREATE INDEX IF NOT EXISTS transfer_search_vector_idx ON transfers_transfer USING gin (({PG_VECTOR}))',
+    'CREATE INDEX IF NOT EXISTS transfer_start_trgm_idx ON transfers_transfer USING gin (start_location gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS transfer_end_trgm_idx ON transfers_transfer USING gin (end_location gin_trgm_ops)',
+]
+POSTGRES_DROP = [
+    'DROP INDEX IF EXISTS transfer_search_vector_idx',
+    'DROP INDEX IF EXISTS transfer_start_trgm_idx',
+    'DROP INDEX IF EXISTS transfer_end_trgm_idx',
+]
+
+
+def create_index(apps, schema_editor):
+    statements = {'sqlite': SQLITE_INDEX, 'postgresql': POSTGRES_INDEX}.get(schema_editor.connection.vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_index(apps, schema_editor):
+    statements = {'sqlite': SQLITE_DROP, 'postgresql': POSTGRES_DROP}.get(schema_editor.connection.vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transfers', '0007_delta_sync'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
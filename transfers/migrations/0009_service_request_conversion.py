@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# SQLite rebuilds transfers_transfer to add the unique column, dropping the
+# search triggers of 0008_transfer_search: put them back and reindex
+SQLITE_RESTORE_INDEX = [
+    """CREATE TRIGGER IF NOT EXISTS transfers_transfer_fts_insert AFTER INSERT ON transfers_transfer BEGIN
+        INSERT INTO transfers_transfer_fts(rowid, start_location, end_location, notes, deviations)
+        VALUES (new.id, new.start_location, new.end_location, new.notes, new.deviations);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS transfers_transfer_fts_delete AFTER DELETE ON transfers_transfer BEGIN
+        INSERT INTO transfers_transfer_fts(transfers_transfer_fts, rowid, start_location, end_location, notes, deviations)
+        VALUES ('delete', old.id, old.start_location, old.end_location, old.notes, old.deviations);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS transfers_transfer_fts_update
+        AFTER UPDATE OF start_location, end_location, notes, deviations ON transfers_transfer BEGIN
+        INSERT INTO transfers_transfer_fts(transfers_transfer_fts, rowid, start_location, end_location, notes, deviations)
+        VALUES ('delete', old.id, old.start_location, old.end_location, old.notes, old.deviations);
+        INSERT INTO transfers_transfer_fts(rowid, start_location, end_location, notes, deviations)
+        VALUES (new.id, new.start_location, new.end_location, new.notes, new.deviations);
+    END""",
+    "INSERT INTO transfers_transfer_fts(transfers_transfer_fts) VALUES ('rebuild')",
+]
+
+
+def restore_search_index(apps, schema_editor):
+    # Postgres adds the column in place and keeps its indexes
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in SQLITE_RESTORE_INDEX:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transfers', '0008_transfer_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='servicerequest',
+            name='passengers',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='servicerequest',
+            name='requested_service_class',
+            field=models.CharField(choices=[('Auto', 'Auto'), ('Van', 'Van'), ('Minibus', 'Minibus'), ('Bus', 'Bus')], default='Auto', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='servicerequest',
+            name='service_type',
+            field=models.CharField(choices=[('Transfer A-B', 'Transfer A-B'), ('Disposizione Oraria', 'Disposizione Oraria')], default='Transfer A-B', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='transfer',
+            name='service_request',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='transfer', to='transfers.servicerequest'),
+        ),
+        migrations.RunPython(restore_search_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transfers', '0009_service_request_conversion'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='servicerequest',
+            index=models.Index(fields=['requested_datetime', 'id'], name='request_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='servicerequest',
+            index=models.Index(fields=['requester', 'requested_datetime', 'id'], name='request_requester_time_idx'),
+        ),
+    ]
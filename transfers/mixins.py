@@ -0,0 +1,161 @@
+import hashlib
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from . import versions
+from .models import Tombstone
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+class ConditionalListMixin:
+    """
+    Answer list requests with an ETag derived from the version stamps of the
+    scopes the list depends on, and with 304 Not Modified when the client
+    already holds that version, without running the queryset or serializer.
+
+    Viewsets list their scopes in `version_scopes` or `get_version_scopes()`.
+    """
+    version_scopes = ()
+
+    def get_version_scopes(self):
+        return list(self.version_scopes)
+
+    def get_list_etag(self, request):
+        stamps = versions.get_versions(self.get_version_scopes())
+        # The same URL gives different results to different users
+        key = '|'.join([str(request.user.pk), request.get_full_path(), *stamps])
+        return f'"{hashlib.sha1(key.encode()).hexdigest()}"'
+
+    def list(self, request, *args, **kwargs):
+        etag = self.get_list_etag(request)
+        if_none_match = request.headers.get('If-None-Match', '')
+        if etag in [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        response = super().list(request, *args, **kwargs)
+        response['ETag'] = etag
+        return response
+
+
+class CachedResponseMixin:
+    """
+    Read-through cache of list and detail responses in Django's cache.
+
+    Entries are keyed on the URL (query parameters included) and on the
+    version stamps of the viewset's scopes: the list depends on every scope
+    in `version_scopes`, a detail only on '<scope>:<pk>'. Writes bump those
+    stamps, so stale entries are never read again and simply expire.
+    """
+    cache_timeout = getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 3600)
+
+    def get_version_scopes(self):
+        return list(self.version_scopes)
+
+    def get_detail_version_scopes(self):
+        lookup = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        return [f'{scope}:{lookup}' for scope in self.version_scopes]
+
+    def cached_response(self, request, scopes, handler, *args, **kwargs):
+        stamps = versions.get_versions(scopes)
+        key = 'transfers:response:' + hashlib.sha1('|'.join([request.get_full_path(), *stamps]).encode()).hexdigest()
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(key, response.data, self.cache_timeout)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, self.get_version_scopes(), super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, self.get_detail_version_scopes(), super().retrieve, *args, **kwargs)
+
+
+class DeltaSyncMixin:
+    """
+    `GET <list>/sync/?since=<watermark>` returns the rows of get_queryset()
+    changed after the watermark, oldest first, and the ids the reader must
+    drop (tombstones from get_tombstones()), so reconnecting clients only
+    download what changed. Without `since` every row is returned.
+
+    The watermark is the (updated_at, id) of the last row sent, so pages
+    resume exactly where they stopped: keep calling with the returned
+    `watermark` while `has_more` is true. Tombstones are kept for
+    SYNC_TOMBSTONE_RETENTION_DAYS; an older watermark gets 410 and the
+    client starts over without `since`.
+
+    updated_at and deleted_at are stamped before the transaction commits, so
+    a change can become visible after a later one was sent. Only changes
+    older than SYNC_SAFETY_LAG_SECONDS are served and the watermark never
+    goes past that horizon: transactions shorter than the lag are never missed.
+    """
+    sync_page_size = 500
+
+    def get_tombstones(self):
+        """
+        The tombstones of the rows this viewset lists. Override to restrict
+        them to the ones the user could see.
+        """
+        return Tombstone.objects.filter(model_name=self.get_queryset().model._meta.model_name)
+
+    @staticmethod
+    def encode_watermark(moment, pk):
+        return f'{(moment - EPOCH) // timedelta(microseconds=1)}-{pk}'
+
+    @staticmethod
+    def decode_watermark(watermark):
+        micros, pk = watermark.split('-')
+        return EPOCH + timedelta(microseconds=int(micros)), int(pk)
+
+    @action(detail=False, methods=['get'])
+    def sync(self, request):
+        horizon = timezone.now() - timedelta(seconds=getattr(settings, 'SYNC_SAFETY_LAG_SECONDS', 5))
+        rows = self.get_queryset().filter(updated_at__lte=horizon).order_by('updated_at', 'id')
+        tombstones = self.get_tombstones().filter(deleted_at__lte=horizon)
+        since = request.query_params.get('since')
+        moment = None
+        if since:
+            try:
+                moment, pk = self.decode_watermark(since)
+            except ValueError:
+                return Response({'since': ['Watermark non valido.']}, status=status.HTTP_400_BAD_REQUEST)
+            retention = timedelta(days=getattr(settings, 'SYNC_TOMBSTONE_RETENTION_DAYS', 30))
+            if moment < timezone.now() - retention:
+                return Response({'since': ['Watermark troppo vecchio, risincronizza da capo.']}, status=status.HTTP_410_GONE)
+            rows = rows.filter(Q(updated_at__gt=moment) | Q(updated_at=moment, id__gt=pk))
+            tombstones = tombstones.filter(deleted_at__gt=moment)
+        else:
+            # A full download has nothing to delete
+            tombstones = tombstones.none()
+
+        page = list(rows[:self.sync_page_size + 1])
+        has_more = len(page) > self.sync_page_size
+        page = page[:self.sync_page_size]
+        buried = list(tombstones.values_list('object_id', 'deleted_at'))
+        # A row sent as changed is in the reader's view again
+        changed_ids = {row.pk for row in page}
+        deleted = sorted({object_id for object_id, _ in buried if object_id not in changed_ids})
+
+        if has_more:
+            watermark = self.encode_watermark(page[-1].updated_at, page[-1].pk)
+        elif moment is None or moment < horizon:
+            # Everything up to the horizon was sent, and nothing after it
+            watermark = self.encode_watermark(horizon, 0)
+        else:
+            watermark = since
+
+        return Response({
+            'changed': self.get_serializer(page, many=True).data,
+            'deleted': deleted,
+            'watermark': watermark,
+            'has_more': has_more,
+        })
@@ -1,7 +1,10 @@
-from django.db import models
+from contextlib import nullcontext
+from django.db import IntegrityError, models, transaction
 from django.contrib.auth.models import AbstractUser
 from django.conf import settings
-from django.core.mail import send_mail
+from django.utils import timezone
+from decimal import Decimal
+from . import distance, pricing, versions
 
 class User(AbstractUser):
     ROLE_CHOICES = (
@@ -75,6 +78,10 @@ class Transfer(models.Model):
     scheduled_start_time = models.DateTimeField()
     scheduled_duration_hours = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
 
+    # Requirements used when dispatching the transfer to a vehicle
+    requested_service_class = models.CharField(max_length=10, choices=Vehicle.SERVICE_CLASS_CHOICES, blank=True, help_text="Classe di veicolo richiesta, vuoto per qualsiasi")
+    passengers = models.PositiveIntegerField(default=1)
+
     actual_start_time = models.DateTimeField(null=True, blank=True)
     actual_end_time = models.DateTimeField(null=True, blank=True)
 
@@ -84,62 +91,177 @@ class Transfer(models.Model):
     service_value = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, help_text="Prezzo finale per il cliente")
     service_cost = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, help_text="Compenso per l'operatore")
 
-    def calculate_pricing(self):
-        # Calculate pricing only if it hasn't been set yet and we have a vehicle
-        if self.vehicle and (self.service_value is None or self.service_cost is None):
-            try:
-                price_info = PriceList.objects.get(
-                    service_class=self.vehicle.service_class,
-                    service_type=self.service_type
-                )
+    # Set when the transfer was created from an approved service request; unique, so a request converts once
+    service_request = models.OneToOneField('ServiceRequest', on_delete=models.SET_NULL, null=True, blank=True, related_name='transfer')
+
+    updated_at = models.DateTimeField(auto_now=True)
 
-                # Calculate service_value (for the client)
-                if self.service_type == 'Disposizione Oraria' and self.scheduled_duration_hours and price_info.price_per_hour:
-                    self.service_value = self.scheduled_duration_hours * price_info.price_per_hour
-                elif self.service_type == 'Transfer A-B' and price_info.price_per_km:
-                    # This is a placeholder for distance calculation.
-                    # In a real app, you would use an external API like Google Maps.
-                    # For now, we'll use a base fee + a dummy distance calculation.
-                    base_fee = 25.00 # Example base fee
-                    dummy_distance_km = 15.0 # Example distance
-                    self.service_value = base_fee + (float(price_info.price_per_km) * dummy_distance_km)
-
-                # Calculate service_cost (for the operator)
-                self.service_cost = price_info.operator_rate
-
-            except PriceList.DoesNotExist:
+    class Meta:
+        indexes = [
+            # Listings paginated by scheduled start time (unscoped for admins, role-scoped otherwise)
+            models.Index(fields=['scheduled_start_time', 'id'], name='transfer_start_idx'),
+            models.Index(fields=['client', 'scheduled_start_time'], name='transfer_client_start_idx'),
+            models.Index(fields=['operator', 'scheduled_start_time'], name='transfer_operator_start_idx'),
+            # Completed transfers by day (daily report)
+            models.Index(fields=['status', 'actual_end_time'], name='transfer_status_end_idx'),
+            # Delta sync: rows changed after a watermark (unscoped for admins, role-scoped otherwise)
+            models.Index(fields=['updated_at', 'id'], name='transfer_updated_idx'),
+            models.Index(fields=['client', 'updated_at', 'id'], name='transfer_client_updated_idx'),
+            models.Index(fields=['operator', 'updated_at', 'id'], name='transfer_operator_updated_idx'),
+        ]
+
+    def calculate_pricing(self, distance_km=None):
+        # Calculate pricing only if it hasn't been set yet and we know the service class:
+        # the vehicle's, or the requested one until a vehicle is assigned.
+        # Batch callers can pass the A-B distance they computed for many routes at once.
+        service_class = self.vehicle.service_class if self.vehicle else self.requested_service_class
+        if service_class and (self.service_value is None or self.service_cost is None):
+            # Rates come from the in-process rate table, not a query per transfer
+            price_info = pricing.get_price_list(service_class, self.service_type)
+            if price_info is None:
                 # If no pricing is found, default to 0
                 self.service_value = self.service_value or 0
                 self.service_cost = self.service_cost or 0
+                return
+
+            # Calculate service_value (for the client)
+            if self.service_type == 'Disposizione Oraria' and self.scheduled_duration_hours and price_info.price_per_hour:
+                self.service_value = self.scheduled_duration_hours * price_info.price_per_hour
+            elif self.service_type == 'Transfer A-B' and price_info.price_per_km:
+                # Base fee + distance, from the geocode cache and distance matrix
+                base_fee = Decimal('25.00') # Example base fee
+                if distance_km is None:
+                    distance_km = distance.route_distance_km(self.start_location, self.end_location)
+                self.service_value = (base_fee + price_info.price_per_km * distance_km).quantize(Decimal('0.01'))
+
+            # Calculate service_cost (for the operator)
+            self.service_cost = price_info.operator_rate
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the loaded values so save() can detect changes without a query
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        self._remember_loaded_values(fields)
+
+    def _remember_loaded_values(self, fields=None):
+        """
+        Record the current value of `fields` (all loaded fields by default)
+        as the value stored in the database.
+        """
+        loaded_values = getattr(self, '_loaded_values', None) or {}
+        for field in self._meta.concrete_fields:
+            if fields is not None and field.name not in fields and field.attname not in fields:
+                continue
+            if field.attname in self.__dict__:
+                loaded_values[field.attname] = self.__dict__[field.attname]
+        self._loaded_values = loaded_values
+
+    def get_changed_fields(self):
+        """
+        Return the names of the fields that differ from the values loaded from
+        the database, or None if the instance wasn't loaded from it.
+        """
+        loaded_values = getattr(self, '_loaded_values', None)
+        if loaded_values is None:
+            return None
+        changed = []
+        for field in self._meta.concrete_fields:
+            if field.primary_key:
+                continue
+            if field.attname in loaded_values:
+                if self.__dict__.get(field.attname) != loaded_values[field.attname]:
+                    changed.append(field.name)
+            elif field.attname in self.__dict__:
+                # Deferred when loaded but assigned since, so it must be written
+                changed.append(field.name)
+        return changed
+
+    # Fields that decide how a transfer counts towards its DailyRollup
+    ROLLUP_FIELDS = ('status', 'actual_end_time', 'service_value', 'service_cost')
+
+    @staticmethod
+    def rollup_entry(values):
+        """
+        Return the (day, value, cost) that a transfer with the given field
+        values adds to the daily rollup, or None if it doesn't count.
+        """
+        if values.get('status') != 'Completato' or values.get('actual_end_time') is None:
+            return None
+        return (
+            timezone.localdate(values['actual_end_time']),
+            Decimal(str(values.get('service_value') or 0)),
+            Decimal(str(values.get('service_cost') or 0)),
+        )
 
     def save(self, *args, **kwargs):
-        # Keep track of the original status to detect changes
-        original_status = None
+        # Keep track of the stored status, value and cost to detect changes
+        stored = None
+        loaded_values = getattr(self, '_loaded_values', None)
         if self.pk:
-            try:
-                original_status = Transfer.objects.get(pk=self.pk).status
-            except Transfer.DoesNotExist:
-                pass # Object is new, so no original status
+            if loaded_values is not None and all(field in loaded_values for field in self.ROLLUP_FIELDS):
+                stored = {field: loaded_values[field] for field in self.ROLLUP_FIELDS}
+            else:
+                # Instance built by hand with a pk: the stored values are unknown
+                stored = Transfer.objects.filter(pk=self.pk).values(*self.ROLLUP_FIELDS).first()
+        original_status = stored['status'] if stored else None
 
         # Calculate pricing on creation
         if not self.pk:
             self.calculate_pricing()
 
-        super().save(*args, **kwargs)
-
-        # Send notification if status changed to 'Confermato'
-        if self.status == 'Confermato' and original_status != 'Confermato':
-            try:
-                send_mail(
-                    f'Transfer {self.id} Confermato',
-                    f'Ciao {self.client.first_name},\n\nIl tuo transfer da {self.start_location} a {self.end_location} è stato confermato.\n\nGrazie.',
-                    'noreply@transferapp.com',
-                    [self.client.email],
-                    fail_silently=False,
+        # Only write the columns that changed since the instance was loaded
+        if (
+            not args
+            and kwargs.get('update_fields') is None
+            and not kwargs.get('force_insert')
+            and not self._state.adding
+            and loaded_values is not None
+        ):
+            kwargs['update_fields'] = self.get_changed_fields()
+        if kwargs.get('update_fields'):
+            # auto_now only reaches the row if the column is written
+            kwargs['update_fields'] = [*(field for field in kwargs['update_fields'] if field != 'updated_at'), 'updated_at']
+
+        # Values the row will hold once saved
+        update_fields = kwargs.get('update_fields')
+        written = {
+            field: self.__dict__[field]
+            if field in self.__dict__ and (update_fields is None or field in update_fields)
+            else (stored or {}).get(field)
+            for field in self.ROLLUP_FIELDS
+        }
+        old_entry = self.rollup_entry(stored or {})
+        new_entry = self.rollup_entry(written)
+
+        # Queue a notification if status changed to 'Confermato'. The email and
+        # the rollup changes are written in the same transaction as the transfer,
+        # so they only take effect if the change is actually committed.
+        notify = self.status == 'Confermato' and original_status != 'Confermato'
+        with transaction.atomic() if notify or old_entry != new_entry else nullcontext():
+            super().save(*args, **kwargs)
+
+            if old_entry != new_entry:
+                if old_entry and new_entry and old_entry[0] == new_entry[0]:
+                    DailyRollup.add(new_entry[0], 0, new_entry[1] - old_entry[1], new_entry[2] - old_entry[2])
+                else:
+                    if old_entry:
+                        DailyRollup.add(old_entry[0], -1, -old_entry[1], -old_entry[2])
+                    if new_entry:
+                        DailyRollup.add(new_entry[0], 1, new_entry[1], new_entry[2])
+
+            if notify and self.client.email:
+                EmailOutbox.objects.create(
+                    subject=f'Transfer {self.id} Confermato',
+                    body=f'Ciao {self.client.first_name},\n\nIl tuo transfer da {self.start_location} a {self.end_location} è stato confermato.\n\nGrazie.',
+                    from_email='noreply@transferapp.com',
+                    recipients=self.client.email,
                 )
-            except Exception as e:
-                # In a real app, log this error
-                print(f"Failed to send confirmation email for Transfer {self.id}: {e}")
+        self._remember_loaded_values(update_fields)
 
     def __str__(self):
         return f"Transfer {self.id} per {self.client.username} - {self.status}"
@@ -154,10 +276,25 @@ class ServiceRequest(models.Model):
     start_location = models.CharField(max_length=255)
     end_location = models.CharField(max_length=255)
     requested_datetime = models.DateTimeField()
+    # Copied to the transfer the request is converted into
+    service_type = models.CharField(max_length=20, choices=Transfer.SERVICE_TYPE_CHOICES, default='Transfer A-B')
+    requested_service_class = models.CharField(max_length=10, choices=Vehicle.SERVICE_CLASS_CHOICES, default='Auto')
+    passengers = models.PositiveIntegerField(default=1)
     status = models.CharField(max_length=15, choices=STATUS_CHOICES, default='In Attesa')
     # For dual approval
     client_approved = models.BooleanField(default=False)
     admin_approved = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Delta sync: rows changed after a watermark (unscoped for admins, per requester otherwise)
+            models.Index(fields=['updated_at', 'id'], name='request_updated_idx'),
+            models.Index(fields=['requester', 'updated_at', 'id'], name='request_requester_updated_idx'),
+            # Listings paginated by requested time (unscoped for admins, per requester otherwise)
+            models.Index(fields=['requested_datetime', 'id'], name='request_time_idx'),
+            models.Index(fields=['requester', 'requested_datetime', 'id'], name='request_requester_time_idx'),
+        ]
 
     def __str__(self):
         return f"Richiesta da {self.requester.username} - {self.status}"
@@ -170,3 +307,106 @@ class DailyReport(models.Model):
 
     def __str__(self):
         return f"Report per il {self.date}"
+
+class DailyRollup(models.Model):
+    """
+    Running totals of the transfers completed on each day, kept up to date
+    on every status, value or cost change of a Transfer.
+    """
+    date = models.DateField(unique=True)
+    count = models.IntegerField(default=0)
+    total_value = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    total_cost = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+
+    @classmethod
+    def add(cls, day, count, value, cost):
+        """
+        Atomically add to the totals of `day`, creating its row if needed.
+        """
+        increments = {
+            'count': models.F('count') + count,
+            'total_value': models.F('total_value') + value,
+            'total_cost': models.F('total_cost') + cost,
+        }
+        # Updated with queries that bypass the model signals
+        versions.bump(['rollups'])
+        if cls.objects.filter(date=day).update(**increments):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(date=day, count=count, total_value=value, total_cost=cost)
+        except IntegrityError:
+            # Created concurrently by another transaction
+            cls.objects.filter(date=day).update(**increments)
+
+    def __str__(self):
+        return f"Totali del {self.date}"
+
+class EmailOutbox(models.Model):
+    """
+    Emails waiting to be delivered by the `send_queued_emails` command.
+    """
+    STATUS_CHOICES = (
+        ('In Coda', 'In Coda'),
+        ('Inviato', 'Inviato'),
+        ('Fallito', 'Fallito'),  # Dead letter: gave up after too many attempts
+    )
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255)
+    recipients = models.TextField(help_text="Indirizzi separati da virgola")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='In Coda')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"Email {self.id} a {self.recipients} - {self.status}"
+
+class GeocodeCache(models.Model):
+    """
+    Coordinates of the addresses already geocoded, keyed by normalized address.
+    """
+    address = models.CharField(max_length=255, unique=True)
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.address} ({self.latitude}, {self.longitude})"
+
+
+class Tombstone(models.Model):
+    """
+    A row that left the view of some readers, kept so delta sync can tell
+    them to drop it: deleted ('Eliminato') or moved to another client or
+    operator ('Spostato'). The ids are plain integers so a tombstone
+    outlives the users it names.
+    """
+    REASON_CHOICES = (
+        ('Eliminato', 'Eliminato'),
+        ('Spostato', 'Spostato'),
+    )
+    model_name = models.CharField(max_length=30)
+    object_id = models.BigIntegerField()
+    reason = models.CharField(max_length=10, choices=REASON_CHOICES, default='Eliminato')
+    # Readers of the row: for 'Spostato' only the ones who lost it
+    client_id = models.BigIntegerField(null=True, blank=True)
+    operator_id = models.BigIntegerField(null=True, blank=True)
+    requester_id = models.BigIntegerField(null=True, blank=True)
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['model_name', 'deleted_at'], name='tombstone_model_deleted_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.model_name} {self.object_id} - {self.reason}"
@@ -0,0 +1,101 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import EmailOutbox
+
+# Retry policy, overridable from settings
+MAX_ATTEMPTS = getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 5)
+RETRY_BASE_SECONDS = getattr(settings, 'EMAIL_OUTBOX_RETRY_BASE_SECONDS', 60)
+RETRY_MAX_SECONDS = getattr(settings, 'EMAIL_OUTBOX_RETRY_MAX_SECONDS', 3600)
+# How long a worker owns the emails it claimed
+LEASE_SECONDS = getattr(settings, 'EMAIL_OUTBOX_LEASE_SECONDS', 300)
+
+
+def retry_delay(attempts):
+    """
+    Exponential backoff after the given number of failed attempts.
+    """
+    return timedelta(seconds=min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS))
+
+
+def record_failure(email, error, max_attempts):
+    email.attempts += 1
+    email.last_error = str(error)
+    if email.attempts >= max_attempts:
+        email.status = 'Fallito'
+    else:
+        email.next_attempt_at = timezone.now() + retry_delay(email.attempts)
+    email.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at'])
+
+
+def claim_batch(batch_size):
+    """
+    Lease up to `batch_size` due emails to this worker and return them.
+
+    The claim is a short transaction of its own: pushing next_attempt_at past
+    the lease hides the rows from the other workers, so the locks are released
+    before any mail is sent. Emails of a worker that dies mid-batch become due
+    again once the lease expires.
+    """
+    with transaction.atomic():
+        batch = list(
+            EmailOutbox.objects
+            .select_for_update(skip_locked=True)
+            .filter(status='In Coda', next_attempt_at__lte=timezone.now())
+            .order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        if batch:
+            EmailOutbox.objects.filter(pk__in=[email.pk for email in batch]).update(
+                next_attempt_at=timezone.now() + timedelta(seconds=LEASE_SECONDS)
+            )
+    return batch
+
+
+def deliver_batch(batch_size=100, max_attempts=MAX_ATTEMPTS):
+    """
+    Deliver up to `batch_size` due emails over a single mail connection.
+
+    The emails are claimed first (see claim_batch), then sent outside any
+    transaction, each outcome being saved as it happens. If the connection
+    can't be opened every claimed email counts as a failed attempt.
+    Returns a (sent, failed) tuple.
+    """
+    sent = failed = 0
+    batch = claim_batch(batch_size)
+    if not batch:
+        return sent, failed
+
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        for email in batch:
+            record_failure(email, e, max_attempts)
+        return sent, len(batch)
+    try:
+        for email in batch:
+            message = EmailMessage(
+                email.subject,
+                email.body,
+                email.from_email,
+                email.recipients.split(','),
+                connection=connection,
+            )
+            try:
+                message.send()
+            except Exception as e:
+                failed += 1
+                record_failure(email, e, max_attempts)
+            else:
+                sent += 1
+                email.attempts += 1
+                email.status = 'Inviato'
+                email.sent_at = timezone.now()
+                email.save(update_fields=['attempts', 'status', 'sent_at'])
+    finally:
+        connection.close()
+    return sent, failed
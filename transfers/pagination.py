@@ -0,0 +1,34 @@
+from rest_framework.pagination import CursorPagination
+
+
+class TransferCursorPagination(CursorPagination):
+    """
+    Keyset pagination for transfers, ordered by scheduled start time.
+    The id is used as a tie-breaker so the ordering is always deterministic,
+    and the cursor lookup is served by the composite indexes on Transfer.
+    """
+    ordering = ('scheduled_start_time', 'id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class VehicleCursorPagination(CursorPagination):
+    """
+    Keyset pagination for the fleet, in creation order.
+    """
+    ordering = ('id',)
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class ServiceRequestCursorPagination(CursorPagination):
+    """
+    Keyset pagination for service requests, the most recently requested first,
+    served by the requested time indexes on ServiceRequest.
+    """
+    ordering = ('-requested_datetime', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
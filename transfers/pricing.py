@@ -0,0 +1,52 @@
+"""
+In-process rate table for transfer pricing.
+
+The price list is tiny and rarely changes, so every worker keeps all of it
+in memory, keyed by (service_class, service_type). A version stamp shared
+through Django's cache tells each worker when its copy is stale: saving or
+deleting a PriceList bumps the stamp and every worker reloads the whole table
+with one query on its next lookup.
+"""
+import uuid
+
+from django.apps import apps
+from django.core.cache import cache
+
+VERSION_CACHE_KEY = 'transfers:pricelist:version'
+
+_rates = {}
+_version = None
+
+
+def _shared_version():
+    version = cache.get(VERSION_CACHE_KEY)
+    if version is None:
+        cache.add(VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+        version = cache.get(VERSION_CACHE_KEY)
+    return version
+
+
+def get_price_list(service_class, service_type):
+    """
+    Return the PriceList for the given service class and type, or None.
+    """
+    global _rates, _version
+    version = _shared_version()
+    # A None version means there is no usable cache, so always reload
+    if version is None or version != _version:
+        PriceList = apps.get_model('transfers', 'PriceList')
+        rates = {}
+        # Iterate newest first so the oldest entry wins on duplicates
+        for price_list in PriceList.objects.order_by('-id'):
+            rates[(price_list.service_class, price_list.service_type)] = price_list
+        _rates, _version = rates, version
+    return _rates.get((service_class, service_type))
+
+
+def invalidate():
+    """
+    Mark the rate table as stale in this and every other worker.
+    """
+    global _version
+    _version = None
+    cache.set(VERSION_CACHE_KEY, uuid.uuid4().hex, None)
@@ -0,0 +1,177 @@
+"""
+Full-text search of transfers by location, notes and deviations.
+
+The index depends on the database:
+- SQLite: an FTS5 table over transfers_transfer (external content, so the
+  text isn't stored twice), kept in sync by triggers. The triggers also see
+  bulk_create(), bulk_update() and queryset updates, which skip the signals.
+- PostgreSQL: a GIN index on a weighted tsvector of the same columns, plus
+  trigram indexes on the locations for infix matches ('iumicino'). Both are
+  expression indexes, so Postgres keeps them up to date itself.
+
+Every word of the query is matched as a prefix ('fium aer' finds 'Aeroporto
+Fiumicino'), and results are ranked with locations weighing more than notes.
+Only the newest CANDIDATES matches are ranked, so common words stay fast.
+Other databases fall back to an unindexed icontains scan.
+
+SQLite drops a table's triggers when a migration rebuilds the table (e.g.
+altering a column): run `python manage.py rebuild_search_index` after such
+a migration.
+"""
+import re
+
+from django.core.exceptions import EmptyResultSet
+from django.db import connection
+from django.db.models import Q
+
+FTS_TABLE = 'transfers_transfer_fts'
+MAX_TERMS = 8
+# Matches ranked per query, newest first: a word found in a large share of
+# the rows (a busy airport) would otherwise have every match scored
+CANDIDATES = 1000
+
+# Must be the exact expression of transfer_search_vector_idx for Postgres to use it
+PG_VECTOR = (
+    "setweight(to_tsvector('simple', coalesce(start_location, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(end_location, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(notes, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(deviations, '')), 'B')"
+)
+
+SQLITE_INDEX = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        start_location, end_location, notes, deviations,
+        content='transfers_transfer', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS transfers_transfer_fts_insert AFTER INSERT ON transfers_transfer BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, start_location, end_location, notes, deviations)
+        VALUES (new.id, new.start_location, new.end_location, new.notes, new.deviations);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS transfers_transfer_fts_delete AFTER DELETE ON transfers_transfer BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, start_location, end_location, notes, deviations)
+        VALUES ('delete', old.id, old.start_location, old.end_location, old.notes, old.deviations);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS transfers_transfer_fts_update
+        AFTER UPDATE OF start_location, end_location, notes, deviations ON transfers_transfer BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, start_location, end_location, notes, deviations)
+        VALUES ('delete', old.id, old.start_location, old.end_location, old.notes, old.deviations);
+        INSERT INTO {FTS_TABLE}(rowid, start_location, end_location, notes, deviations)
+        VALUES (new.id, new.start_location, new.end_location, new.notes, new.deviations);
+    END""",
+    # Index the rows that are already there
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+SQLITE_DROP = [
+    'DROP TRIGGER IF EXISTS transfers_transfer_fts_insert',
+    'DROP TRIGGER IF EXISTS transfers_transfer_fts_delete',
+    'DROP TRIGGER IF EXISTS transfers_transfer_fts_update',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+]
+
+POSTGRES_INDEX = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    f'CREATE INDEX IF NOT EXISTS transfer_search_vector_idx ON transfers_transfer USING gin (({PG_VECTOR}))',
+    'CREATE INDEX IF NOT EXISTS transfer_start_trgm_idx ON transfers_transfer USING gin (start_location gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS transfer_end_trgm_idx ON transfers_transfer USING gin (end_location gin_trgm_ops)',
+]
+POSTGRES_DROP = [
+    'DROP INDEX IF EXISTS transfer_search_vector_idx',
+    'DROP INDEX IF EXISTS transfer_start_trgm_idx',
+    'DROP INDEX IF EXISTS transfer_end_trgm_idx',
+]
+
+
+def create_index(schema_editor):
+    statements = {'sqlite': SQLITE_INDEX, 'postgresql': POSTGRES_INDEX}.get(schema_editor.connection.vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_index(schema_editor):
+    statements = {'sqlite': SQLITE_DROP, 'postgresql': POSTGRES_DROP}.get(schema_editor.connection.vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def terms(query):
+    """
+    The words of `query`, lowercased; punctuation and operators are dropped,
+    so user input can't break the match syntax.
+    """
+    return re.findall(r'\w+', query.lower())[:MAX_TERMS]
+
+
+def scope(queryset):
+    """
+    SQL and params selecting the ids of `queryset`, or None if it isn't filtered.
+    """
+    if not queryset.query.where:
+        return None
+    return queryset.order_by().values('pk').query.sql_with_params()
+
+
+def ranked_ids(queryset, query, limit):
+    """
+    [(id, rank)] of the rows of `queryset` matching `query`, best first.
+    """
+    words = terms(query)
+    if not words or queryset.query.is_empty():
+        return []
+    try:
+        restriction = scope(queryset)
+    except EmptyResultSet:
+        return []
+    vendor = connection.vendor
+    if vendor == 'sqlite':
+        match = ' '.join(f'"{word}"*' for word in words)
+        sql = f'SELECT rowid, -bm25({FTS_TABLE}, 10.0, 10.0, 1.0, 1.0) AS score FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s'
+        params = [match]
+        if restriction:
+            # The + keeps SQLite from rerunning the MATCH once per id of the scope
+            sql += f' AND +rowid IN ({restriction[0]})'
+            params.extend(restriction[1])
+        sql = f'SELECT * FROM ({sql} ORDER BY rowid DESC LIMIT %s) ORDER BY score DESC, rowid DESC LIMIT %s'
+        params.append(CANDIDATES)
+    elif vendor == 'postgresql':
+        phrase = ' '.join(words)
+        pattern = '%' + phrase.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        sql = (
+            f"SELECT id, ts_rank({PG_VECTOR}, tsquery) + greatest("
+            f"similarity(start_location, %s), similarity(coalesce(end_location, ''), %s)) AS score "
+            f"FROM transfers_transfer, to_tsquery('simple', %s) AS tsquery "
+            f"WHERE ({PG_VECTOR} @@ tsquery OR start_location ILIKE %s OR end_location ILIKE %s)"
+        )
+        params = [phrase, phrase, ' & '.join(f'{word}:*' for word in words), pattern, pattern]
+        if restriction:
+            sql += f' AND id IN ({restriction[0]})'
+            params.extend(restriction[1])
+        sql = f'SELECT * FROM ({sql} ORDER BY id DESC LIMIT %s) AS candidates ORDER BY score DESC, id DESC LIMIT %s'
+        params.append(CANDIDATES)
+    else:
+        condition = Q()
+        for word in words:
+            condition &= (
+                Q(start_location__icontains=word) | Q(end_location__icontains=word)
+                | Q(notes__icontains=word) | Q(deviations__icontains=word)
+            )
+        ids = queryset.filter(condition).order_by('-scheduled_start_time').values_list('pk', flat=True)[:limit]
+        return [(pk, None) for pk in ids]
+    params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def search(queryset, query, limit=20):
+    """
+    The rows of `queryset` matching `query`, best first, each with a `rank`.
+    """
+    ranks = dict(ranked_ids(queryset, query, limit))
+    rows = queryset.in_bulk(list(ranks))
+    results = []
+    for pk, rank in ranks.items():
+        if pk in rows:
+            rows[pk].rank = rank
+            results.append(rows[pk])
+    return results
@@ -1,7 +1,16 @@
 from rest_framework import serializers
-from .models import User, Vehicle, PriceList, Transfer, ServiceRequest, DailyReport
+from . import metrics
+from .models import User, Vehicle, PriceList, Transfer, ServiceRequest, DailyReport, DailyRollup
 
-class UserSerializer(serializers.ModelSerializer):
+class TimedModelSerializer(serializers.ModelSerializer):
+    """
+    ModelSerializer that reports its time to the request metrics
+    """
+    def to_representation(self, instance):
+        with metrics.serializing():
+            return super().to_representation(instance)
+
+class UserSerializer(TimedModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'first_name', 'last_name', 'role', 'associated_client', 'password']
@@ -13,17 +22,17 @@ class UserSerializer(serializers.ModelSerializer):
         user = User.objects.create_user(**validated_data)
         return user
 
-class VehicleSerializer(serializers.ModelSerializer):
+class VehicleSerializer(TimedModelSerializer):
     class Meta:
         model = Vehicle
         fields = '__all__'
 
-class PriceListSerializer(serializers.ModelSerializer):
+class PriceListSerializer(TimedModelSerializer):
     class Meta:
         model = PriceList
         fields = '__all__'
 
-class TransferSerializer(serializers.ModelSerializer):
+class TransferSerializer(TimedModelSerializer):
     # Use nested serializers or string relations to provide more meaningful representations
     client = serializers.ReadOnlyField(source='client.username')
     operator = serializers.ReadOnlyField(source='operator.username', allow_null=True)
@@ -33,15 +42,24 @@ class TransferSerializer(serializers.ModelSerializer):
     class Meta:
         model = Transfer
         fields = '__all__'
+        read_only_fields = ['service_request']
 
-class ServiceRequestSerializer(serializers.ModelSerializer):
+class ServiceRequestSerializer(TimedModelSerializer):
     requester = serializers.ReadOnlyField(source='requester.username')
+    transfer = serializers.PrimaryKeyRelatedField(read_only=True)
 
     class Meta:
         model = ServiceRequest
         fields = '__all__'
+        # Changed only by the approve/reject actions
+        read_only_fields = ['status', 'client_approved', 'admin_approved']
 
-class DailyReportSerializer(serializers.ModelSerializer):
+class DailyReportSerializer(TimedModelSerializer):
     class Meta:
         model = DailyReport
         fields = '__all__'
+
+class DailyRollupSerializer(TimedModelSerializer):
+    class Meta:
+        model = DailyRollup
+        fields = ['date', 'count', 'total_value', 'total_cost']
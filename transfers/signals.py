@@ -0,0 +1,160 @@
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from rest_framework.authtoken.models import Token
+
+from . import authentication, availability, events, pricing, slowlog, versions
+from .models import DailyReport, DailyRollup, PriceList, ServiceRequest, Tombstone, Transfer, User, Vehicle
+
+
+@receiver([post_save, post_delete], sender=PriceList)
+def invalidate_rate_table(sender, **kwargs):
+    # Invalidate right away for this worker, and again once the change is
+    # committed so other workers can't cache the pre-commit table.
+    pricing.invalidate()
+    transaction.on_commit(pricing.invalidate)
+
+
+@receiver(post_delete, sender=Transfer)
+def remove_from_daily_rollup(sender, instance, **kwargs):
+    loaded_values = getattr(instance, '_loaded_values', None) or {}
+    entry = Transfer.rollup_entry({
+        field: loaded_values.get(field, getattr(instance, field))
+        for field in Transfer.ROLLUP_FIELDS
+    })
+    if entry:
+        DailyRollup.add(entry[0], -1, -entry[1], -entry[2])
+
+
+@receiver(post_save, sender=Transfer)
+def invalidate_availability_on_save(sender, instance, created, **kwargs):
+    loaded_values = getattr(instance, '_loaded_values', None)
+    if not created and loaded_values is not None and all(
+        loaded_values.get(field) == instance.__dict__.get(field, loaded_values.get(field))
+        for field in availability.TRACKED_FIELDS
+    ):
+        return
+    resources = [('vehicle', instance.vehicle_id), ('operator', instance.operator_id)]
+    if loaded_values is not None:
+        # The transfer may have moved away from its previous vehicle or operator
+        resources += [('vehicle', loaded_values.get('vehicle_id')), ('operator', loaded_values.get('operator_id'))]
+    availability.invalidate(resources)
+
+
+@receiver(post_delete, sender=Transfer)
+def invalidate_availability_on_delete(sender, instance, **kwargs):
+    availability.invalidate([('vehicle', instance.vehicle_id), ('operator', instance.operator_id)])
+
+
+@receiver([post_save, post_delete], sender=Transfer)
+def bump_transfer_versions(sender, instance, **kwargs):
+    loaded_values = getattr(instance, '_loaded_values', None) or {}
+    # Both the previous and the current client and operator see the change
+    versions.bump(versions.transfer_scopes(
+        client_ids=[instance.client_id, loaded_values.get('client_id')],
+        operator_ids=[instance.operator_id, loaded_values.get('operator_id')],
+    ))
+
+
+@receiver(post_save, sender=Transfer)
+def publish_transfer_saved(sender, instance, created, update_fields=None, **kwargs):
+    loaded_values = getattr(instance, '_loaded_values', None) or {}
+    events.publish_transfer(
+        'created' if created else 'updated', instance,
+        changed=None if created or update_fields is None else set(update_fields) - {'updated_at'},
+        previous_client_id=loaded_values.get('client_id'),
+        previous_operator_id=loaded_values.get('operator_id'),
+    )
+
+
+@receiver(post_delete, sender=Transfer)
+def publish_transfer_deleted(sender, instance, **kwargs):
+    events.publish_transfer('deleted', instance)
+
+
+@receiver(post_delete, sender=Transfer)
+def bury_deleted_transfer(sender, instance, **kwargs):
+    Tombstone.objects.create(
+        model_name='transfer', object_id=instance.pk,
+        client_id=instance.client_id, operator_id=instance.operator_id,
+    )
+
+
+@receiver(post_save, sender=Transfer)
+def bury_moved_transfer(sender, instance, created, **kwargs):
+    loaded_values = getattr(instance, '_loaded_values', None)
+    if created or loaded_values is None:
+        return
+    # A client or operator the transfer was taken from must drop it on sync
+    previous_client_id = loaded_values.get('client_id', instance.client_id)
+    previous_operator_id = loaded_values.get('operator_id', instance.operator_id)
+    moved_from_client = previous_client_id if previous_client_id != instance.client_id else None
+    moved_from_operator = previous_operator_id if previous_operator_id != instance.operator_id else None
+    if moved_from_client or moved_from_operator:
+        Tombstone.objects.create(
+            model_name='transfer', object_id=instance.pk, reason='Spostato',
+            client_id=moved_from_client, operator_id=moved_from_operator,
+        )
+
+
+@receiver(post_delete, sender=ServiceRequest)
+def bury_deleted_request(sender, instance, **kwargs):
+    Tombstone.objects.create(model_name='servicerequest', object_id=instance.pk, requester_id=instance.requester_id)
+
+
+@receiver([post_save, post_delete], sender=ServiceRequest)
+def bump_request_versions(sender, instance, **kwargs):
+    versions.bump(versions.request_scopes([instance.requester_id]))
+
+
+@receiver([post_save, post_delete], sender=User)
+def bump_user_versions(sender, instance, update_fields=None, **kwargs):
+    # Logging in only updates last_login, which no list shows
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    versions.bump(['users'])
+
+
+@receiver([post_save, post_delete], sender=Vehicle)
+def bump_vehicle_versions(sender, instance, **kwargs):
+    versions.bump(['vehicles', f'vehicles:{instance.pk}'])
+
+
+@receiver([post_save, post_delete], sender=PriceList)
+def bump_price_versions(sender, instance, **kwargs):
+    versions.bump(['prices', f'prices:{instance.pk}'])
+
+
+@receiver([post_save, post_delete], sender=DailyRollup)
+def bump_rollup_versions(sender, **kwargs):
+    # DailyRollup.add() updates with queries and bumps on its own; this covers model saves
+    versions.bump(['rollups'])
+
+
+@receiver([post_save, post_delete], sender=DailyReport)
+@receiver(m2m_changed, sender=DailyReport.completed_transfers.through)
+def bump_report_versions(sender, **kwargs):
+    versions.bump(['reports'])
+
+
+@receiver(post_delete, sender=Token)
+def revoke_cached_token(sender, instance, **kwargs):
+    authentication.forget_token(instance.key)
+
+
+@receiver([post_save, post_delete], sender=User)
+def revoke_cached_user(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    # Role or status changes must apply to the next request
+    authentication.forget_user(instance.pk)
+    if getattr(instance, '_password', None) is not None:
+        # set_password() was called: sign the user out everywhere
+        Token.objects.filter(user=instance).delete()
+
+
+@receiver(connection_created)
+def install_slow_query_log(sender, connection, **kwargs):
+    slowlog.install(connection)
@@ -0,0 +1,197 @@
+"""
+Slow-query log.
+
+An execute wrapper installed on every database connection times each
+statement. Those taking at least SLOW_QUERY_THRESHOLD_MS are recorded with
+their fingerprint (the SQL with literals and IN lists collapsed, so every run
+of the same query shares it), the project line that ran them and, for
+SELECTs, the EXPLAIN plan, captured once per fingerprint.
+
+Entries go to a ring buffer of SLOW_QUERY_LOG_SIZE slots in Django's cache, so
+with a shared cache backend the admin page and the slow_queries command see
+the queries of every worker. SLOW_QUERY_THRESHOLD_MS = None turns it off.
+"""
+import hashlib
+import logging
+import re
+import threading
+import time
+import traceback
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+CACHE_PREFIX = 'transfers:slowlog:'
+PLAN_TIMEOUT = 60 * 60
+PROJECT_ROOT = str(Path(__file__).resolve().parent.parent)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN\s*\((?:\s*(?:%s|\?|\d+(?:\.\d+)?|\'\?\')\s*,?)+\)', re.IGNORECASE)
+_SPACES = re.compile(r'\s+')
+
+logger = logging.getLogger(__name__)
+
+# Set while this module runs its own queries, so they aren't logged
+_local = threading.local()
+
+
+def threshold():
+    value = getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', 200)
+    return None if value is None else value / 1000
+
+
+def log_size():
+    return getattr(settings, 'SLOW_QUERY_LOG_SIZE', 200)
+
+
+def normalize(sql):
+    """
+    The SQL of a statement with its literal values replaced, e.g.
+    `WHERE id IN (1, 2, 3) AND code = 'x'` -> `WHERE id IN (...) AND code = ?`.
+    """
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _SPACES.sub(' ', sql).strip()
+
+
+def fingerprint(normalized_sql):
+    return hashlib.sha1(normalized_sql.encode()).hexdigest()[:12]
+
+
+def call_site():
+    """
+    The innermost project line (outside this module) on the current stack.
+    """
+    for frame in reversed(traceback.extract_stack()[:-2]):
+        filename = frame.filename
+        if filename.startswith(PROJECT_ROOT) and '-packages' not in filename and filename != __file__:
+            return f'{Path(filename).relative_to(PROJECT_ROOT)}:{frame.lineno} in {frame.name}'
+    return None
+
+
+def explain(connection, sql, params):
+    """
+    The plan of `sql`, or why it couldn't be had; never raises.
+    """
+    prefix = connection.ops.explain_query_prefix()
+    try:
+        with connection.cursor() as cursor:
+            # Use the driver's cursor, so the EXPLAIN doesn't count as a query of the request
+            # and raises the driver's own errors
+            raw = cursor.cursor
+            # A failed statement would abort the enclosing transaction on PostgreSQL
+            if connection.in_atomic_block:
+                raw.execute('SAVEPOINT slowlog_explain')
+            try:
+                raw.execute(f'{prefix} {sql}', params)
+                return '\n'.join(' '.join(str(value) for value in row) for row in raw.fetchall())
+            except Exception:
+                if connection.in_atomic_block:
+                    raw.execute('ROLLBACK TO SAVEPOINT slowlog_explain')
+                raise
+            finally:
+                if connection.in_atomic_block:
+                    raw.execute('RELEASE SAVEPOINT slowlog_explain')
+    except Exception as error:
+        return f'EXPLAIN failed: {error}'
+
+
+def record(connection, sql, params, seconds, failed=False):
+    normalized = normalize(sql)
+    key = fingerprint(normalized)
+    plan = None
+    # No plan for a statement that raised, or in a transaction that must be rolled back
+    if not failed and not connection.needs_rollback and sql.lstrip()[:6].upper() == 'SELECT':
+        plan_key = f'{CACHE_PREFIX}plan:{key}'
+        plan = cache.get(plan_key)
+        if plan is None:
+            plan = explain(connection, sql, params)
+            cache.set(plan_key, plan, PLAN_TIMEOUT)
+
+    cache.add(f'{CACHE_PREFIX}next', 0, None)
+    slot = (cache.incr(f'{CACHE_PREFIX}next') - 1) % log_size()
+    cache.set(f'{CACHE_PREFIX}entry:{slot}', {
+        'fingerprint': key,
+        'sql': normalized,
+        'duration_ms': round(seconds * 1000, 3),
+        'at': timezone.now().isoformat(),
+        'call_site': call_site(),
+        'database': connection.alias,
+        'plan': plan,
+    }, None)
+
+
+def log_slow_queries(execute, sql, params, many, context):
+    limit = threshold()
+    if limit is None or getattr(_local, 'busy', False):
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    failed = True
+    try:
+        result = execute(sql, params, many, context)
+        failed = False
+        return result
+    finally:
+        seconds = time.perf_counter() - started
+        if seconds >= limit:
+            _local.busy = True
+            try:
+                record(context['connection'], sql, None if many else params, seconds, failed)
+            except Exception:
+                # Logging must never fail the query or hide its own exception
+                logger.exception('Could not record a slow query')
+            finally:
+                _local.busy = False
+
+
+def install(connection):
+    if log_slow_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(log_slow_queries)
+
+
+def entries():
+    """
+    Every entry in the buffer, newest first.
+    """
+    found = cache.get_many([f'{CACHE_PREFIX}entry:{slot}' for slot in range(log_size())])
+    return sorted(found.values(), key=lambda entry: entry['at'], reverse=True)
+
+
+def top_offenders(limit=10):
+    """
+    Entries grouped by fingerprint, the highest total time first.
+    """
+    groups = {}
+    for entry in entries():
+        group = groups.setdefault(entry['fingerprint'], {
+            'fingerprint': entry['fingerprint'],
+            'sql': entry['sql'],
+            'plan': entry['plan'],
+            'calls': 0,
+            'total_ms': 0.0,
+            'max_ms': 0.0,
+            'call_sites': Counter(),
+            'last_at': entry['at'],
+        })
+        group['calls'] += 1
+        group['total_ms'] += entry['duration_ms']
+        group['max_ms'] = max(group['max_ms'], entry['duration_ms'])
+        if entry['call_site']:
+            group['call_sites'][entry['call_site']] += 1
+    offenders = sorted(groups.values(), key=lambda group: group['total_ms'], reverse=True)[:limit]
+    for group in offenders:
+        group['total_ms'] = round(group['total_ms'], 3)
+        group['mean_ms'] = round(group['total_ms'] / group['calls'], 3)
+        group['call_sites'] = [site for site, _ in group['call_sites'].most_common()]
+    return offenders
+
+
+def clear():
+    cache.delete_many(
+        [f'{CACHE_PREFIX}next'] + [f'{CACHE_PREFIX}entry:{slot}' for slot in range(log_size())]
+    )
@@ -1,10 +1,30 @@
-from django.test import TestCase
+import asyncio
+import csv
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timezone as dt_timezone
+from unittest import mock
+from asgiref.sync import sync_to_async
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import DatabaseError, connection
 from django.core import mail
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.utils import timezone
+from rest_framework.authtoken.models import Token
 from rest_framework.test import APITestCase
 from rest_framework import status
-from .models import User, Vehicle, PriceList, Transfer, ServiceRequest
+from .models import User, Vehicle, PriceList, Transfer, ServiceRequest, DailyReport, DailyRollup, EmailOutbox, GeocodeCache, Tombstone
+from . import approvals, availability, conversion, distance, dispatch, events, metrics, outbox, search, slowlog
+from .mixins import DeltaSyncMixin
+from .importer import import_transfers
 from decimal import Decimal
+from io import StringIO
 
 class TransferAppLogicTests(TestCase):
     def setUp(self):
@@ -51,6 +71,10 @@ class TransferAppLogicTests(TestCase):
         transfer.status = 'Confermato'
         transfer.save()
 
+        # The email is queued and delivered by the outbox worker
+        self.assertEqual(len(mail.outbox), 0)
+        call_command('send_queued_emails', stdout=StringIO())
+
         self.assertEqual(len(mail.outbox), 1)
         self.assertEqual(mail.outbox[0].subject, f'Transfer {transfer.id} Confermato')
         self.assertIn('Il tuo transfer da A a B è stato confermato', mail.outbox[0].body)
@@ -78,9 +102,9 @@ class TransferAppAPITests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
         # Check that only request1 is in the response
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]['id'], self.request1.id)
-        self.assertNotEqual(response.data[0]['id'], self.request2.id)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['id'], self.request1.id)
+        self.assertNotEqual(response.data['results'][0]['id'], self.request2.id)
 
     def test_unauthenticated_user_cannot_access_api(self):
         """
@@ -88,3 +112,1443 @@ class TransferAppAPITests(APITestCase):
         """
         response = self.client.get('/api/vehicles/')
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_transfer_list_is_cursor_paginated(self):
+        """
+        Ensure the transfer list is paginated by cursor in scheduled start order.
+        """
+        start = timezone.now()
+        for i in range(3):
+            Transfer.objects.create(
+                client=self.client1,
+                service_type='Transfer A-B',
+                start_location=f'Start {i}',
+                scheduled_start_time=start - timezone.timedelta(hours=i),
+            )
+        self.client.force_authenticate(user=self.client1)
+
+        response = self.client.get('/api/transfers/', {'page_size': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([t['start_location'] for t in response.data['results']], ['Start 2', 'Start 1'])
+        self.assertIsNotNone(response.data['next'])
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual([t['start_location'] for t in response.data['results']], ['Start 0'])
+        self.assertIsNone(response.data['next'])
+
+
+class QueryBudgetTests(APITestCase):
+    """
+    Every list endpoint must run a fixed number of queries per role, no matter
+    how many rows it returns. The dataset is grown between two measurements so
+    that a serializer field which triggers a per-row query fails here.
+    """
+    # role -> endpoint -> number of queries
+    QUERY_BUDGETS = {
+        'Amministratore': {
+            '/api/users/': 1,
+            '/api/vehicles/': 1,
+            '/api/prices/': 1,
+            '/api/transfers/': 1,
+            '/api/requests/': 1,
+            '/api/reports/': 2,
+            '/api/rollups/': 1,
+            '/api/bootstrap/': 1,
+        },
+        'Cliente': {
+            '/api/vehicles/': 1,
+            '/api/prices/': 1,
+            '/api/transfers/': 1,
+            '/api/requests/': 1,
+            '/api/reports/': 2,
+            '/api/bootstrap/': 1,
+        },
+        'Operatore': {
+            '/api/vehicles/': 1,
+            '/api/transfers/': 1,
+            '/api/requests/': 1,
+            '/api/bootstrap/': 1,
+        },
+    }
+
+    def setUp(self):
+        self.users = {
+            'Amministratore': User.objects.create_superuser('admin', 'admin@test.com', 'password123', role='Amministratore'),
+            'Cliente': User.objects.create_user(username='client', password='password123', role='Cliente'),
+            'Operatore': User.objects.create_user(username='operator', password='password123', role='Operatore'),
+        }
+        self.end_user = User.objects.create_user(username='enduser', password='password123', associated_client=self.users['Cliente'])
+        self.rows = 0
+
+    def seed(self, count):
+        """
+        Add `count` rows of every kind, all linked to the users above.
+        """
+        for _ in range(count):
+            self.rows += 1
+            vehicle = Vehicle.objects.create(service_class='Van', license_plate=f'QB-{self.rows}', capacity=8)
+            PriceList.objects.create(service_class='Van', service_type='Transfer A-B', price_per_km=Decimal('1.50'), operator_rate=Decimal('30.00'))
+            transfer = Transfer.objects.create(
+                client=self.users['Cliente'],
+                operator=self.users['Operatore'],
+                end_user=self.end_user,
+                vehicle=vehicle,
+                service_type='Transfer A-B',
+                start_location='A',
+                end_location='B',
+                scheduled_start_time=timezone.now(),
+                service_value=Decimal('47.50'),
+                service_cost=Decimal('30.00'),
+            )
+            for requester in self.users.values():
+                ServiceRequest.objects.create(requester=requester, start_location='A', end_location='B', requested_datetime=timezone.now())
+            report = DailyReport.objects.create(
+                date=timezone.now().date() - timezone.timedelta(days=self.rows),
+                total_value=Decimal('0.00'),
+                total_cost=Decimal('0.00'),
+            )
+            report.completed_transfers.add(transfer)
+
+    def assertQueryBudget(self, user, url, budget):
+        """
+        Assert that GET `url` as `user` runs exactly `budget` queries.
+        """
+        self.client.force_authenticate(user=user)
+        # Measure the cold path, not a cached response
+        cache.clear()
+        with self.assertNumQueries(budget):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response
+
+    def test_list_endpoints_stay_within_query_budget(self):
+        for rows in (2, 8):
+            self.seed(rows - self.rows)
+            for role, budgets in self.QUERY_BUDGETS.items():
+                for url, budget in budgets.items():
+                    with self.subTest(role=role, url=url, rows=rows):
+                        self.assertQueryBudget(self.users[role], url, budget)
+
+
+class TransferChangeTrackingTests(TestCase):
+    def setUp(self):
+        self.client_user = User.objects.create_user(username='client', password='password123', role='Cliente', email='client@test.com')
+        self.transfer = Transfer.objects.create(
+            client=self.client_user,
+            service_type='Transfer A-B',
+            start_location='A',
+            end_location='B',
+            scheduled_start_time=timezone.now(),
+        )
+
+    def test_status_update_runs_a_single_query(self):
+        """
+        Saving a loaded transfer must not re-read it to find the old status.
+        """
+        transfer = Transfer.objects.get(pk=self.transfer.pk)
+        transfer.status = 'In Corso'
+        with self.assertNumQueries(1):
+            transfer.save()
+        self.assertEqual(Transfer.objects.get(pk=transfer.pk).status, 'In Corso')
+
+    def test_save_only_writes_changed_columns(self):
+        """
+        Ensure a concurrent change to another column isn't overwritten.
+        """
+        transfer = Transfer.objects.get(pk=self.transfer.pk)
+        Transfer.objects.filter(pk=transfer.pk).update(notes='Edited elsewhere')
+
+        transfer.status = 'Confermato'
+        transfer.save()
+
+        stored = Transfer.objects.get(pk=transfer.pk)
+        self.assertEqual(stored.status, 'Confermato')
+        self.assertEqual(stored.notes, 'Edited elsewhere')
+
+    def test_confirmation_email_is_sent_once(self):
+        transfer = Transfer.objects.get(pk=self.transfer.pk)
+        transfer.status = 'Confermato'
+        transfer.save()
+        transfer.notes = 'Flight delayed'
+        transfer.save()
+
+        self.assertEqual(EmailOutbox.objects.count(), 1)
+
+
+class EmailOutboxTests(TestCase):
+    def setUp(self):
+        for i in range(3):
+            EmailOutbox.objects.create(subject=f'Email {i}', body='Body', from_email='noreply@transferapp.com', recipients='client@test.com')
+
+    def test_queued_emails_are_sent_over_one_connection(self):
+        with mock.patch('transfers.outbox.get_connection', wraps=mail.get_connection) as get_connection:
+            call_command('send_queued_emails', stdout=StringIO())
+
+        get_connection.assert_called_once()
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertFalse(EmailOutbox.objects.exclude(status='Inviato').exists())
+
+        # Running the worker again must not send anything twice
+        call_command('send_queued_emails', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_failed_emails_are_retried_then_dead_lettered(self):
+        with mock.patch('django.core.mail.EmailMessage.send', side_effect=OSError('SMTP down')):
+            call_command('send_queued_emails', stdout=StringIO())
+            email = EmailOutbox.objects.first()
+            self.assertEqual(email.status, 'In Coda')
+            self.assertEqual(email.attempts, 1)
+            self.assertGreater(email.next_attempt_at, timezone.now())
+
+            # Make the retry due immediately until the attempts run out
+            for _ in range(4):
+                EmailOutbox.objects.update(next_attempt_at=timezone.now())
+                call_command('send_queued_emails', stdout=StringIO())
+
+        self.assertEqual(EmailOutbox.objects.filter(status='Fallito').count(), 3)
+        self.assertEqual(EmailOutbox.objects.first().last_error, 'SMTP down')
+
+    def test_unreachable_server_counts_as_a_failed_attempt(self):
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.open', side_effect=ConnectionRefusedError('refused')):
+            call_command('send_queued_emails', stdout=StringIO())
+        for email in EmailOutbox.objects.all():
+            self.assertEqual((email.status, email.attempts, email.last_error), ('In Coda', 1, 'refused'))
+            self.assertGreater(email.next_attempt_at, timezone.now())
+
+    def test_claimed_emails_are_hidden_from_other_workers(self):
+        claims = []
+        with mock.patch('django.core.mail.EmailMessage.send', side_effect=lambda: claims.append(outbox.claim_batch(10))):
+            call_command('send_queued_emails', stdout=StringIO())
+        # Every claim made while the batch was being sent found nothing
+        self.assertEqual(claims, [[], [], []])
+        self.assertFalse(EmailOutbox.objects.exclude(status='Inviato').exists())
+
+
+class PricingRateTableTests(TestCase):
+    def setUp(self):
+        self.vehicle = Vehicle.objects.create(service_class='Van', license_plate='RATE-1', capacity=8)
+        self.pricelist = PriceList.objects.create(
+            service_class='Van',
+            service_type='Transfer A-B',
+            price_per_km=Decimal('1.10'),
+            operator_rate=Decimal('30.00')
+        )
+
+    def new_transfer(self):
+        return Transfer(vehicle=self.vehicle, service_type='Transfer A-B', start_location='A', end_location='B')
+
+    def test_pricing_runs_no_queries_once_warm(self):
+        self.new_transfer().calculate_pricing()
+
+        transfer = self.new_transfer()
+        with self.assertNumQueries(0):
+            transfer.calculate_pricing()
+        # 25.00 + 1.10 * 15 km, computed exactly in Decimal
+        self.assertEqual(transfer.service_value, Decimal('41.50'))
+        self.assertIsInstance(transfer.service_value, Decimal)
+
+    def test_price_list_changes_invalidate_the_table(self):
+        self.new_transfer().calculate_pricing()
+
+        self.pricelist.price_per_km = Decimal('2.00')
+        self.pricelist.save()
+        transfer = self.new_transfer()
+        transfer.calculate_pricing()
+        self.assertEqual(transfer.service_value, Decimal('55.00'))
+
+        self.pricelist.delete()
+        transfer = self.new_transfer()
+        transfer.calculate_pricing()
+        self.assertEqual(transfer.service_value, 0)
+
+
+class TransferImportTests(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@test.com', 'password123', role='Amministratore')
+        self.client1 = User.objects.create_user(username='client1', password='password123', role='Cliente', email='client1@test.com')
+        self.vehicle = Vehicle.objects.create(service_class='Van', license_plate='IMP-1', capacity=8)
+        PriceList.objects.create(service_class='Van', service_type='Transfer A-B', price_per_km=Decimal('2.00'), operator_rate=Decimal('30.00'))
+        # Ids are reused across tests, so drop the indexes built by other tests
+        cache.clear()
+        availability.index.clear()
+
+    def upload(self, name, content):
+        return SimpleUploadedFile(name, content.encode('utf-8'))
+
+    def test_csv_import_creates_valid_rows_and_reports_errors(self):
+        csv_file = self.upload('transfers.csv', (
+            'client,vehicle,service_type,status,start_location,end_location,scheduled_start_time,scheduled_duration_hours\n'
+            'client1,IMP-1,Transfer A-B,Confermato,Airport,Hotel,2030-05-01T10:00:00Z,\n'
+            'client1,IMP-1,Teleport,,Airport,Hotel,2030-05-01T11:00:00Z,\n'
+            'nobody,IMP-1,Transfer A-B,,Airport,Hotel,2030-05-01T12:00:00Z,\n'
+            'client1,,Disposizione Oraria,,Hotel,,2030-05-01T13:00:00Z,3\n'
+        ))
+        self.client.force_authenticate(user=self.admin)
+
+        response = self.client.post('/api/transfers/import/', {'file': csv_file}, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual([error['row'] for error in response.data['errors']], [2, 3])
+        self.assertIn('service_type', response.data['errors'][0]['errors'])
+        self.assertIn('client', response.data['errors'][1]['errors'])
+
+        transfer = Transfer.objects.get(start_location='Airport')
+        self.assertEqual(transfer.service_value, Decimal('55.00'))
+        self.assertEqual(transfer.service_cost, Decimal('30.00'))
+        self.assertEqual(EmailOutbox.objects.get().recipients, 'client1@test.com')
+
+    def test_client_imports_for_themselves(self):
+        ndjson_file = self.upload('transfers.ndjson', (
+            '{"client": "admin", "service_type": "Transfer A-B", "start_location": "A", "scheduled_start_time": "2030-05-01T10:00:00Z"}\n'
+            'not json\n'
+        ))
+        self.client.force_authenticate(user=self.client1)
+
+        response = self.client.post('/api/transfers/import/', {'file': ndjson_file}, format='multipart')
+
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(response.data['errors'][0]['row'], 2)
+        self.assertEqual(Transfer.objects.get().client, self.client1)
+
+    def test_clients_cannot_assign_and_admins_cannot_double_book(self):
+        operator = User.objects.create_user(username='op1', password='password123', role='Operatore')
+        Transfer.objects.create(
+            client=self.client1, operator=operator, vehicle=self.vehicle, service_type='Transfer A-B',
+            start_location='A', scheduled_start_time=datetime(2030, 5, 1, 10, tzinfo=dt_timezone.utc),
+        )
+        ndjson_file = self.upload('transfers.ndjson', (
+            '{"operator": "op1", "vehicle": "IMP-1", "status": "Completato", "service_type": "Transfer A-B", "start_location": "A", "scheduled_start_time": "2030-05-01T10:00:00Z"}\n'
+        ))
+        self.client.force_authenticate(user=self.client1)
+        response = self.client.post('/api/transfers/import/', {'file': ndjson_file}, format='multipart')
+        self.assertEqual(response.data['created'], 0)
+        self.assertEqual(set(response.data['errors'][0]['errors']), {'operator', 'vehicle'})
+
+        ndjson_file = self.upload('transfers.ndjson', (
+            '{"client": "client1", "vehicle": "IMP-1", "service_type": "Transfer A-B", "start_location": "B", "scheduled_start_time": "2030-05-01T10:30:00Z"}\n'
+            '{"client": "client1", "operator": "op1", "service_type": "Transfer A-B", "start_location": "C", "scheduled_start_time": "2030-05-02T10:00:00Z"}\n'
+            '{"client": "client1", "operator": "op1", "service_type": "Transfer A-B", "start_location": "D", "scheduled_start_time": "2030-05-02T10:30:00Z"}\n'
+        ))
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.post('/api/transfers/import/', {'file': ndjson_file}, format='multipart')
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual([(error['row'], set(error['errors'])) for error in response.data['errors']], [(1, {'vehicle'}), (3, {'operator'})])
+        self.assertTrue(Transfer.objects.filter(start_location='C', operator=operator).exists())
+
+    def test_client_imports_route_every_row_in_one_pass(self):
+        PriceList.objects.create(service_class='Auto', service_type='Transfer A-B', price_per_km=Decimal('1.00'), operator_rate=Decimal('20.00'))
+
+        def import_rows(count, offset):
+            rows = [
+                {'service_type': 'Transfer A-B', 'requested_service_class': 'Auto', 'start_location': f'From {offset + i}',
+                 'end_location': f'To {offset + i}', 'scheduled_start_time': '2030-06-01T10:00:00Z'}
+                for i in range(count)
+            ]
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(import_transfers(rows, client=self.client1)['created'], count)
+            return len(queries)
+
+        # Vehicle-less rows are priced by their requested class, their routes resolved together
+        # Loads the rate table
+        import_rows(1, 1000)
+        few = import_rows(3, 0)
+        self.assertEqual(import_rows(30, 100), few)
+        self.assertFalse(Transfer.objects.exclude(service_value=Decimal('40.00')).exists())
+
+    def test_import_command_inserts_in_batches(self):
+        rows = ''.join(
+            f'{{"client": "client1", "vehicle": "IMP-1", "service_type": "Transfer A-B", "start_location": "A{i}", "scheduled_start_time": "2030-05-{i + 1:02d}T10:00:00Z"}}\n'
+            for i in range(25)
+        )
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson', delete=False) as f:
+            f.write(rows)
+        self.addCleanup(os.remove, f.name)
+
+        out = StringIO()
+        call_command('import_transfers', f.name, batch_size=10, stdout=out)
+
+        self.assertIn('Imported 25 transfers', out.getvalue())
+        self.assertEqual(Transfer.objects.filter(service_value=Decimal('55.00')).count(), 25)
+
+
+class DailyReportCommandTests(TestCase):
+    def setUp(self):
+        self.client_user = User.objects.create_user(username='client', password='password123', role='Cliente')
+
+    def completed_transfer(self, end_time, value, cost):
+        return Transfer.objects.create(
+            client=self.client_user,
+            service_type='Transfer A-B',
+            status='Completato',
+            start_location='A',
+            scheduled_start_time=end_time,
+            actual_end_time=end_time,
+            service_value=value,
+            service_cost=cost,
+        )
+
+    def test_yesterday_report_totals_and_transfers(self):
+        yesterday = timezone.now() - timezone.timedelta(days=1)
+        first = self.completed_transfer(yesterday, Decimal('100.00'), Decimal('40.00'))
+        second = self.completed_transfer(yesterday, Decimal('50.50'), Decimal('20.00'))
+        self.completed_transfer(timezone.now(), Decimal('999.00'), Decimal('999.00'))
+
+        call_command('generate_daily_report', stdout=StringIO())
+
+        report = DailyReport.objects.get(date=yesterday.date())
+        self.assertEqual(report.total_value, Decimal('150.50'))
+        self.assertEqual(report.total_cost, Decimal('60.00'))
+        self.assertEqual(set(report.completed_transfers.all()), {first, second})
+
+    def test_backfill_range_in_constant_queries(self):
+        start = timezone.now().replace(year=2030, month=1, day=1)
+        for day in range(30):
+            for _ in range(3):
+                self.completed_transfer(start + timezone.timedelta(days=day), Decimal('10.00'), Decimal('4.00'))
+        DailyReport.objects.create(date=start.date(), total_value=Decimal('1.00'), total_cost=Decimal('1.00'))
+
+        with self.assertNumQueries(8):
+            call_command('generate_daily_report', '--from', '2030-01-01', '--to', '2030-01-31', stdout=StringIO())
+
+        self.assertEqual(DailyReport.objects.count(), 31)
+        # The existing report is left untouched
+        self.assertEqual(DailyReport.objects.get(date=start.date()).total_value, Decimal('1.00'))
+        report = DailyReport.objects.get(date=(start + timezone.timedelta(days=29)).date())
+        self.assertEqual(report.total_value, Decimal('30.00'))
+        self.assertEqual(report.completed_transfers.count(), 3)
+        self.assertEqual(DailyReport.objects.get(date='2030-01-31').total_value, Decimal('0.00'))
+
+
+class DailyRollupTests(APITestCase):
+    def setUp(self):
+        self.client_user = User.objects.create_user(username='client', password='password123', role='Cliente')
+        self.end_time = timezone.now().replace(year=2030, month=3, day=10, hour=12)
+        self.transfer = Transfer.objects.create(
+            client=self.client_user,
+            service_type='Transfer A-B',
+            start_location='A',
+            scheduled_start_time=self.end_time,
+            service_value=Decimal('80.00'),
+            service_cost=Decimal('30.00'),
+        )
+
+    def assertRollup(self, day, count, value, cost):
+        rollup = DailyRollup.objects.get(date=day)
+        self.assertEqual((rollup.count, rollup.total_value, rollup.total_cost), (count, Decimal(value), Decimal(cost)))
+
+    def test_rollup_follows_status_value_and_deletion(self):
+        day = self.end_time.date()
+        self.assertFalse(DailyRollup.objects.exists())
+
+        self.transfer.status = 'Completato'
+        self.transfer.actual_end_time = self.end_time
+        self.transfer.save()
+        self.assertRollup(day, 1, '80.00', '30.00')
+
+        transfer = Transfer.objects.get(pk=self.transfer.pk)
+        transfer.service_value = Decimal('95.00')
+        transfer.save()
+        self.assertRollup(day, 1, '95.00', '30.00')
+
+        transfer.actual_end_time = self.end_time + timezone.timedelta(days=1)
+        transfer.save()
+        self.assertRollup(day, 0, '0.00', '0.00')
+        self.assertRollup(day + timezone.timedelta(days=1), 1, '95.00', '30.00')
+
+        transfer.status = 'Annullato'
+        transfer.save()
+        self.assertRollup(day + timezone.timedelta(days=1), 0, '0.00', '0.00')
+
+        transfer.status = 'Completato'
+        transfer.save()
+        transfer.delete()
+        self.assertRollup(day + timezone.timedelta(days=1), 0, '0.00', '0.00')
+
+    def test_rollup_is_readable_by_date(self):
+        self.transfer.status = 'Completato'
+        self.transfer.actual_end_time = self.end_time
+        self.transfer.save()
+        self.client.force_authenticate(user=self.client_user)
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/rollups/2030-03-10/')
+        self.assertEqual(response.data, {'date': '2030-03-10', 'count': 1, 'total_value': '80.00', 'total_cost': '30.00'})
+
+    def test_nightly_report_repairs_drifted_rollups(self):
+        self.transfer.status = 'Completato'
+        self.transfer.actual_end_time = self.end_time
+        self.transfer.save()
+        # A queryset update bypasses save() and the rollup goes stale
+        Transfer.objects.filter(pk=self.transfer.pk).update(service_value=Decimal('90.00'))
+
+        # The count still matches, only the value total drifted
+        out = StringIO()
+        call_command('generate_daily_report', '--from', '2030-03-10', stdout=out)
+        self.assertIn('Rollup for 2030-03-10 was out of date', out.getvalue())
+        self.assertRollup(self.end_time.date(), 1, '90.00', '30.00')
+        self.assertEqual(DailyReport.objects.get().total_value, Decimal('90.00'))
+
+        DailyReport.objects.all().delete()
+        out = StringIO()
+        call_command('generate_daily_report', '--from', '2030-03-10', stdout=out)
+        self.assertNotIn('out of date', out.getvalue())
+
+
+class TransferExportTests(APITestCase):
+    def setUp(self):
+        self.client1 = User.objects.create_user(username='client1', password='password123', role='Cliente')
+        self.client2 = User.objects.create_user(username='client2', password='password123', role='Cliente')
+        self.vehicle = Vehicle.objects.create(service_class='Van', license_plate='EXP-1', capacity=8)
+        start = timezone.now().replace(year=2030, month=6, day=1, hour=9, minute=0, second=0, microsecond=0)
+        for day, status_value in enumerate(['Richiesto', 'Completato', 'Completato']):
+            Transfer.objects.create(
+                client=self.client1,
+                vehicle=self.vehicle,
+                service_type='Transfer A-B',
+                status=status_value,
+                start_location=f'Hotel {day}',
+                end_location='Airport',
+                scheduled_start_time=start + timezone.timedelta(days=day),
+                service_value=Decimal('40.00'),
+                service_cost=Decimal('15.00'),
+            )
+        Transfer.objects.create(client=self.client2, service_type='Transfer A-B', start_location='Elsewhere', scheduled_start_time=start)
+
+    def export(self, user, **params):
+        self.client.force_authenticate(user=user)
+        response = self.client.get('/api/transfers/export/', params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_csv_export_is_scoped_to_the_client(self):
+        content = self.export(self.client1)
+
+        rows = list(csv.DictReader(StringIO(content)))
+        self.assertEqual([row['start_location'] for row in rows], ['Hotel 0', 'Hotel 1', 'Hotel 2'])
+        self.assertEqual(rows[0]['client'], 'client1')
+        self.assertEqual(rows[0]['vehicle_license_plate'], 'EXP-1')
+        self.assertEqual(rows[0]['operator'], '')
+        self.assertEqual(rows[0]['scheduled_start_time'], '2030-06-01T09:00:00Z')
+
+    def test_ndjson_export_with_filters(self):
+        content = self.export(self.client1, output='ndjson', status='Completato', to='2030-06-02')
+
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['start_location'], 'Hotel 1')
+        self.assertEqual(rows[0]['service_value'], '40.00')
+        self.assertIsNone(rows[0]['operator'])
+
+
+# Local stand-in for an external geocoding provider
+STUB_COORDINATES = {
+    'roma termini': (41.9010, 12.5016),
+    'milano centrale': (45.4862, 9.2042),
+    'fiumicino airport': (41.8003, 12.2389),
+}
+stub_geocoder = mock.Mock(side_effect=STUB_COORDINATES.get)
+
+
+@override_settings(DISTANCE_GEOCODER='transfers.tests.stub_geocoder')
+class DistanceEngineTests(TestCase):
+    def setUp(self):
+        distance.matrix.clear()
+        self.addCleanup(distance.matrix.clear)
+        stub_geocoder.reset_mock()
+
+    def test_haversine_distance(self):
+        km = distance.haversine_km([41.9010, 0.0], [12.5016, 0.0], [45.4862, 0.0], [9.2042, 1.0])
+        self.assertAlmostEqual(km[0], 478.7, delta=0.5)
+        self.assertAlmostEqual(km[1], 111.2, delta=0.1)
+
+    def test_addresses_are_geocoded_once_and_cached(self):
+        routes = [('Roma Termini', 'Milano Centrale'), ('Fiumicino Airport', ' roma  termini '), ('Roma Termini', 'Nowhere')]
+
+        distances = distance.route_distances_km(routes)
+
+        self.assertAlmostEqual(float(distances[0]), 478.7, delta=0.5)
+        self.assertAlmostEqual(float(distances[1]), 23.5, delta=1.0)
+        self.assertEqual(distances[2], distance.DEFAULT_DISTANCE_KM)
+        self.assertEqual(stub_geocoder.call_count, 4)
+        self.assertEqual(GeocodeCache.objects.count(), 3)
+
+        # The matrix answers known routes without touching the database
+        with self.assertNumQueries(0):
+            distance.route_distances_km(routes)
+
+        # A new worker reads the persistent cache instead of the provider
+        distance.matrix.clear()
+        distance.route_distances_km(routes[:2])
+        self.assertEqual(stub_geocoder.call_count, 4)
+
+    def test_geocoder_failures_fall_back_and_are_retried(self):
+        stub_geocoder.side_effect = ConnectionError
+        self.addCleanup(setattr, stub_geocoder, 'side_effect', STUB_COORDINATES.get)
+        route = [('Roma Termini', 'Milano Centrale')]
+        with self.assertLogs('transfers.distance', 'WARNING'):
+            self.assertEqual(distance.route_distances_km(route), [distance.DEFAULT_DISTANCE_KM])
+
+        # Misses are remembered briefly, then asked again
+        stub_geocoder.side_effect = STUB_COORDINATES.get
+        self.assertEqual(distance.route_distances_km(route), [distance.DEFAULT_DISTANCE_KM])
+        with mock.patch('transfers.distance.time.monotonic', return_value=time.monotonic() + distance.MISS_TTL_SECONDS + 1):
+            self.assertAlmostEqual(float(distance.route_distances_km(route)[0]), 478.7, delta=0.5)
+
+    def test_matrix_evicts_least_recently_used_routes(self):
+        matrix = distance.DistanceMatrix(maxsize=2)
+        matrix.distances([('Roma Termini', 'Milano Centrale'), ('Roma Termini', 'Fiumicino Airport')])
+        matrix.distances([('Roma Termini', 'Milano Centrale')])
+        matrix.distances([('Milano Centrale', 'Fiumicino Airport')])
+
+        with self.assertNumQueries(0):
+            matrix.distances([('Roma Termini', 'Milano Centrale')])
+        with self.assertNumQueries(1):
+            matrix.distances([('Roma Termini', 'Fiumicino Airport')])
+
+    def test_ab_pricing_uses_the_route_distance(self):
+        vehicle = Vehicle.objects.create(service_class='Auto', license_plate='DIST-1', capacity=4)
+        PriceList.objects.create(service_class='Auto', service_type='Transfer A-B', price_per_km=Decimal('2.00'), operator_rate=Decimal('30.00'))
+        transfer = Transfer(vehicle=vehicle, service_type='Transfer A-B', start_location='Fiumicino Airport', end_location='Roma Termini')
+
+        transfer.calculate_pricing()
+
+        expected = Decimal('25.00') + Decimal('2.00') * distance.route_distance_km('Fiumicino Airport', 'Roma Termini')
+        self.assertEqual(transfer.service_value, expected)
+        self.assertGreater(transfer.service_value, Decimal('60.00'))
+
+
+class AvailabilityTests(APITestCase):
+    def setUp(self):
+        availability.index.clear()
+        self.admin = User.objects.create_superuser('admin', 'admin@test.com', 'password123', role='Amministratore')
+        self.client_user = User.objects.create_user(username='client', password='password123', role='Cliente')
+        self.operator = User.objects.create_user(username='operator', password='password123', role='Operatore')
+        self.vehicle = Vehicle.objects.create(service_class='Van', license_plate='AV-1', capacity=8)
+        self.start = timezone.now().replace(year=2030, month=7, day=1, hour=9, minute=0, second=0, microsecond=0)
+        self.booked = self.transfer(self.start, hours=Decimal('2.0'), vehicle=self.vehicle, operator=self.operator)
+
+    def transfer(self, start, hours=None, **kwargs):
+        return Transfer.objects.create(
+            client=self.client_user,
+            service_type='Disposizione Oraria' if hours else 'Transfer A-B',
+            start_location='A',
+            scheduled_start_time=start,
+            scheduled_duration_hours=hours,
+            service_value=Decimal('0.00'),
+            service_cost=Decimal('0.00'),
+            **kwargs
+        )
+
+    def test_interval_index_uses_half_open_intervals(self):
+        hour = timezone.timedelta(hours=1)
+        index = availability.IntervalIndex([
+            (self.start, self.start + 3 * hour, 1),
+            (self.start + 5 * hour, self.start + 6 * hour, 2),
+        ])
+        index.add(self.start + hour, self.start + 2 * hour, 3)
+
+        self.assertEqual(index.conflicts(self.start + 3 * hour, self.start + 5 * hour), [])
+        self.assertEqual(index.conflicts(self.start + hour, self.start + 4 * hour), [1, 3])
+        self.assertEqual(index.conflicts(self.start, self.start + 10 * hour, exclude=3), [1, 2])
+
+    def test_interval_index_matches_a_linear_scan(self):
+        rng = random.Random(7)
+        bookings = [(start, start + rng.randint(1, 30), n) for n, start in enumerate(rng.sample(range(500), 120))]
+        index = availability.IntervalIndex(bookings[:60])
+        for booking in bookings[60:]:
+            index.add(*booking)
+        for booking in bookings[::3]:
+            index.remove(*booking)
+        # Removing a booking that isn't there changes nothing
+        index.remove(0, 1, -1)
+        remaining = sorted(set(bookings) - set(bookings[::3]))
+        self.assertEqual(len(index), len(remaining))
+        for _ in range(200):
+            start = rng.randint(0, 540)
+            end = start + rng.randint(1, 40)
+            expected = [n for booking_start, booking_end, n in remaining if booking_start < end and booking_end > start]
+            self.assertEqual(index.conflicts(start, end), expected)
+
+    def test_assign_refuses_overlapping_bookings(self):
+        # A-B transfers without a duration occupy the default duration
+        overlapping = self.transfer(self.start + timezone.timedelta(hours=1))
+        later = self.transfer(self.start + timezone.timedelta(hours=2))
+        self.client.force_authenticate(user=self.admin)
+
+        response = self.client.post(f'/api/transfers/{overlapping.pk}/assign/', {'vehicle': self.vehicle.pk, 'operator': self.operator.pk})
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['conflicts'], {'vehicle': [self.booked.pk], 'operator': [self.booked.pk]})
+
+        response = self.client.post(f'/api/transfers/{later.pk}/assign/', {'vehicle': self.vehicle.pk, 'operator': self.operator.pk})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Transfer.objects.get(pk=later.pk).vehicle, self.vehicle)
+        self.assertFalse(availability.is_free('vehicle', self.vehicle.pk, later.scheduled_start_time, later.scheduled_start_time + timezone.timedelta(minutes=30)))
+
+    def test_index_follows_changes_to_bookings(self):
+        slot = (self.start, self.start + timezone.timedelta(hours=1))
+        self.assertFalse(availability.is_free('operator', self.operator.pk, *slot))
+
+        self.booked.status = 'Annullato'
+        self.booked.save()
+        self.assertTrue(availability.is_free('operator', self.operator.pk, *slot))
+
+    def test_schedule_update_cannot_create_a_double_booking(self):
+        other = self.transfer(self.start + timezone.timedelta(hours=4), vehicle=self.vehicle)
+        self.client.force_authenticate(user=self.admin)
+
+        response = self.client.patch(f'/api/transfers/{other.pk}/', {'scheduled_start_time': (self.start + timezone.timedelta(hours=1)).isoformat()})
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['conflicts'], {'vehicle': [str(self.booked.pk)]})
+
+
+class DispatchTests(APITestCase):
+    HOUR = 3600
+
+    def job(self, job_id, start_hour, hours=1, service_class='', passengers=1, vehicle_id=None, operator_id=None):
+        return dispatch.Job(job_id, start_hour * self.HOUR, (start_hour + hours) * self.HOUR, service_class, passengers, vehicle_id, operator_id)
+
+    def test_solver_matches_class_capacity_and_free_slots(self):
+        vehicles = [
+            dispatch.VehicleSpec(1, 'Auto', 4),
+            dispatch.VehicleSpec(2, 'Van', 8),
+            dispatch.VehicleSpec(3, 'Bus', 50),
+        ]
+        jobs = [
+            self.job(10, 9, passengers=3),
+            self.job(11, 9, passengers=3),
+            self.job(12, 9, passengers=30),
+            self.job(13, 9, service_class='Van'),
+            self.job(14, 10),
+        ]
+        # Operator 101 is already busy at 9:00
+        bookings = {('operator', 101): [(9 * self.HOUR, 10 * self.HOUR, 99)]}
+
+        result = dispatch.solve(jobs, vehicles, [100, 101, 102], bookings)
+
+        self.assertEqual(result[10][0], 1)  # Smallest vehicle that fits
+        self.assertEqual(result[11][0], 2)
+        self.assertEqual(result[12][0], 3)
+        self.assertEqual(result[13][0], None)  # The only Van is taken
+        self.assertEqual(result[14][0], 1)  # Free again at 10:00
+        self.assertNotIn(101, [result[job_id][1] for job_id in (10, 11, 12, 13)])
+        # Only operators 100 and 102 are free at 9:00
+        self.assertEqual(sorted(filter(None, (result[job_id][1] for job_id in (10, 11, 12, 13)))), [100, 102])
+
+    def test_relocation_places_blocked_transfers(self):
+        vehicles = [dispatch.VehicleSpec(1, 'Van', 8), dispatch.VehicleSpec(2, 'Van', 8)]
+        # Vehicle 2 is booked from 10:00, so greedy puts the 9:00 job on vehicle 1,
+        # where it blocks the 9:30 job that only fits on vehicle 1 (vehicle 2 is busy then)
+        bookings = {('vehicle', 2): [(int(9.75 * self.HOUR), 11 * self.HOUR, 99)]}
+        jobs = [
+            dispatch.Job(1, 9 * self.HOUR, int(9.5 * self.HOUR), '', 1, None, None),
+            dispatch.Job(2, int(9.25 * self.HOUR), 10 * self.HOUR, '', 1, None, None),
+        ]
+
+        result = dispatch.solve(jobs, vehicles, [100, 101], bookings)
+
+        self.assertEqual(result[1][0], 2)
+        self.assertEqual(result[2][0], 1)
+
+    def test_dispatch_endpoint_assigns_the_window(self):
+        admin = User.objects.create_superuser('admin', 'admin@test.com', 'password123', role='Amministratore')
+        client_user = User.objects.create_user(username='client', password='password123', role='Cliente')
+        operator = User.objects.create_user(username='operator', password='password123', role='Operatore')
+        vehicle = Vehicle.objects.create(service_class='Van', license_plate='DSP-1', capacity=8)
+        start = timezone.now().replace(year=2030, month=8, day=1, hour=8, minute=0, second=0, microsecond=0)
+        transfers = [
+            Transfer.objects.create(
+                client=client_user,
+                service_type='Transfer A-B',
+                start_location='A',
+                scheduled_start_time=start + timezone.timedelta(hours=hour),
+                passengers=passengers,
+            )
+            for hour, passengers in ((0, 2), (3, 12), (30, 2))
+        ]
+        self.client.force_authenticate(user=admin)
+
+        response = self.client.post('/api/transfers/dispatch/', {'from': start.isoformat(), 'to': (start + timezone.timedelta(days=1)).isoformat()})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['assigned'], [transfers[0].pk, transfers[1].pk])
+        self.assertEqual(response.data['unassigned'], [transfers[1].pk])
+        first, too_big, outside = (Transfer.objects.get(pk=transfer.pk) for transfer in transfers)
+        self.assertEqual((first.vehicle, first.operator), (vehicle, operator))
+        self.assertEqual((too_big.vehicle, too_big.operator), (None, operator))
+        self.assertIsNone(outside.operator)
+        self.assertFalse(availability.is_free('vehicle', vehicle.pk, start, start + timezone.timedelta(minutes=30)))
+
+
+class ConditionalListTests(APITestCase):
+    def setUp(self):
+        self.client1 = User.objects.create_user(username='client1', password='password123', role='Cliente')
+        self.client2 = User.objects.create_user(username='client2', password='password123', role='Cliente')
+        self.start = timezone.now()
+
+    def new_transfer(self, client):
+        return Transfer.objects.create(client=client, service_type='Transfer A-B', start_location='A', scheduled_start_time=self.start)
+
+    def get(self, url, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get(url, **headers)
+
+    def test_unchanged_list_returns_304_without_queries(self):
+        self.new_transfer(self.client1)
+        self.client.force_authenticate(user=self.client1)
+        etag = self.get('/api/transfers/')['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.get('/api/transfers/', etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_etag_changes_only_for_the_affected_scope(self):
+        self.client.force_authenticate(user=self.client1)
+        etag = self.get('/api/transfers/')['ETag']
+
+        # Another client's transfers don't affect this list
+        self.new_transfer(self.client2)
+        self.assertEqual(self.get('/api/transfers/', etag).status_code, status.HTTP_304_NOT_MODIFIED)
+
+        transfer = self.new_transfer(self.client1)
+        response = self.get('/api/transfers/', etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['id'], transfer.id)
+
+    def test_global_lists_follow_their_model(self):
+        self.client.force_authenticate(user=self.client1)
+        etag = self.get('/api/vehicles/')['ETag']
+        self.assertEqual(self.get('/api/vehicles/', etag).status_code, status.HTTP_304_NOT_MODIFIED)
+
+        Vehicle.objects.create(service_class='Auto', license_plate='ETAG-1', capacity=4)
+        self.assertEqual(self.get('/api/vehicles/', etag).status_code, status.HTTP_200_OK)
+
+    def test_transfer_list_follows_the_vehicle_names(self):
+        vehicle = Vehicle.objects.create(service_class='Van', license_plate='P-1', capacity=8)
+        Transfer.objects.create(client=self.client1, vehicle=vehicle, service_type='Transfer A-B', start_location='A', scheduled_start_time=self.start)
+        self.client.force_authenticate(user=self.client1)
+        etag = self.get('/api/transfers/')['ETag']
+
+        vehicle.license_plate = 'P-2'
+        vehicle.save()
+        response = self.get('/api/transfers/', etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['vehicle'], 'Van - P-2')
+
+    def test_rollup_list_follows_saved_rollups(self):
+        rollup = DailyRollup.objects.create(date=self.start.date(), count=1, total_value=Decimal('10.00'))
+        self.client.force_authenticate(user=self.client1)
+        etag = self.get('/api/rollups/')['ETag']
+
+        rollup.total_value = Decimal('90.00')
+        rollup.save()
+        self.assertEqual(self.get('/api/rollups/', etag).status_code, status.HTTP_200_OK)
+
+
+class ResponseCacheTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='client', password='password123', role='Cliente')
+        self.vehicle = Vehicle.objects.create(service_class='Auto', license_plate='CACHE-1', capacity=4)
+        self.other = Vehicle.objects.create(service_class='Van', license_plate='CACHE-2', capacity=8)
+        self.client.force_authenticate(user=self.user)
+
+    def test_reads_are_served_from_the_cache(self):
+        self.client.get('/api/vehicles/')
+        self.client.get(f'/api/vehicles/{self.vehicle.pk}/')
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/vehicles/')
+        self.assertEqual(len(response.data['results']), 2)
+        with self.assertNumQueries(0):
+            response = self.client.get(f'/api/vehicles/{self.vehicle.pk}/')
+        self.assertEqual(response.data['license_plate'], 'CACHE-1')
+
+        # Query parameters are part of the key
+        with self.assertNumQueries(1):
+            self.client.get('/api/vehicles/', {'ordering': 'capacity'})
+
+    def test_writes_invalidate_only_what_they_touch(self):
+        self.client.get('/api/prices/')
+        self.client.get(f'/api/vehicles/{self.vehicle.pk}/')
+        self.client.get(f'/api/vehicles/{self.other.pk}/')
+
+        response = self.client.patch(f'/api/vehicles/{self.vehicle.pk}/', {'capacity': 5})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.assertEqual(self.client.get(f'/api/vehicles/{self.vehicle.pk}/').data['capacity'], 5)
+        with self.assertNumQueries(0):
+            self.client.get(f'/api/vehicles/{self.other.pk}/')
+            self.client.get('/api/prices/')
+
+        self.client.delete(f'/api/vehicles/{self.vehicle.pk}/')
+        self.assertEqual(self.client.get(f'/api/vehicles/{self.vehicle.pk}/').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(len(self.client.get('/api/vehicles/').data['results']), 1)
+
+
+class TokenAuthenticationTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='client', password='password123', role='Cliente')
+        response = self.client.post('/api/api-token-auth/', {'username': 'client', 'password': 'password123'})
+        self.key = response.data['token']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.key}')
+
+    def test_token_lookup_is_cached(self):
+        self.assertEqual(self.client.get('/api/current-user/').status_code, status.HTTP_200_OK)
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/current-user/')
+        self.assertEqual(response.data['username'], 'client')
+
+    def test_logout_revokes_the_cached_token(self):
+        self.client.get('/api/current-user/')
+        self.assertEqual(self.client.post('/api/logout/').status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.client.get('/api/current-user/').status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_password_change_revokes_the_token(self):
+        self.client.get('/api/current-user/')
+        self.user.set_password('new-password')
+        self.user.save()
+        self.assertEqual(self.client.get('/api/current-user/').status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_user_changes_apply_to_the_next_request(self):
+        self.client.get('/api/current-user/')
+        self.user.role = 'Amministratore'
+        self.user.save()
+        self.assertEqual(self.client.get('/api/current-user/').data['role'], 'Amministratore')
+
+    def test_expired_token_is_refused_and_replaced_on_login(self):
+        Token.objects.filter(key=self.key).update(created=timezone.now() - timezone.timedelta(days=31))
+        self.assertEqual(self.client.get('/api/current-user/').status_code, status.HTTP_401_UNAUTHORIZED)
+
+        response = self.client.post('/api/api-token-auth/', {'username': 'client', 'password': 'password123'})
+        self.assertNotEqual(response.data['token'], self.key)
+
+
+class BootstrapTests(APITestCase):
+    def setUp(self):
+        self.client_user = User.objects.create_user(username='client', password='password123', role='Cliente')
+        self.operator = User.objects.create_user(username='operator', password='password123', role='Operatore')
+        self.vehicle = Vehicle.objects.create(service_class='Van', license_plate='BOOT-1', capacity=8)
+        for hours in (1, 2, 3):
+            Transfer.objects.create(
+                client=self.client_user, operator=self.operator, service_type='Transfer A-B',
+                start_location='A', end_location='B',
+                scheduled_start_time=timezone.now() + timezone.timedelta(hours=hours),
+                service_value=Decimal('10.00'), service_cost=Decimal('5.00'),
+            )
+        ServiceRequest.objects.create(requester=self.client_user, start_location='A', end_location='B', requested_datetime=timezone.now())
+
+    def test_sections_follow_the_dashboard_of_the_role(self):
+        self.client.force_authenticate(user=self.client_user)
+        response = self.client.get('/api/bootstrap/')
+        self.assertEqual(response.data['user']['username'], 'client')
+        self.assertEqual(set(response.data), {'user', 'requests'})
+        self.assertEqual(response.data['requests'], self.client.get('/api/requests/').data)
+
+        self.client.force_authenticate(user=self.operator)
+        response = self.client.get('/api/bootstrap/')
+        self.assertEqual(set(response.data), {'user', 'transfers'})
+        self.assertEqual(len(response.data['transfers']['results']), 3)
+
+    def test_next_links_continue_on_the_list_endpoints(self):
+        self.client.force_authenticate(user=self.operator)
+        response = self.client.get('/api/bootstrap/', {'page_size': 2})
+        self.assertEqual(len(response.data['transfers']['results']), 2)
+        self.assertIn('/api/transfers/', response.data['transfers']['next'])
+        next_page = self.client.get(response.data['transfers']['next'])
+        self.assertEqual(len(next_page.data['results']), 1)
+
+        admin = User.objects.create_superuser('admin', 'admin@test.com', 'password123', role='Amministratore')
+        Vehicle.objects.create(service_class='Auto', license_plate='BOOT-2', capacity=4)
+        self.client.force_authenticate(user=admin)
+        response = self.client.get('/api/bootstrap/', {'page_size': 1})
+        self.assertEqual(set(response.data), {'user', 'vehicles'})
+        self.assertEqual([vehicle['id'] for vehicle in response.data['vehicles']['results']], [self.vehicle.pk])
+        self.assertIn('/api/vehicles/', response.data['vehicles']['next'])
+        next_page = self.client.get(response.data['vehicles']['next'])
+        self.assertEqual(len(next_page.data['results']), 1)
+        self.assertIsNone(next_page.data['next'])
+
+
+class SyntheticDataTests(TestCase):
+    def test_generates_a_consistent_dataset(self):
+        call_command(
+            'generate_synthetic_data', clients=3, end_users=2, operators=2, vehicles=4,
+            transfers=120, requests=30, days=10, batch_size=50, stdout=StringIO(),
+        )
+        self.assertEqual(User.objects.filter(role='Cliente').count(), 3)
+        self.assertEqual(User.objects.filter(role='Utilizzatore').count(), 6)
+        self.assertEqual(Transfer.objects.count(), 120)
+        self.assertEqual(ServiceRequest.objects.count(), 30)
+        self.assertEqual(PriceList.objects.count(), 8)
+
+        # The rollups are filled in even though bulk_create skips save()
+        completed = Transfer.objects.filter(status='Completato')
+        self.assertEqual(sum(DailyRollup.objects.values_list('count', flat=True)), completed.count())
+        self.assertEqual(
+            sum(DailyRollup.objects.values_list('total_value', flat=True)),
+            sum(completed.values_list('service_value', flat=True)),
+        )
+
+        with self.assertRaises(CommandError):
+            call_command('generate_synthetic_data', clients=1, transfers=1, requests=1, stdout=StringIO())
+
+
+class RequestMetricsTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.registry.reset()
+        self.admin = User.objects.create_superuser('admin', 'admin@test.com', 'password123', role='Amministratore')
+        Vehicle.objects.create(service_class='Auto', license_plate='MET-1', capacity=4)
+        self.client.force_authenticate(user=self.admin)
+
+    def test_server_timing_header(self):
+        response = self.client.get('/api/vehicles/')
+        timing = response['Server-Timing']
+        self.assertIn('db;dur=', timing)
+        self.assertIn('desc="1 queries"', timing)
+        self.assertIn('serialize;dur=', timing)
+        self.assertIn('total;dur=', timing)
+
+    def test_metrics_endpoint_aggregates_per_route(self):
+        self.client.get('/api/vehicles/')
+        self.client.get('/api/vehicles/')
+        self.assertEqual(self.client.get('/metrics').status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_login(self.admin)
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn('transfers_request_duration_seconds_count{route="vehicle-list",method="GET",status="200"} 2', body)
+        self.assertIn('transfers_request_queries_bucket{route="vehicle-list",method="GET",le="1"} 2', body)
+        self.assertIn('# TYPE transfers_response_size_bytes histogram', body)
+
+    @override_settings(METRICS_TOKEN='scrape-secret')
+    def test_metrics_endpoint_accepts_the_scrape_token(self):
+        self.client.force_authenticate(user=None)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-secret').status_code, status.HTTP_200_OK)
+
+
+@override_settings(SLOW_QUERY_THRESHOLD_MS=0)
+class SlowQueryLogTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser('admin', 'admin@test.com', 'password123', role='Amministratore')
+        Vehicle.objects.create(service_class='Auto', license_plate='SLOW-1', capacity=4)
+        slowlog.clear()
+
+    def test_fingerprint_ignores_literal_values(self):
+        first = slowlog.normalize("SELECT * FROM t WHERE id IN (1, 2, 3) AND code = 'x'")
+        second = slowlog.normalize("SELECT *  FROM t WHERE id IN (7) AND code = 'it''s'")
+        self.assertEqual(first, 'SELECT * FROM t WHERE id IN (...) AND code = ?')
+        self.assertEqual(slowlog.fingerprint(first), slowlog.fingerprint(second))
+
+    def test_slow_statements_are_logged_with_their_plan(self):
+        self.client.force_authenticate(user=self.admin)
+        self.client.get('/api/vehicles/')
+        self.client.get('/api/vehicles/', {'ordering': 'capacity'})
+
+        vehicles = [offender for offender in slowlog.top_offenders(50) if 'transfers_vehicle' in offender['sql']]
+        self.assertEqual(len(vehicles), 1)
+        self.assertEqual(vehicles[0]['calls'], 2)
+        self.assertTrue(vehicles[0]['plan'])
+        self.assertTrue(any(site.startswith('transfers/') for site in vehicles[0]['call_sites']))
+
+        out = StringIO()
+        call_command('slow_queries', '--json', stdout=out)
+        self.assertIn(vehicles[0]['fingerprint'], out.getvalue())
+
+    def test_failed_statements_are_logged_without_explain(self):
+        self.assertTrue(slowlog.explain(connection, 'SELECT * FROM no_such_table', []).startswith('EXPLAIN failed'))
+        with self.assertRaises(DatabaseError):
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT * FROM no_such_table')
+        failed = [offender for offender in slowlog.top_offenders(50) if 'no_such_table' in offender['sql']]
+        self.assertEqual(len(failed), 1)
+        self.assertFalse(failed[0]['plan'])
+        # The transaction of the test is still usable
+        self.assertEqual(Vehicle.objects.count(), 1)
+
+    def test_admin_page(self):
+        Vehicle.objects.count()
+        self.client.force_login(self.admin)
+        response = self.client.get('/admin/slow-queries/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertContains(response, 'transfers_vehicle')
+
+
+class TransferEventsTests(TestCase):
+    def setUp(self):
+        self.client_user = User.objects.create_user(username='client', password='password123', role='Cliente')
+        self.operator = User.objects.create_user(username='operator', password='password123', role='Operatore')
+        self.transfer = Transfer.objects.create(
+            client=self.client_user, service_type='Transfer A-B', start_location='A', end_location='B',
+            scheduled_start_time=timezone.now(), service_value=Decimal('10.00'), service_cost=Decimal('5.00'),
+        )
+
+    def test_saves_publish_to_the_readers_after_commit(self):
+        transfer = Transfer.objects.get(pk=self.transfer.pk)
+        with mock.patch.object(events.get_broker(), 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                transfer.operator = self.operator
+                transfer.status = 'Confermato'
+                transfer.save()
+                publish.assert_not_called()
+
+        channels, event = publish.call_args.args
+        self.assertEqual(
+            set(channels),
+            {'transfers', f'transfers:client:{self.client_user.pk}', f'transfers:operator:{self.operator.pk}'},
+        )
+        self.assertEqual(event['event'], 'transfer.updated')
+        self.assertEqual(event['status'], 'Confermato')
+        self.assertEqual(event['changed'], ['operator', 'status'])
+
+    def test_string_datetimes_are_published(self):
+        with mock.patch.object(events.get_broker(), 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                transfer = Transfer.objects.create(
+                    client=self.client_user, service_type='Transfer A-B', start_location='A', end_location='B',
+                    scheduled_start_time='2031-01-01T10:00:00Z', service_value=Decimal('10.00'), service_cost=Decimal('5.00'),
+                )
+        event = publish.call_args.args[1]
+        self.assertEqual(event['id'], transfer.pk)
+        self.assertEqual(event['scheduled_start_time'], '2031-01-01T10:00:00+00:00')
+
+    def test_event_failures_dont_fail_the_save(self):
+        with mock.patch.object(events, 'transfer_event', side_effect=ValueError):
+            with self.assertLogs('transfers.events', 'ERROR'):
+                self.transfer.delete()
+        self.assertFalse(Transfer.objects.filter(pk=self.transfer.pk).exists())
+
+    @override_settings(EVENTS_QUEUE_SIZE=2)
+    async def test_slow_subscribers_are_told_to_resync(self):
+        broker = events.InProcessBroker()
+        subscription = broker.subscribe(['transfers'])
+        for n in range(3):
+            broker.publish(['transfers', 'other'], {'event': 'transfer.updated', 'id': n})
+        await asyncio.sleep(0)
+        self.assertEqual(await subscription.get(), events.RESYNC)
+        self.assertTrue(subscription.queue.empty())
+        broker.unsubscribe(subscription)
+        self.assertEqual(broker.subscriptions, {})
+
+    async def test_event_stream(self):
+        token = await sync_to_async(Token.objects.create)(user=self.client_user)
+        response = await self.async_client.post('/api/transfers/events/ticket/', headers={'Authorization': f'Token {token.key}'})
+        ticket = json.loads(response.content)['ticket']
+        response = await self.async_client.get('/api/transfers/events/', {'ticket': ticket})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b'retry: 5000\n\n')
+
+        events.get_broker().publish([f'transfers:client:{self.client_user.pk}'], {'event': 'transfer.updated', 'id': 1})
+        self.assertEqual(json.loads((await anext(stream)).decode().removeprefix('data: ')), {'event': 'transfer.updated', 'id': 1})
+        await stream.aclose()
+
+        # Tickets are single-use, and API tokens aren't accepted in the URL
+        response = await self.async_client.get('/api/transfers/events/', {'ticket': ticket})
+        self.assertEqual(response.status_code, 401)
+        response = await self.async_client.get('/api/transfers/events/', {'token': token.key})
+        self.assertEqual(response.status_code, 401)
+
+
+@override_settings(SYNC_SAFETY_LAG_SECONDS=0)
+class DeltaSyncTests(APITestCase):
+    def setUp(self):
+        self.client_user = User.objects.create_user(username='client', password='password123', role='Cliente')
+        self.other_client = User.objects.create_user(username='other', password='password123', role='Cliente')
+        self.transfers = [
+            Transfer.objects.create(
+                client=self.client_user, service_type='Transfer A-B', start_location='A', end_location='B',
+                scheduled_start_time=timezone.now() + timezone.timedelta(hours=hours),
+                service_value=Decimal('10.00'), service_cost=Decimal('5.00'),
+            )
+            for hours in (1, 2, 3)
+        ]
+        self.client.force_authenticate(user=self.client_user)
+
+    def test_only_changes_after_the_watermark_are_sent(self):
+        response = self.client.get('/api/transfers/sync/')
+        self.assertEqual([row['id'] for row in response.data['changed']], [transfer.pk for transfer in self.transfers])
+        self.assertFalse(response.data['has_more'])
+        watermark = response.data['watermark']
+
+        transfer = Transfer.objects.get(pk=self.transfers[1].pk)
+        transfer.passengers = 3
+        transfer.save()
+        self.assertGreater(Transfer.objects.get(pk=transfer.pk).updated_at, self.transfers[1].updated_at)
+
+        response = self.client.get('/api/transfers/sync/', {'since': watermark})
+        self.assertEqual([row['id'] for row in response.data['changed']], [transfer.pk])
+        self.assertEqual(response.data['deleted'], [])
+        response = self.client.get('/api/transfers/sync/', {'since': response.data['watermark']})
+        self.assertEqual(response.data['changed'], [])
+
+    def test_pages_resume_where_they_stopped(self):
+        with mock.patch('transfers.views.TransferViewSet.sync_page_size', 2):
+            response = self.client.get('/api/transfers/sync/')
+            self.assertTrue(response.data['has_more'])
+            self.assertEqual(len(response.data['changed']), 2)
+            response = self.client.get('/api/transfers/sync/', {'since': response.data['watermark']})
+        self.assertFalse(response.data['has_more'])
+        self.assertEqual([row['id'] for row in response.data['changed']], [self.transfers[2].pk])
+
+    def test_deleted_and_reassigned_rows_are_reported(self):
+        watermark = self.client.get('/api/transfers/sync/').data['watermark']
+        deleted_id = self.transfers[0].pk
+        self.transfers[0].delete()
+        moved = Transfer.objects.get(pk=self.transfers[1].pk)
+        moved.client = self.other_client
+        moved.save()
+
+        response = self.client.get('/api/transfers/sync/', {'since': watermark})
+        self.assertEqual(response.data['changed'], [])
+        self.assertEqual(response.data['deleted'], [deleted_id, moved.pk])
+        response = self.client.get('/api/transfers/sync/', {'since': response.data['watermark']})
+        self.assertEqual(response.data['deleted'], [])
+
+        self.client.force_authenticate(user=self.other_client)
+        response = self.client.get('/api/transfers/sync/', {'since': watermark})
+        self.assertEqual([row['id'] for row in response.data['changed']], [moved.pk])
+
+    @override_settings(SYNC_SAFETY_LAG_SECONDS=60)
+    def test_changes_newer_than_the_safety_lag_wait(self):
+        # Stamped but maybe not committed yet: not served, and not skipped by the watermark
+        response = self.client.get('/api/transfers/sync/')
+        self.assertEqual(response.data['changed'], [])
+        moment, _ = DeltaSyncMixin.decode_watermark(response.data['watermark'])
+        self.assertLess(moment, self.transfers[0].updated_at)
+
+        later = timezone.now() + timezone.timedelta(minutes=2)
+        with mock.patch('transfers.mixins.timezone.now', return_value=later):
+            response = self.client.get('/api/transfers/sync/', {'since': response.data['watermark']})
+        self.assertEqual(len(response.data['changed']), 3)
+
+    def test_default_tombstones_follow_the_model(self):
+        view = DeltaSyncMixin()
+        view.get_queryset = ServiceRequest.objects.all
+        Tombstone.objects.create(model_name='servicerequest', object_id=1)
+        Tombstone.objects.create(model_name='transfer', object_id=2)
+        self.assertEqual(list(view.get_tombstones().values_list('object_id', flat=True)), [1])
+
+    def test_old_or_bad_watermarks_are_refused(self):
+        response = self.client.get('/api/transfers/sync/', {'since': 'nonsense'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        old = DeltaSyncMixin.encode_watermark(timezone.now() - timezone.timedelta(days=31), 0)
+        response = self.client.get('/api/transfers/sync/', {'since': old})
+        self.assertEqual(response.status_code, status.HTTP_410_GONE)
+
+    def test_request_deletions_reach_the_requester(self):
+        service_request = ServiceRequest.objects.create(requester=self.client_user, start_location='A', end_location='B', requested_datetime=timezone.now())
+        request_id = service_request.pk
+        watermark = self.client.get('/api/requests/sync/').data['watermark']
+        service_request.delete()
+        response = self.client.get('/api/requests/sync/', {'since': watermark})
+        self.assertEqual(response.data['deleted'], [request_id])
+
+        call_command('prune_tombstones', days=0, stdout=StringIO())
+        self.assertFalse(Tombstone.objects.exists())
+
+
+class TransferSearchTests(APITestCase):
+    def setUp(self):
+        self.client_user = User.objects.create_user(username='client', password='password123', role='Cliente')
+        self.other_client = User.objects.create_user(username='other', password='password123', role='Cliente')
+        self.admin = User.objects.create_user(username='admin', password='password123', role='Amministratore')
+
+        def create(client, start, end, notes=''):
+            return Transfer.objects.create(
+                client=client, service_type='Transfer A-B', start_location=start, end_location=end, notes=notes,
+                scheduled_start_time=timezone.now(), service_value=Decimal('10.00'), service_cost=Decimal('5.00'),
+            )
+        self.airport = create(self.client_user, 'Aeroporto Fiumicino', 'Hotel Città')
+        self.noted = create(self.client_user, 'Roma Termini', 'Colosseo', notes='Prelevare in aeroporto il bagaglio')
+        self.foreign = create(self.other_client, 'Aeroporto Fiumicino', 'Vaticano')
+
+    def test_prefix_matches_are_ranked_and_scoped(self):
+        self.client.force_authenticate(user=self.client_user)
+        response = self.client.get('/api/transfers/search/', {'q': 'aeropor'})
+        # Locations weigh more than notes; other clients' transfers stay hidden
+        self.assertEqual([row['id'] for row in response.data['results']], [self.airport.pk, self.noted.pk])
+        self.assertGreater(response.data['results'][0]['rank'], response.data['results'][1]['rank'])
+
+        response = self.client.get('/api/transfers/search/', {'q': 'fium aer'})
+        self.assertEqual([row['id'] for row in response.data['results']], [self.airport.pk])
+        response = self.client.get('/api/transfers/search/', {'q': 'citta'})
+        self.assertEqual([row['id'] for row in response.data['results']], [self.airport.pk])
+
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.get('/api/transfers/search/', {'q': 'fiumicino', 'limit': 1})
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_index_follows_writes(self):
+        self.noted.notes = ''
+        self.noted.save()
+        self.airport.delete()
+        Transfer.objects.filter(pk=self.foreign.pk).update(start_location='Ciampino')
+        self.assertEqual(search.search(Transfer.objects.all(), 'aeroporto'), [])
+        self.assertEqual(search.search(Transfer.objects.all(), 'ciamp'), [Transfer.objects.get(pk=self.foreign.pk)])
+
+    def test_bad_queries(self):
+        self.client.force_authenticate(user=self.client_user)
+        self.assertEqual(self.client.get('/api/transfers/search/', {'q': 'a'}).status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get('/api/transfers/search/', {'q': '"AND (* OR'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], [])
+
+
+class ServiceRequestApprovalTests(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(username='admin', password='password123', role='Amministratore')
+        self.client_user = User.objects.create_user(username='client', password='password123', role='Cliente')
+        self.other_client = User.objects.create_user(username='other', password='password123', role='Cliente')
+        self.end_user = User.objects.create_user(username='enduser', password='password123', role='Utilizzatore', associated_client=self.client_user)
+        self.requests = [
+            ServiceRequest.objects.create(requester=self.end_user, start_location='A', end_location='B', requested_datetime=timezone.now())
+            for _ in range(3)
+        ]
+
+    def test_both_approvals_are_needed(self):
+        service_request = self.requests[0]
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.post(f'/api/requests/{service_request.pk}/approve/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        service_request.refresh_from_db()
+        self.assertEqual((service_request.admin_approved, service_request.status), (True, 'In Attesa'))
+
+        self.client.force_authenticate(user=self.other_client)
+        response = self.client.post(f'/api/requests/{service_request.pk}/approve/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        self.client.force_authenticate(user=self.client_user)
+        response = self.client.post(f'/api/requests/{service_request.pk}/approve/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        service_request.refresh_from_db()
+        self.assertEqual((service_request.client_approved, service_request.status), (True, 'Approvato'))
+        response = self.client.post(f'/api/requests/{service_request.pk}/approve/')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    def test_status_and_approvals_cant_be_written_directly(self):
+        self.client.force_authenticate(user=self.end_user)
+        response = self.client.post('/api/requests/', {
+            'start_location': 'A', 'end_location': 'B', 'requested_datetime': '2031-01-01T10:00:00Z',
+            'status': 'Approvato', 'client_approved': True, 'admin_approved': True,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        created = ServiceRequest.objects.get(pk=response.data['id'])
+        self.assertEqual((created.status, created.client_approved, created.admin_approved), ('In Attesa', False, False))
+
+        response = self.client.patch(f'/api/requests/{self.requests[0].pk}/', {
+            'status': 'Approvato', 'client_approved': True, 'admin_approved': True,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        service_request = ServiceRequest.objects.get(pk=self.requests[0].pk)
+        self.assertEqual((service_request.status, service_request.client_approved, service_request.admin_approved), ('In Attesa', False, False))
+        self.assertEqual(conversion.convert_approved()['created'], [])
+
+    def test_status_is_derived_from_the_stored_flags(self):
+        service_request = self.requests[0]
+        # The client approves while the admin's request is in flight
+        ServiceRequest.objects.filter(pk=service_request.pk).update(client_approved=True)
+        self.assertEqual(approvals.approve(self.admin, [service_request.pk]), [service_request.pk])
+        service_request.refresh_from_db()
+        self.assertEqual(service_request.status, 'Approvato')
+        self.assertTrue(service_request.client_approved)
+        self.assertIsNone(approvals.approve(self.end_user, [service_request.pk]))
+
+    def test_bulk_decisions_follow_the_permission_rules(self):
+        foreign = ServiceRequest.objects.create(requester=self.other_client, start_location='A', end_location='B', requested_datetime=timezone.now())
+        ids = [service_request.pk for service_request in self.requests]
+        self.client.force_authenticate(user=self.client_user)
+        response = self.client.post('/api/requests/reject/', {'ids': [ids[0], foreign.pk, 999999]}, format='json')
+        self.assertEqual(response.data, {'updated': [ids[0]], 'skipped': sorted([foreign.pk, 999999])})
+        self.assertEqual(ServiceRequest.objects.get(pk=foreign.pk).status, 'In Attesa')
+
+        response = self.client.post('/api/requests/approve/', {'ids': ids}, format='json')
+        self.assertEqual(response.data['updated'], ids[1:])
+        self.assertEqual(
+            list(ServiceRequest.objects.filter(pk__in=ids).order_by('pk').values_list('status', 'client_approved')),
+            [('Rifiutato', False), ('In Attesa', True), ('In Attesa', True)],
+        )
+
+        self.client.force_authenticate(user=self.end_user)
+        response = self.client.post('/api/requests/approve/', {'ids': ids}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.post('/api/requests/approve/', {'ids': 'all'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_approval_runs_a_fixed_number_of_queries(self):
+        many = ServiceRequest.objects.bulk_create(
+            ServiceRequest(requester=self.end_user, start_location='A', end_location='B', requested_datetime=timezone.now())
+            for _ in range(50)
+        )
+        with CaptureQueriesContext(connection) as few_queries:
+            approvals.approve(self.admin, [service_request.pk for service_request in self.requests])
+        with CaptureQueriesContext(connection) as many_queries:
+            updated = approvals.approve(self.admin, [service_request.pk for service_request in many])
+        self.assertEqual(len(updated), 50)
+        self.assertEqual(len(many_queries), len(few_queries))
+
+
+class ServiceRequestConversionTests(APITestCase):
+    def setUp(self):
+        PriceList.objects.create(service_class='Van', service_type='Transfer A-B', price_per_km=Decimal('2.00'), operator_rate=Decimal('30.00'))
+        self.admin = User.objects.create_user(username='admin', password='password123', role='Amministratore')
+        self.client_user = User.objects.create_user(username='client', password='password123', role='Cliente')
+        self.end_user = User.objects.create_user(username='enduser', password='password123', role='Utilizzatore', associated_client=self.client_user)
+        self.orphan = User.objects.create_user(username='orphan', password='password123', role='Utilizzatore')
+
+        def create(requester, status='Approvato'):
+            return ServiceRequest.objects.create(
+                requester=requester, start_location='A', end_location='B', requested_datetime=timezone.now(),
+                requested_service_class='Van', passengers=5, status=status,
+            )
+        self.by_end_user = create(self.end_user)
+        self.by_client = create(self.client_user)
+        self.pending = create(self.end_user, status='In Attesa')
+        self.unresolved = create(self.orphan)
+
+    def test_approved_requests_become_priced_transfers_once(self):
+        result = conversion.convert_approved(batch_size=1)
+        self.assertEqual(len(result['created']), 2)
+        self.assertEqual(result['unconverted'], 1)
+
+        transfer = Transfer.objects.get(service_request=self.by_end_user)
+        self.assertEqual((transfer.client, transfer.end_user, transfer.status), (self.client_user, self.end_user, 'Richiesto'))
+        self.assertEqual((transfer.requested_service_class, transfer.passengers), ('Van', 5))
+        # 25.00 + 2.00 * 15 km
+        self.assertEqual((transfer.service_value, transfer.service_cost), (Decimal('55.00'), Decimal('30.00')))
+        self.assertEqual(Transfer.objects.get(service_request=self.by_client).end_user, None)
+
+        self.assertEqual(conversion.convert_approved()['created'], [])
+        self.assertEqual(Transfer.objects.count(), 2)
+
+    def test_api_action_and_command(self):
+        self.client.force_authenticate(user=self.client_user)
+        self.assertEqual(self.client.post('/api/requests/convert/').status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.post('/api/requests/convert/')
+        self.assertEqual(len(response.data['created']), 2)
+        response = self.client.get(f'/api/requests/{self.by_client.pk}/')
+        self.assertEqual(response.data['transfer'], Transfer.objects.get(service_request=self.by_client).pk)
+
+        ServiceRequest.objects.filter(pk=self.pending.pk).update(status='Approvato')
+        out = StringIO()
+        call_command('convert_requests', stdout=out)
+        self.assertIn('Created 1 transfers.', out.getvalue())
+        self.assertTrue(Transfer.objects.filter(service_request=self.pending).exists())
+
+    def test_batches_run_a_fixed_number_of_queries(self):
+        conversion.convert_approved()
+        ServiceRequest.objects.bulk_create(
+            ServiceRequest(requester=self.end_user, start_location='A', end_location='B', requested_datetime=timezone.now(), status='Approvato')
+            for _ in range(40)
+        )
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(len(conversion.convert_approved()['created']), 40)
+        self.assertLess(len(queries), 15)
@@ -7,12 +7,18 @@ router = DefaultRouter()
 router.register(r'users', views.UserViewSet)
 router.register(r'vehicles', views.VehicleViewSet)
 router.register(r'prices', views.PriceListViewSet)
-router.register(r'transfers', views.TransferViewSet)
-router.register(r'requests', views.ServiceRequestViewSet)
+router.register(r'transfers', views.TransferViewSet, basename='transfer')
+router.register(r'requests', views.ServiceRequestViewSet, basename='servicerequest')
 router.register(r'reports', views.DailyReportViewSet)
+router.register(r'rollups', views.DailyRollupViewSet)
 
 # The API URLs are now determined automatically by the router.
 urlpatterns = [
     path('current-user/', views.current_user_view),
+    path('bootstrap/', views.bootstrap_view),
+    path('logout/', views.logout_view),
+    # Before the router, whose transfers/<pk>/ route would match it
+    path('transfers/events/', views.transfer_events_view),
+    path('transfers/events/ticket/', views.transfer_events_ticket_view),
     path('', include(router.urls)),
 ]
@@ -0,0 +1,64 @@
+"""
+Version stamps of the data behind each list endpoint.
+
+A scope names a set of rows whose change must be visible to some readers:
+'vehicles' or 'prices' for global lists, 'transfers:client:<id>' for the
+transfers of one client, and so on. Every save or delete bumps the stamps of
+the scopes it touches; readers combine the stamps of the scopes they depend
+on into an ETag, so an unchanged list can be answered with a cache lookup.
+Stamps live in Django's cache, shared by every worker when the cache is.
+"""
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+
+CACHE_PREFIX = 'transfers:version:'
+
+
+def get_versions(scopes):
+    """
+    Return the current stamp of each scope, in order.
+    """
+    keys = [CACHE_PREFIX + scope for scope in scopes]
+    found = cache.get_many(keys)
+    missing = {key: uuid.uuid4().hex for key in keys if key not in found}
+    if missing:
+        # add() keeps a stamp set concurrently by another worker
+        for key, version in missing.items():
+            cache.add(key, version, None)
+        found.update(cache.get_many(list(missing)))
+    return [found.get(key) or missing.get(key) for key in keys]
+
+
+def bump(scopes):
+    """
+    Change the stamp of the given scopes, now and again once the current
+    transaction commits, so readers can't keep a pre-commit result.
+    """
+    keys = {CACHE_PREFIX + scope for scope in scopes if scope}
+
+    def set_new_versions():
+        cache.set_many({key: uuid.uuid4().hex for key in keys}, None)
+
+    if keys:
+        set_new_versions()
+        transaction.on_commit(set_new_versions)
+
+
+def transfer_scopes(client_ids=(), operator_ids=()):
+    """
+    Scopes to bump when transfers of these clients and operators change.
+    """
+    return (
+        ['transfers']
+        + [f'transfers:client:{client_id}' for client_id in set(client_ids) if client_id]
+        + [f'transfers:operator:{operator_id}' for operator_id in set(operator_ids) if operator_id]
+    )
+
+
+def request_scopes(requester_ids=()):
+    """
+    Scopes to bump when service requests of these requesters change.
+    """
+    return ['requests'] + [f'requests:requester:{requester_id}' for requester_id in set(requester_ids) if requester_id]
@@ -1,49 +1,82 @@
+import asyncio
+import hmac
+import json
+import secrets
+from copy import copy
+from datetime import date, datetime, time, timedelta
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models import Prefetch
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from rest_framework import viewsets, permissions, status
-from rest_framework.decorators import action
+from rest_framework.authtoken.models import Token
+from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.decorators import action, api_view
+from rest_framework.exceptions import AuthenticationFailed, ValidationError
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
-from .models import User, Vehicle, PriceList, Transfer, ServiceRequest, DailyReport
+from rest_framework.reverse import reverse
+from . import approvals, availability, conversion, events, exporter, metrics, search
+from .authentication import CachedTokenAuthentication, is_expired
+from .dispatch import dispatch
+from .mixins import CachedResponseMixin, ConditionalListMixin, DeltaSyncMixin
+from .importer import guess_format, import_transfers, iter_rows
+from .pagination import ServiceRequestCursorPagination, TransferCursorPagination, VehicleCursorPagination
+from .models import User, Vehicle, PriceList, Transfer, ServiceRequest, DailyReport, DailyRollup, Tombstone
 from .serializers import (
     UserSerializer,
     VehicleSerializer,
     PriceListSerializer,
     TransferSerializer,
     ServiceRequestSerializer,
-    DailyReportSerializer
+    DailyReportSerializer,
+    DailyRollupSerializer
 )
 
 # For now, we will use IsAuthenticated to protect all endpoints.
 # We can define more granular permissions later.
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(ConditionalListMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows users to be viewed or edited.
     """
+    version_scopes = ['users']
     queryset = User.objects.all().order_by('-date_joined')
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAdminUser] # Only admins can manage users directly
 
-class VehicleViewSet(viewsets.ModelViewSet):
+class VehicleViewSet(ConditionalListMixin, CachedResponseMixin, viewsets.ModelViewSet):
     """
-    API endpoint for vehicles.
+    API endpoint for vehicles. Reads are served from the response cache.
     """
+    version_scopes = ['vehicles']
     queryset = Vehicle.objects.all()
     serializer_class = VehicleSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = VehicleCursorPagination
 
-class PriceListViewSet(viewsets.ModelViewSet):
+class PriceListViewSet(ConditionalListMixin, CachedResponseMixin, viewsets.ModelViewSet):
     """
-    API endpoint for price lists.
+    API endpoint for price lists. Reads are served from the response cache.
     """
+    version_scopes = ['prices']
     queryset = PriceList.objects.all()
     serializer_class = PriceListSerializer
     permission_classes = [permissions.IsAuthenticated]
 
-class TransferViewSet(viewsets.ModelViewSet):
+class TransferViewSet(ConditionalListMixin, DeltaSyncMixin, viewsets.ModelViewSet):
     """
     API endpoint for transfers.
     """
     serializer_class = TransferSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = TransferCursorPagination
+    search_limit = 20
+    max_search_limit = 100
 
     def get_queryset(self):
         """
@@ -53,31 +86,222 @@ class TransferViewSet(viewsets.ModelViewSet):
         - Operators see their assigned transfers.
         """
         user = self.request.user
+        # Join everything the serializer reads so listing is a single query
+        transfers = Transfer.objects.select_related('client', 'operator', 'end_user', 'vehicle')
         if user.role == 'Amministratore':
-            return Transfer.objects.all()
+            return transfers.all()
         elif user.role == 'Cliente':
-            return Transfer.objects.filter(client=user)
+            return transfers.filter(client=user)
         elif user.role == 'Operatore':
-            return Transfer.objects.filter(operator=user)
+            return transfers.filter(operator=user)
         # Utilizzatori might not see any transfers directly, only their requests
         return Transfer.objects.none()
 
-class ServiceRequestViewSet(viewsets.ModelViewSet):
+    def get_version_scopes(self):
+        # Usernames and vehicle names are part of the representation, so their changes count too
+        user = self.request.user
+        if user.role == 'Amministratore':
+            return ['transfers', 'users', 'vehicles']
+        elif user.role == 'Cliente':
+            return [f'transfers:client:{user.pk}', 'users', 'vehicles']
+        elif user.role == 'Operatore':
+            return [f'transfers:operator:{user.pk}', 'users', 'vehicles']
+        return []
+
+    def get_tombstones(self):
+        # Scoped like get_queryset(); admins see every transfer, so only deletions
+        user = self.request.user
+        tombstones = Tombstone.objects.filter(model_name='transfer')
+        if user.role == 'Amministratore':
+            return tombstones.filter(reason='Eliminato')
+        elif user.role == 'Cliente':
+            return tombstones.filter(client_id=user.pk)
+        elif user.role == 'Operatore':
+            return tombstones.filter(operator_id=user.pk)
+        return Tombstone.objects.none()
+
+    def perform_update(self, serializer):
+        """
+        Reject schedule changes that would double-book the assigned vehicle or operator.
+        """
+        transfer = serializer.instance
+        if transfer.vehicle_id or transfer.operator_id:
+            updated = copy(transfer)
+            for field, value in serializer.validated_data.items():
+                setattr(updated, field, value)
+            conflicts = availability.transfer_conflicts(updated)
+            if conflicts:
+                raise ValidationError({'conflicts': conflicts})
+        serializer.save()
+
+    @action(detail=True, methods=['post'])
+    def assign(self, request, pk=None):
+        """
+        Assign a `vehicle` and/or an `operator` to a transfer (admins only),
+        refusing with 409 if either is already booked in the same time slot.
+        """
+        if request.user.role != 'Amministratore':
+            return Response({'status': 'permission denied'}, status=status.HTTP_403_FORBIDDEN)
+        transfer = self.get_object()
+
+        # Lock the vehicle and operator rows so concurrent assignments of the
+        # same resource are checked one after the other
+        with transaction.atomic():
+            errors = {}
+            vehicle = operator = None
+            if request.data.get('vehicle'):
+                vehicle = Vehicle.objects.select_for_update().filter(pk=request.data['vehicle']).first()
+                if vehicle is None:
+                    errors['vehicle'] = ['Veicolo non trovato.']
+            if request.data.get('operator'):
+                operator = User.objects.select_for_update().filter(pk=request.data['operator'], role='Operatore').first()
+                if operator is None:
+                    errors['operator'] = ['Operatore non trovato.']
+            if not (vehicle or operator or errors):
+                errors['non_field_errors'] = ['Indica un veicolo o un operatore.']
+            if errors:
+                return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+            conflicts = availability.transfer_conflicts(
+                transfer,
+                vehicle_id=vehicle.pk if vehicle else None,
+                operator_id=operator.pk if operator else None,
+            )
+            if conflicts:
+                return Response({'conflicts': conflicts}, status=status.HTTP_409_CONFLICT)
+
+            if vehicle:
+                transfer.vehicle = vehicle
+            if operator:
+                transfer.operator = operator
+            transfer.save()
+        return Response(self.get_serializer(transfer).data)
+
+    @action(detail=False, methods=['post'], url_path='dispatch')
+    def dispatch_batch(self, request):
+        """
+        Assign vehicles and operators to every unassigned 'Richiesto' transfer
+        scheduled between `from` and `to` (ISO datetimes, default: tomorrow).
+        With `dry_run` the proposed assignments are returned without saving them.
+        """
+        if request.user.role != 'Amministratore':
+            return Response({'status': 'permission denied'}, status=status.HTTP_403_FORBIDDEN)
+
+        tomorrow = timezone.make_aware(datetime.combine(timezone.localdate() + timedelta(days=1), time.min))
+        start = parse_datetime(str(request.data.get('from', ''))) or tomorrow
+        end = parse_datetime(str(request.data.get('to', ''))) or start + timedelta(days=1)
+        if timezone.is_naive(start):
+            start = timezone.make_aware(start)
+        if timezone.is_naive(end):
+            end = timezone.make_aware(end)
+        if start >= end:
+            return Response({'to': ['Deve essere successivo a from.']}, status=status.HTTP_400_BAD_REQUEST)
+
+        dry_run = str(request.data.get('dry_run', '')).lower() in ('1', 'true')
+        return Response(dispatch(start, end, dry_run=dry_run))
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Stream the transfers visible to the user as CSV or NDJSON (`?output=`).
+        Optional filters: `from` / `to` (scheduled day, YYYY-MM-DD) and `status`.
+        """
+        output = request.query_params.get('output', 'csv')
+        if output not in exporter.STREAMERS:
+            return Response({'output': ['Formato non supportato, usa csv o ndjson.']}, status=status.HTTP_400_BAD_REQUEST)
+
+        transfers = self.get_queryset()
+        try:
+            # Compare raw timestamps so the scheduled start time indexes are used
+            if request.query_params.get('from'):
+                day = date.fromisoformat(request.query_params['from'])
+                transfers = transfers.filter(scheduled_start_time__gte=timezone.make_aware(datetime.combine(day, time.min)))
+            if request.query_params.get('to'):
+                day = date.fromisoformat(request.query_params['to']) + timedelta(days=1)
+                transfers = transfers.filter(scheduled_start_time__lt=timezone.make_aware(datetime.combine(day, time.min)))
+        except ValueError:
+            return Response({'date': ['Usa il formato AAAA-MM-GG.']}, status=status.HTTP_400_BAD_REQUEST)
+        if request.query_params.getlist('status'):
+            transfers = transfers.filter(status__in=request.query_params.getlist('status'))
+
+        response = StreamingHttpResponse(exporter.STREAMERS[output](transfers), content_type=exporter.CONTENT_TYPES[output])
+        response['Content-Disposition'] = f'attachment; filename="transfers.{output}"'
+        return response
+
+    @action(detail=False, methods=['get'], url_path='search')
+    def text_search(self, request):
+        """
+        Transfers visible to the user whose locations, notes or deviations
+        match every word of `q` (as a prefix), best match first.
+        """
+        query = request.query_params.get('q', '').strip()
+        if len(query) < 2:
+            return Response({'q': ['Inserisci almeno 2 caratteri.']}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(max(int(request.query_params.get('limit', self.search_limit)), 1), self.max_search_limit)
+        except ValueError:
+            return Response({'limit': ['Deve essere un numero intero.']}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = search.search(self.get_queryset(), query, limit)
+        rows = self.get_serializer(results, many=True).data
+        for row, transfer in zip(rows, results):
+            row['rank'] = transfer.rank
+        return Response({'results': rows})
+
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser])
+    def bulk_import(self, request):
+        """
+        Create transfers in bulk from an uploaded CSV or NDJSON `file`.
+        Clients import transfers for themselves, admins name the client per row.
+        """
+        user = request.user
+        if user.role not in ('Amministratore', 'Cliente'):
+            return Response({'status': 'permission denied'}, status=status.HTTP_403_FORBIDDEN)
+
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'file': ['Nessun file caricato.']}, status=status.HTTP_400_BAD_REQUEST)
+        fmt = guess_format(upload.name)
+        if fmt is None:
+            return Response({'file': ['Formato non supportato, usa .csv o .ndjson.']}, status=status.HTTP_400_BAD_REQUEST)
+
+        result = import_transfers(
+            iter_rows(upload.file, fmt),
+            client=user if user.role == 'Cliente' else None,
+        )
+        return Response(result)
+
+class ServiceRequestViewSet(ConditionalListMixin, DeltaSyncMixin, viewsets.ModelViewSet):
     """
     API endpoint for service requests.
     """
     serializer_class = ServiceRequestSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = ServiceRequestCursorPagination
 
     def get_queryset(self):
         """
         This view should return a list of all the service requests
         for the currently authenticated user.
         """
+        user = self.request.user
+        service_requests = ServiceRequest.objects.select_related('requester', 'transfer')
+        if user.role == 'Amministratore':
+            return service_requests.all()
+        return service_requests.filter(requester=user)
+
+    def get_version_scopes(self):
         user = self.request.user
         if user.role == 'Amministratore':
-            return ServiceRequest.objects.all()
-        return ServiceRequest.objects.filter(requester=user)
+            return ['requests', 'users']
+        return [f'requests:requester:{user.pk}', 'users']
+
+    def get_tombstones(self):
+        user = self.request.user
+        tombstones = Tombstone.objects.filter(model_name='servicerequest')
+        if user.role == 'Amministratore':
+            return tombstones
+        return tombstones.filter(requester_id=user.pk)
 
     def perform_create(self, serializer):
         """
@@ -90,34 +314,77 @@ class ServiceRequestViewSet(viewsets.ModelViewSet):
         """
         Approve a service request. This can be done by an Admin or the associated Client.
         """
-        service_request = self.get_object()
-        user = request.user
+        try:
+            pk = int(pk)
+        except ValueError:
+            raise Http404
+        updated = approvals.approve(request.user, [pk])
+        if updated:
+            return Response({'status': 'approval status updated'})
+        if updated is not None and approvals.decidable(request.user).filter(pk=pk).exists():
+            return Response({'status': 'Richiesta non più in attesa.'}, status=status.HTTP_409_CONFLICT)
+        if updated is None or self.get_queryset().filter(pk=pk).exists():
+            return Response({'status': 'permission denied'}, status=status.HTTP_403_FORBIDDEN)
+        raise Http404
 
-        if user.role == 'Amministratore':
-            service_request.admin_approved = True
-        elif user.role == 'Cliente' and service_request.requester.associated_client == user:
-            service_request.client_approved = True
-        else:
+    def decide_batch(self, request, decide):
+        ids = request.data.get('ids')
+        if not isinstance(ids, list) or not ids or not all(isinstance(pk, int) for pk in ids):
+            return Response({'ids': ['Indica una lista di id.']}, status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) > approvals.MAX_BATCH:
+            return Response({'ids': [f'Al massimo {approvals.MAX_BATCH} id per volta.']}, status=status.HTTP_400_BAD_REQUEST)
+        updated = decide(request.user, ids)
+        if updated is None:
             return Response({'status': 'permission denied'}, status=status.HTTP_403_FORBIDDEN)
+        # Unknown, not decidable by the user or no longer pending
+        return Response({'updated': updated, 'skipped': sorted(set(ids) - set(updated))})
 
-        # If both have approved, update the main status
-        if service_request.admin_approved and service_request.client_approved:
-            service_request.status = 'Approvato'
+    @action(detail=False, methods=['post'], url_path='approve')
+    def bulk_approve(self, request):
+        """
+        Approve the pending requests `ids`, with the same rules as approve.
+        """
+        return self.decide_batch(request, approvals.approve)
 
-        service_request.save()
-        return Response({'status': 'approval status updated'})
+    @action(detail=False, methods=['post'], url_path='reject')
+    def bulk_reject(self, request):
+        """
+        Reject the pending requests `ids` (admins, or the associated client).
+        """
+        return self.decide_batch(request, approvals.reject)
 
-class DailyReportViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['post'])
+    def convert(self, request):
+        """
+        Create a priced transfer for every approved request that has none yet (admins only).
+        """
+        if request.user.role != 'Amministratore':
+            return Response({'status': 'permission denied'}, status=status.HTTP_403_FORBIDDEN)
+        return Response(conversion.convert_approved())
+
+class DailyReportViewSet(ConditionalListMixin, viewsets.ModelViewSet):
     """
     API endpoint for daily reports.
     """
-    queryset = DailyReport.objects.all()
+    version_scopes = ['reports']
+    queryset = DailyReport.objects.prefetch_related(
+        Prefetch('completed_transfers', queryset=Transfer.objects.only('id'))
+    )
     serializer_class = DailyReportSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+class DailyRollupViewSet(ConditionalListMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    API endpoint for the live per-day totals of completed transfers.
+    Today's figures are available at /rollups/<YYYY-MM-DD>/ before the nightly report.
+    """
+    queryset = DailyRollup.objects.order_by('-date')
+    serializer_class = DailyRollupSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    lookup_field = 'date'
+    version_scopes = ['rollups']
+    lookup_value_regex = r'\d{4}-\d{2}-\d{2}'
 
-from rest_framework.decorators import api_view
-from rest_framework.response import Response
 
 @api_view(['GET'])
 def current_user_view(request):
@@ -126,3 +393,158 @@ def current_user_view(request):
     """
     serializer = UserSerializer(request.user)
     return Response(serializer.data)
+
+
+# Lists preloaded by the bootstrap endpoint: the ones each role's dashboard renders
+BOOTSTRAP_SECTIONS = {
+    'Amministratore': {'vehicles': (VehicleViewSet, 'vehicle-list')},
+    'Cliente': {'requests': (ServiceRequestViewSet, 'servicerequest-list')},
+    'Operatore': {'transfers': (TransferViewSet, 'transfer-list')},
+    'Utilizzatore': {'requests': (ServiceRequestViewSet, 'servicerequest-list')},
+}
+
+
+def _first_page(viewset_class, route, request):
+    """
+    The first page of a list endpoint, as that endpoint returns it.
+    """
+    view = viewset_class(request=request, format_kwarg=None, action='list', kwargs={})
+    page = view.paginate_queryset(view.filter_queryset(view.get_queryset()))
+    # Continue on the list endpoint, not on this one
+    view.paginator.base_url = request.build_absolute_uri(reverse(route))
+    return view.get_paginated_response(view.get_serializer(page, many=True).data).data
+
+
+@api_view(['GET'])
+def bootstrap_view(request):
+    """
+    Return the current user and the first page of every list their dashboard
+    shows, so the frontend starts with a single request. Each section costs
+    one query.
+    """
+    data = {'user': UserSerializer(request.user).data}
+    for section, (viewset_class, route) in BOOTSTRAP_SECTIONS.get(request.user.role, {}).items():
+        data[section] = _first_page(viewset_class, route, request)
+    return Response(data)
+
+
+@api_view(['POST'])
+def logout_view(request):
+    """
+    Delete the token used for the request, revoking it immediately
+    """
+    if isinstance(request.auth, Token):
+        Token.objects.filter(key=request.auth.key).delete()
+    return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class ObtainExpiringAuthToken(ObtainAuthToken):
+    """
+    Same as DRF's obtain_auth_token, but an expired token is replaced with a new one
+    """
+    # A stale Authorization header must not prevent logging in again
+    authentication_classes = ()
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.serializer_class(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        user = serializer.validated_data['user']
+        token, created = Token.objects.get_or_create(user=user)
+        if not created and is_expired(token):
+            token.delete()
+            token = Token.objects.create(user=user)
+        return Response({'token': token.key})
+
+
+def metrics_view(request):
+    """
+    Per-route request histograms of this process, in the Prometheus text format.
+    Readable with `Authorization: Bearer <METRICS_TOKEN>` or by staff users.
+    """
+    token = settings.METRICS_TOKEN
+    authorization = request.headers.get('Authorization', '')
+    allowed = (
+        hmac.compare_digest(authorization, f'Bearer {token}') if token
+        else request.user.is_authenticated and request.user.is_staff
+    )
+    if not allowed:
+        return HttpResponse(status=403)
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+EVENTS_TICKET_PREFIX = 'transfers:events:ticket:'
+
+
+@api_view(['POST'])
+def transfer_events_ticket_view(request):
+    """
+    Issue a single-use ticket opening the event stream for the current user.
+    EventSource can't send headers, and a ticket in the URL is harmless in
+    the logs, unlike the API token.
+    """
+    ticket = secrets.token_urlsafe(32)
+    cache.set(f'{EVENTS_TICKET_PREFIX}{ticket}', request.user.pk, getattr(settings, 'EVENTS_TICKET_SECONDS', 60))
+    return Response({'ticket': ticket})
+
+
+async def _event_stream_user(request):
+    ticket = request.GET.get('ticket')
+    if ticket:
+        key = f'{EVENTS_TICKET_PREFIX}{ticket}'
+        user_id = await cache.aget(key)
+        # Whoever deletes the ticket first gets to use it
+        if user_id is None or not await cache.adelete(key):
+            return None
+        return await User.objects.filter(pk=user_id, is_active=True).afirst()
+    authorization = request.headers.get('Authorization', '')
+    if not authorization.startswith('Token '):
+        return await request.auser()
+    key = authorization[6:]
+    try:
+        user, _ = await sync_to_async(CachedTokenAuthentication().authenticate_credentials)(key)
+    except AuthenticationFailed:
+        return None
+    return user
+
+
+async def transfer_events_view(request):
+    """
+    Server-Sent Events stream of the changes to the transfers the user can see,
+    so the lists can be kept up to date without polling. Needs an ASGI server.
+    Each message is a JSON event: 'transfer.created', 'transfer.updated',
+    'transfer.deleted', or 'resync' when the list should be reloaded.
+    """
+    user = await _event_stream_user(request)
+    if user is None or not user.is_authenticated:
+        return HttpResponse(status=401)
+    if user.role == 'Amministratore':
+        channels = ['transfers']
+    elif user.role == 'Cliente':
+        channels = [f'transfers:client:{user.pk}']
+    elif user.role == 'Operatore':
+        channels = [f'transfers:operator:{user.pk}']
+    else:
+        return HttpResponse(status=403)
+
+    keepalive = getattr(settings, 'EVENTS_KEEPALIVE_SECONDS', 15)
+
+    async def stream():
+        broker = events.get_broker()
+        subscription = broker.subscribe(channels)
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.get(), keepalive)
+                except asyncio.TimeoutError:
+                    # Keeps proxies from closing an idle connection
+                    yield ': keepalive\n\n'
+                    continue
+                yield f'data: {json.dumps(event)}\n\n'
+        finally:
+            broker.unsubscribe(subscription)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response